@@ -1,10 +1,15 @@
+import argparse
+import json
+import sys
+import time
 import spacy
 from collections import defaultdict
-import textstat
-import enchant
+import readability_core
+from lexicon import default_lexicon_path
+from readability_core import score_to_grade_level
 
-nlp = spacy.load("en_core_web_sm")
-english_dict = enchant.Dict("en_US")  # Using PyEnchant to check for valid English words
+# analyze_sentence only needs part-of-speech tags, so skip the rest of the pipeline
+nlp = spacy.load("en_core_web_sm", disable=["parser", "ner", "lemmatizer"])
 
 def analyze_sentence(sentence):
     """
@@ -13,8 +18,15 @@ def analyze_sentence(sentence):
     :param sentence: The sentence to analyze
     :return: A dictionary categorizing words into nouns, verbs, pronouns, adjectives, and others
     """
-    doc = nlp(sentence)
+    return categorize_tokens(nlp(sentence))
+
+def categorize_tokens(doc):
+    """
+    Categorize the tokens of a processed sentence into parts of speech.
     
+    :param doc: A spaCy Doc
+    :return: A dictionary categorizing words into nouns, verbs, pronouns, adjectives, and others
+    """
     pos_dict = defaultdict(list)
     
     for token in doc:
@@ -52,35 +64,62 @@ def calculate_readability(sentence):
     :param sentence: The sentence to calculate readability for
     :return: Adjusted Dale-Chall readability score and the corresponding grade level
     """
-    # Tokenize sentence and check if words are valid English words
-    words = sentence.split()
-    valid_words = [word for word in words if english_dict.check(word)]
-    
-    if not valid_words:  # If all words are invalid, return lowest possible readability score
-        return 0, "4th Grade or below"
-    
-    # Recreate sentence with only valid words
-    valid_sentence = ' '.join(valid_words)
-    
-    # Calculate readability score on valid sentence
-    readability_score = textstat.dale_chall_readability_score(valid_sentence)
+    readability_score = readability_core.calculate_readability(sentence)
+    return readability_score, score_to_grade_level(readability_score)
+
+def read_sentences(stream):
+    """
+    Yields the non-empty lines of a text stream, one sentence per line.
     
-    if readability_score <= 4.9:
-        grade_level = "4th Grade or below"
-    elif readability_score <= 5.9:
-        grade_level = "5th - 6th Grade"
-    elif readability_score <= 6.9:
-        grade_level = "7th - 8th Grade"
-    elif readability_score <= 7.9:
-        grade_level = "9th - 10th Grade"
-    elif readability_score <= 8.9:
-        grade_level = "11th - 12th Grade"
-    else:
-        grade_level = "College Level"
+    :param stream: File object to read from
+    """
+    for line in stream:
+        line = line.strip()
+        if line:
+            yield line
+
+def analyze_stream(stream, output, batch_size=1000, n_process=1):
+    """
+    Analyze every line of a stream and write one JSON object per line.
+    Sentences are streamed through nlp.pipe in batches instead of one nlp() call each.
     
-    return readability_score, grade_level
+    :param stream: File object with one sentence per line
+    :param output: File object the JSON Lines results are written to
+    :param batch_size: Number of sentences spaCy processes per batch
+    :param n_process: Number of spaCy worker processes
+    :return: Number of sentences analyzed
+    """
+    count = 0
+    docs = nlp.pipe(((sentence, sentence) for sentence in read_sentences(stream)),
+                    as_tuples=True, batch_size=batch_size, n_process=n_process)
+    for doc, sentence in docs:
+        readability_score, grade_level = calculate_readability(sentence)
+        output.write(json.dumps({
+            "sentence": sentence,
+            "pos": categorize_tokens(doc),
+            "score": round(readability_score, 2),
+            "grade": grade_level,
+        }) + "\n")
+        count += 1
+    return count
 
-if __name__ == "__main__":
+def run_batch(args):
+    """Run the non-interactive mode over a file or stdin."""
+    stream = sys.stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+    output = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    start = time.perf_counter()
+    try:
+        count = analyze_stream(stream, output, args.batch_size, args.n_process)
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if output is not sys.stdout:
+            output.close()
+    elapsed = time.perf_counter() - start
+    print(f"Analyzed {count} lines in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f} lines/s)", file=sys.stderr)
+
+def run_interactive():
+    """Prompt for sentences and print the analysis of each one."""
     while True:
         print("Enter a sentence to analyze (or press Enter for a default sentence):")
         sentence = input().strip() or "The quick brown fox jumps over the lazy dog."
@@ -98,3 +137,18 @@ if __name__ == "__main__":
         print("\nType 'exit' to quit or press Enter to analyze another sentence.")
         if input().strip().lower() == 'exit':
             break
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze sentence structure and readability.")
+    parser.add_argument("input", nargs="?", help="File with one sentence per line, or - for stdin. Omit for interactive mode")
+    parser.add_argument("-o", "--output", default="-", help="JSON Lines output file (default: stdout)")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Sentences per spaCy batch")
+    parser.add_argument("--n-process", type=int, default=1, help="Number of spaCy worker processes")
+    parser.add_argument("--lexicon", default=default_lexicon_path(), help="Word lexicon built by lexicon.py, used when it exists")
+    args = parser.parse_args()
+    readability_core.use_lexicon(args.lexicon)
+
+    if args.input is None:
+        run_interactive()
+    else:
+        run_batch(args)
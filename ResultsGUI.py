@@ -1,14 +1,24 @@
 import sys
-import mysql.connector
-from mysql.connector import Error
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QVBoxLayout, QHBoxLayout,
-    QLabel, QComboBox, QLineEdit, QPushButton, QTextEdit,
-    QWidget, QScrollArea, QMessageBox
+    QLabel, QComboBox, QLineEdit, QPushButton, QTableView,
+    QWidget, QHeaderView, QAbstractItemView, QMessageBox, QCheckBox, QDateEdit, QFileDialog
 )
 from PyQt5.QtGui import QFont
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import (
+    Qt, QAbstractTableModel, QDate, QModelIndex, QObject, QRunnable, QThreadPool, QTimer, pyqtSignal
+)
 import datetime
+import threading
+from readability_core import channel_label, display_nick, score_to_grade_level
+from storage import StorageError, open_storage
+from stylometry import SHOWN_TAGS, pos_shares
+
+# Storage configuration, same settings as the plugin
+STORAGE_CONFIG = {
+    'backend': 'mariadb',       # 'mariadb' or 'sqlite'
+    'sqlite_path': None         # SQLite database file, the one in HexChat's config folder by default
+}
 
 # Database configuration
 DB_CONFIG = {
@@ -18,8 +28,298 @@ DB_CONFIG = {
     'database': 'readability_analyzer'  # Replace with your database name
 }
 
+# Number of search results fetched per page
+PAGE_SIZE = 200
+
+# Number of rows added to the table each time the view scrolls near the end
+FETCH_CHUNK = 100
+
+# Milliseconds between two checks for new messages in live mode
+LIVE_INTERVAL_MS = 2000
+
+# Most new messages read per check, a larger backlog is caught up over the next checks
+LIVE_CHUNK = 1000
+
+# Days the trend view covers when the window opens
+TREND_DAYS = 90
+
+# Trend periods offered in the dropdown, with the storage period they read
+TREND_PERIODS = [("Daily", "day"), ("Weekly", "week"), ("Monthly", "month"), ("Hourly", "hour")]
+
+_storage = None
+_storage_lock = threading.Lock()
+
+def get_storage():
+    """Returns the database storage, opening it on first use so an archive can be read without the database."""
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = open_storage(STORAGE_CONFIG, DB_CONFIG)
+        return _storage
+
+def fetch_search_page(user, keyword, last_id, scope=None):
+    """
+    Fetches one page of search results, newest messages first.
+
+    :param user: Username to search, or "ALL USERS"
+    :param keyword: Words and "quoted phrases" to search for, empty to match every message
+    :param last_id: Smallest id of the previous page, None for the first page
+    :param scope: (network, channel) to search, None for every channel
+    :return: List of (id, username, message, readability_score, timestamp, network, channel) rows
+    """
+    network, channel = scope or (None, None)
+    storage = get_storage()
+    return storage.search_messages(None if user == "ALL USERS" else user, keyword, last_id, PAGE_SIZE,
+                                   network, channel)
+
+def fetch_averages(scope=None):
+    """
+    Reads the per-user averages and part-of-speech shares.
+
+    :param scope: (network, channel) to average, None for every channel
+    :return: List of (username, average score, message count, POS shares) rows, the shares
+             being a dictionary of tag to share, empty for users stylometry.py hasn't tagged yet
+    """
+    network, channel = scope or (None, None)
+    storage = get_storage()
+    shares = {username: pos_shares(counts) for username, tokens, counts in storage.pos_profiles(None, network, channel)}
+    return [row + (shares.get(row[0], {}),) for row in storage.user_averages(None, network, channel)]
+
+def format_share(shares, tag):
+    """Formats one part-of-speech share as a percentage, empty if the user wasn't tagged yet."""
+    return f"{shares[tag]:.0%}" if tag in shares else ""
+
+def fetch_first_page(user, keyword, scope=None):
+    """
+    Fetches the first page of a search and the id live mode follows it from.
+
+    :return: (latest id, rows) tuple, the id being read first so no new message is missed
+    """
+    latest_id = get_storage().latest_id()
+    return latest_id, fetch_search_page(user, keyword, None, scope)
+
+def fetch_averages_live(scope=None):
+    """
+    Reads the per-user averages and the id live mode adds new messages from.
+
+    :return: (latest id, rows) tuple, the id being read after the averages so no message is counted twice
+    """
+    rows = fetch_averages(scope)
+    return get_storage().latest_id(), rows
+
+def fetch_new_messages(after_id, scope, user=None, keyword=""):
+    """
+    Reads the messages logged since live mode last looked, a single index range read.
+
+    :param after_id: Newest id already seen
+    :param scope: (network, channel) to follow, None for every channel
+    :param user: Username the current search is limited to, None or "ALL USERS" for everyone
+    :param keyword: Keyword of the current search
+    :return: (rows, matches) tuple: every new message of the scope, oldest first, and those
+             that match the search. Matches newer than the last row are left for the next check.
+    """
+    network, channel = scope or (None, None)
+    storage = get_storage()
+    rows = storage.search_messages(None, "", None, LIVE_CHUNK, network, channel, after_id=after_id)
+    if user in (None, "ALL USERS") and not keyword.strip() or not rows:
+        return rows, rows
+    newest = rows[-1][0]
+    matches = storage.search_messages(None if user == "ALL USERS" else user, keyword, None, LIVE_CHUNK,
+                                      network, channel, after_id=after_id)
+    return rows, [row for row in matches if row[0] <= newest]
+
+def fetch_trend(start, end, period, user, scope=None):
+    """
+    Reads the average score per period from the rollup tables, without reading messages.
+
+    :param start: Epoch seconds the trend starts at
+    :param end: Epoch seconds the trend ends before
+    :param period: 'hour', 'day', 'week' or 'month'
+    :param user: Username to follow, or "ALL USERS" for everyone together
+    :param scope: (network, channel) to follow, None for every channel
+    :return: List of (period start, average score, message count, standard deviation, change) rows,
+             change being the difference to the previous row's average, None for the first row
+    """
+    network, channel = scope or (None, None)
+    storage = get_storage()
+    usernames = None if user == "ALL USERS" else [user]
+    rows = []
+    previous = None
+    for bucket, username, avg_score, msg_count, stddev in storage.score_trend(start, end, period, usernames, network,
+                                                                             channel, per_user=False):
+        rows.append((bucket, avg_score, msg_count, stddev, None if previous is None else avg_score - previous))
+        previous = avg_score
+    return rows
+
+def date_to_epoch(date):
+    """Returns the epoch seconds of local midnight at the start of a QDate."""
+    return datetime.datetime(date.year(), date.month(), date.day()).timestamp()
+
+def format_change(change):
+    """Formats the change of an average against the previous period, empty for the first one."""
+    return "" if change is None else f"{change:+.2f}"
+
+def fetch_channels():
+    """Lists the logged (network, channel) pairs."""
+    return get_storage().list_channels()
+
+def fetch_users(scope=None):
+    """Lists the users seen in a (network, channel), or in every channel for None."""
+    network, channel = scope or (None, None)
+    return get_storage().list_users(network, channel)
+
+def open_archive(path):
+    """Opens a columnar archive written by columnar.py. NumPy is only needed once one is opened."""
+    from columnar import ColumnarArchive
+    return ColumnarArchive(path)
+
+def fetch_archive_users(archive, scope=None):
+    """Lists the users of an archive seen in a (network, channel), or in every channel for None."""
+    network, channel = scope or (None, None)
+    return archive.list_users(network, channel)
+
+def fetch_archive_averages(archive, scope=None):
+    """
+    Aggregates the per-user averages, score percentiles and grade levels of an archive.
+
+    :param archive: ColumnarArchive to read
+    :param scope: (network, channel) to average, None for every channel
+    :return: (rows, grades) tuple: (username, average score, message count, standard deviation,
+             10th percentile, median, 90th percentile) rows and (grade level, message count) tuples
+    """
+    network, channel = scope or (None, None)
+    percentiles = archive.user_percentiles((10, 50, 90), network=network, channel=channel)
+    rows = [row + tuple(percentiles[row[0]]) for row in archive.user_averages(network=network, channel=channel)]
+    return rows, archive.grade_histogram(network=network, channel=channel)
+
+class QuerySignals(QObject):
+    """Signals a QueryTask uses to hand its result back to the GUI thread."""
+    finished = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+class QueryTask(QRunnable):
+    """
+    Runs a database function on the thread pool and reports the result with a ticket number.
+    A task whose request was replaced before it started is skipped.
+    """
+
+    def __init__(self, ticket, function, *args, current_ticket=None):
+        """
+        :param ticket: Ticket of the request the task belongs to
+        :param function: Function to run
+        :param current_ticket: Callable returning the ticket of the current request, None if the task
+                               is never superseded
+        """
+        super().__init__()
+        self.ticket = ticket
+        self.function = function
+        self.args = args
+        self.current_ticket = current_ticket
+        self.signals = QuerySignals()
+
+    def run(self):
+        if self.current_ticket is not None and self.current_ticket() != self.ticket:
+            return
+        try:
+            result = self.function(*self.args)
+        except (StorageError, ValueError, OSError, ImportError) as e:
+            # ValueError, OSError and ImportError come from opening an archive without NumPy or a manifest
+            self.signals.failed.emit(self.ticket, str(e))
+            return
+        self.signals.finished.emit(self.ticket, result)
+
+class ResultsModel(QAbstractTableModel):
+    """
+    Table model that only exposes rows to the view as it scrolls towards them.
+
+    Received rows are kept as raw database tuples and only formatted when the view
+    asks for a visible cell. Once every received row is shown, fetchMore() asks
+    request_more (if set) for the next page from the database.
+    """
+
+    def __init__(self, columns, request_more=None, parent=None):
+        """
+        :param columns: List of (header, formatter) pairs, formatter turning a row into cell text
+        :param request_more: Callable fetching the next page, None if all rows are known
+        """
+        super().__init__(parent)
+        self.columns = columns
+        self.request_more = request_more
+        self.rows = []
+        self.visible = 0
+        self.more_available = request_more is not None
+        self.loading = False
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.visible
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role not in (Qt.DisplayRole, Qt.ToolTipRole):
+            return None
+        return self.columns[index.column()][1](self.rows[index.row()])
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.columns[section][0]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+        return self.visible < len(self.rows) or (self.more_available and not self.loading)
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        if self.visible < len(self.rows):
+            count = min(FETCH_CHUNK, len(self.rows) - self.visible)
+            self.beginInsertRows(QModelIndex(), self.visible, self.visible + count - 1)
+            self.visible += count
+            self.endInsertRows()
+        elif self.more_available and not self.loading:
+            self.loading = True
+            self.request_more()
+
+    def add_rows(self, rows, more_available=False):
+        """
+        Adds rows received from the database and shows the first chunk of them.
+
+        :param rows: List of database rows
+        :param more_available: Whether the database may have further pages
+        """
+        self.rows.extend(rows)
+        self.more_available = more_available
+        self.loading = False
+        if self.visible < len(self.rows):
+            self.fetchMore()
+
+    def prepend_rows(self, rows):
+        """
+        Shows new rows at the top, for live mode.
+
+        :param rows: List of database rows in display order
+        """
+        if not rows:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(rows) - 1)
+        self.rows[0:0] = rows
+        self.visible += len(rows)
+        self.endInsertRows()
+
+    def update_row(self, position, row):
+        """Replaces one row, redrawing it if it is shown."""
+        self.rows[position] = row
+        if position < self.visible:
+            self.dataChanged.emit(self.index(position, 0), self.index(position, len(self.columns) - 1))
+
 class ReadabilityAnalyzerGUI(QMainWindow):
-    def __init__(self):
+    def __init__(self, archive_path=None):
+        """
+        :param archive_path: Columnar archive to open instead of the database, see columnar.py
+        """
         super().__init__()
 
         # Set up the main window
@@ -27,9 +327,41 @@ class ReadabilityAnalyzerGUI(QMainWindow):
         self.setGeometry(100, 100, 800, 600)
         self.setStyleSheet("background-color: #2E2E2E; color: #FFFFFF;")
 
+        # Queries run on this pool so the window never waits on the database.
+        # Every new search or averages request takes a new ticket, results for older tickets are dropped.
+        self.thread_pool = QThreadPool()
+        self.thread_pool.setMaxThreadCount(2)
+        self.ticket = 0
+        self.users_request = 0
+        self.search_state = None
+        self.text_export = None
+
+        # Live mode: what the current view follows, and the timer checking for new messages
+        self.live_state = None
+        self.live_request = None
+        self.users_scope = None
+        self.live_timer = QTimer(self)
+        self.live_timer.setInterval(LIVE_INTERVAL_MS)
+        self.live_timer.timeout.connect(self.check_new_messages)
+
+        # Columnar archive shown instead of the database once one is opened
+        self.archive = None
+
         # Main layout
         main_layout = QVBoxLayout()
 
+        # Create a drop-down for channels, searches and averages only read the selected one
+        self.channel_label = QLabel("Channel:")
+        self.channel_label.setFont(QFont("Arial", 10))
+        self.channel_label.setStyleSheet("color: #FFFFFF;")
+        self.channel_dropdown = QComboBox()
+        self.channel_dropdown.setFont(QFont("Arial", 10))
+        self.channel_dropdown.setStyleSheet("background-color: #3A3A3A; color: #FFFFFF;")
+        self.channel_dropdown.addItem("ALL CHANNELS", None)
+        self.channel_dropdown.activated.connect(self.load_users)
+        if archive_path is None:
+            self.load_channels()
+
         # Create a drop-down for users
         self.user_label = QLabel("Select User:")
         self.user_label.setFont(QFont("Arial", 10))
@@ -37,8 +369,9 @@ class ReadabilityAnalyzerGUI(QMainWindow):
         self.user_dropdown = QComboBox()
         self.user_dropdown.setFont(QFont("Arial", 10))
         self.user_dropdown.setStyleSheet("background-color: #3A3A3A; color: #FFFFFF;")
-        self.load_users()
-        self.user_dropdown.addItem("ALL USERS")
+        self.user_dropdown.addItem("ALL USERS", "ALL USERS")
+        if archive_path is None:
+            self.load_users()
 
         # Create a line edit for keyword search
         self.keyword_label = QLabel("Search Keyword:")
@@ -53,6 +386,7 @@ class ReadabilityAnalyzerGUI(QMainWindow):
         self.search_button.setFont(QFont("Arial", 10))
         self.search_button.setStyleSheet("background-color: #007ACC; color: #FFFFFF;")
         self.search_button.clicked.connect(self.search_messages)
+        self.keyword_edit.returnPressed.connect(self.search_messages)
 
         # Show Averages button
         self.show_averages_button = QPushButton("Show Averages")
@@ -60,39 +394,98 @@ class ReadabilityAnalyzerGUI(QMainWindow):
         self.show_averages_button.setStyleSheet("background-color: #007ACC; color: #FFFFFF;")
         self.show_averages_button.clicked.connect(self.show_averages)
 
+        # Date range and period of the trend view, read from the hourly and daily rollups
+        self.from_label = QLabel("From:")
+        self.from_label.setFont(QFont("Arial", 10))
+        self.from_label.setStyleSheet("color: #FFFFFF;")
+        self.from_edit = QDateEdit(QDate.currentDate().addDays(-TREND_DAYS))
+        self.from_edit.setCalendarPopup(True)
+        self.from_edit.setFont(QFont("Arial", 10))
+        self.from_edit.setStyleSheet("background-color: #3A3A3A; color: #FFFFFF;")
+        self.to_label = QLabel("To:")
+        self.to_label.setFont(QFont("Arial", 10))
+        self.to_label.setStyleSheet("color: #FFFFFF;")
+        self.to_edit = QDateEdit(QDate.currentDate())
+        self.to_edit.setCalendarPopup(True)
+        self.to_edit.setFont(QFont("Arial", 10))
+        self.to_edit.setStyleSheet("background-color: #3A3A3A; color: #FFFFFF;")
+        self.period_dropdown = QComboBox()
+        self.period_dropdown.setFont(QFont("Arial", 10))
+        self.period_dropdown.setStyleSheet("background-color: #3A3A3A; color: #FFFFFF;")
+        for name, period in TREND_PERIODS:
+            self.period_dropdown.addItem(name, period)
+
+        # Show Trend button
+        self.show_trend_button = QPushButton("Show Trend")
+        self.show_trend_button.setFont(QFont("Arial", 10))
+        self.show_trend_button.setStyleSheet("background-color: #007ACC; color: #FFFFFF;")
+        self.show_trend_button.clicked.connect(self.show_trend)
+
+        # Open Archive button, reads a columnar archive instead of the database
+        self.open_archive_button = QPushButton("Open Archive")
+        self.open_archive_button.setFont(QFont("Arial", 10))
+        self.open_archive_button.setStyleSheet("background-color: #007ACC; color: #FFFFFF;")
+        self.open_archive_button.clicked.connect(self.choose_archive)
+
         # Copy to Clipboard button
         self.copy_button = QPushButton("Copy to Clipboard")
         self.copy_button.setFont(QFont("Arial", 10))
         self.copy_button.setStyleSheet("background-color: #007ACC; color: #FFFFFF;")
         self.copy_button.clicked.connect(self.copy_to_clipboard)
 
-        # Textbox for displaying results
-        self.result_text = QTextEdit()
-        self.result_text.setFont(QFont("Arial", 10))
-        self.result_text.setStyleSheet("background-color: #3A3A3A; color: #FFFFFF;")
-        self.result_text.setReadOnly(True)
+        # Live mode checkbox, keeps the shown results up to date with new messages
+        self.live_checkbox = QCheckBox("Live")
+        self.live_checkbox.setFont(QFont("Arial", 10))
+        self.live_checkbox.setStyleSheet("color: #FFFFFF;")
+        self.live_checkbox.toggled.connect(self.set_live)
 
-        # Scroll area for the result text
-        scroll_area = QScrollArea()
-        scroll_area.setWidgetResizable(True)
-        scroll_area.setWidget(self.result_text)
+        # Status line above the results
+        self.status_label = QLabel("")
+        self.status_label.setFont(QFont("Arial", 10))
+        self.status_label.setStyleSheet("color: #FFFFFF;")
+
+        # Table for displaying results, rows are added as the view scrolls
+        self.result_table = QTableView()
+        self.result_table.setFont(QFont("Arial", 10))
+        self.result_table.setStyleSheet("background-color: #3A3A3A; color: #FFFFFF;")
+        self.result_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.result_table.setWordWrap(False)
+        self.result_table.verticalHeader().setVisible(False)
+        self.result_table.horizontalHeader().setStretchLastSection(True)
+        self.result_table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+        self.result_model = None
 
         # Layouts for the components
         form_layout = QHBoxLayout()
+        form_layout.addWidget(self.channel_label)
+        form_layout.addWidget(self.channel_dropdown)
         form_layout.addWidget(self.user_label)
         form_layout.addWidget(self.user_dropdown)
         form_layout.addWidget(self.keyword_label)
         form_layout.addWidget(self.keyword_edit)
         form_layout.addWidget(self.search_button)
 
+        trend_layout = QHBoxLayout()
+        trend_layout.addWidget(self.from_label)
+        trend_layout.addWidget(self.from_edit)
+        trend_layout.addWidget(self.to_label)
+        trend_layout.addWidget(self.to_edit)
+        trend_layout.addWidget(self.period_dropdown)
+        trend_layout.addWidget(self.show_trend_button)
+        trend_layout.addStretch(1)
+
         button_layout = QHBoxLayout()
+        button_layout.addWidget(self.live_checkbox)
         button_layout.addStretch(1)
+        button_layout.addWidget(self.open_archive_button)
         button_layout.addWidget(self.show_averages_button)
         button_layout.addWidget(self.copy_button)
 
         # Add all widgets to the main layout
         main_layout.addLayout(form_layout)
-        main_layout.addWidget(scroll_area)
+        main_layout.addLayout(trend_layout)
+        main_layout.addWidget(self.status_label)
+        main_layout.addWidget(self.result_table)
         main_layout.addLayout(button_layout)
 
         # Set the main layout
@@ -100,117 +493,477 @@ class ReadabilityAnalyzerGUI(QMainWindow):
         container.setLayout(main_layout)
         self.setCentralWidget(container)
 
+        if archive_path is not None:
+            self.open_archive(archive_path)
+
+    def run_task(self, ticket, function, *args, on_finished, error_title, on_failed=None,
+                 dialog_title="Database Error"):
+        """
+        Runs a database function on the thread pool.
+
+        :param ticket: Ticket passed back with the result, -1 for loads no later request cancels
+        :param function: Function to run on a worker thread
+        :param on_finished: Slot receiving (ticket, result) on the GUI thread
+        :param error_title: Start of the error message shown if the query fails
+        :param on_failed: Slot receiving (ticket, error) instead of the error dialog
+        :param dialog_title: Title of the error dialog
+        """
+        task = QueryTask(ticket, function, *args, current_ticket=None if ticket == -1 else lambda: self.ticket)
+        task.signals.finished.connect(on_finished)
+        if on_failed is not None:
+            task.signals.failed.connect(on_failed)
+        else:
+            task.signals.failed.connect(
+                lambda ticket, error: self.on_task_failed(ticket, error_title, error, dialog_title))
+        self.thread_pool.start(task)
+
+    def new_ticket(self):
+        """Cancels the current search or averages request and returns the ticket for a new one."""
+        # Queued queries of older tickets skip themselves when they start, running ones are ignored
+        # when they finish. Loads under ticket -1, like the channel and user lists, still run.
+        self.ticket += 1
+        self.live_state = None
+        self.live_request = None
+        return self.ticket
+
+    def on_task_failed(self, ticket, title, error, dialog_title="Database Error"):
+        """Show a database or archive error, unless it belongs to a cancelled request."""
+        if ticket not in (self.ticket, -1):
+            return
+        if ticket == self.ticket and self.result_model is not None:
+            self.result_model.loading = False
+            self.result_model.more_available = False
+        self.status_label.setText("")
+        QMessageBox.critical(self, dialog_title, f"{title}: {error}")
+
+    def set_model(self, model):
+        """Show a new results model in the table."""
+        self.result_model = model
+        self.result_table.setModel(model)
+
+    def load_channels(self):
+        """Load the logged channels from the database into the dropdown."""
+        self.run_task(-1, fetch_channels, on_finished=self.on_channels_loaded,
+                      error_title="Error loading channels from database")
+
+    def on_channels_loaded(self, ticket, channels):
+        """Add the loaded channels to the dropdown, in front of ALL CHANNELS."""
+        if self.archive is not None:
+            return
+        for network, channel in channels:
+            self.add_channel(network, channel)
+
+    def add_channel(self, network, channel):
+        """Adds a channel to the dropdown unless it is listed already."""
+        # findData can't compare tuples, so the items are compared here
+        if (network, channel) not in (self.channel_dropdown.itemData(i) for i in range(self.channel_dropdown.count())):
+            self.channel_dropdown.insertItem(self.channel_dropdown.count() - 1, channel_label(network, channel),
+                                             (network, channel))
+
     def load_users(self):
-        """Load users from the database into the dropdown."""
-        try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT username FROM messages")
-            users = cursor.fetchall()
-            for user in users:
-                self.user_dropdown.addItem(user[0])
-            cursor.close()
-            conn.close()
-        except Error as e:
-            QMessageBox.critical(self, "Database Error", f"Error loading users from database: {e}")
+        """Load the users of the selected channel from the database into the dropdown."""
+        self.users_request += 1
+        request = self.users_request
+        scope = self.channel_dropdown.currentData()
+        if self.archive is not None:
+            function, args = fetch_archive_users, (self.archive, scope)
+            error_title, dialog_title = "Error loading users from the archive", "Archive Error"
+        else:
+            function, args = fetch_users, (scope,)
+            error_title, dialog_title = "Error loading users from database", "Database Error"
+        self.run_task(-1, function, *args,
+                      on_finished=lambda ticket, users: self.on_users_loaded(request, users, scope),
+                      error_title=error_title, dialog_title=dialog_title)
+
+    def on_users_loaded(self, request, users, scope=None):
+        """Replace the users in the dropdown, in front of ALL USERS, unless a newer list was requested."""
+        if request != self.users_request:
+            return
+        self.users_scope = scope
+        self.user_dropdown.setCurrentIndex(self.user_dropdown.count() - 1)
+        while self.user_dropdown.count() > 1:
+            self.user_dropdown.removeItem(0)
+        for user in users:
+            # Show the plain nick, but search with the username as stored
+            self.user_dropdown.insertItem(self.user_dropdown.count() - 1, display_nick(user), user)
+
+    def add_user(self, user):
+        """Adds a user to the dropdown in sorted position, unless it is listed already."""
+        if self.user_dropdown.findData(user) >= 0:
+            return
+        position = 0
+        while position < self.user_dropdown.count() - 1 and self.user_dropdown.itemData(position) < user:
+            position += 1
+        self.user_dropdown.insertItem(position, display_nick(user), user)
 
     def search_messages(self):
-        """Search the database for messages based on user and keyword."""
-        user = self.user_dropdown.currentText()
-        keyword = self.keyword_edit.text()
+        """Start a new search of the messages based on user and keyword."""
+        ticket = self.new_ticket()
+        self.search_state = {
+            'user': self.user_dropdown.currentData(),
+            'keyword': self.keyword_edit.text(),
+            'scope': self.channel_dropdown.currentData(),
+            'last_id': None
+        }
+        self.text_export = None
+        self.set_model(ResultsModel([
+            ("Channel", lambda row: channel_label(row[5], row[6])),
+            ("User", lambda row: display_nick(row[1])),
+            ("Message", lambda row: row[2]),
+            ("Readability Score", lambda row: f"{row[3]:.2f}"),
+            ("Timestamp", lambda row: str(row[4])),
+        ], request_more=lambda: self.fetch_next_page(ticket)))
+        self.status_label.setText("Searching...")
+        self.result_model.loading = True
+        state = self.search_state
+        self.run_task(ticket, fetch_first_page, state['user'], state['keyword'], state['scope'],
+                      on_finished=self.on_first_page, error_title="Error searching messages in the database")
 
-        try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor()
+    def on_first_page(self, ticket, result):
+        """Show the first page of a search and start following it from the newest message."""
+        if ticket != self.ticket:
+            return
+        latest_id, results = result
+        state = self.search_state
+        # Messages logged while the page was read are on it already
+        self.live_state = {
+            'view': 'search',
+            'scope': state['scope'],
+            'user': state['user'],
+            'keyword': state['keyword'],
+            'last_id': max([latest_id] + [row[0] for row in results[:1]]),
+        }
+        self.on_search_page(ticket, results)
 
-            # Formulate the SQL query
-            if user == "ALL USERS":
-                query = "SELECT username, message, readability_score, timestamp FROM messages WHERE message LIKE %s"
-                cursor.execute(query, (f"%{keyword}%",))
-            else:
-                query = "SELECT username, message, readability_score, timestamp FROM messages WHERE username = %s AND message LIKE %s"
-                cursor.execute(query, (user, f"%{keyword}%"))
-
-            # Fetch the results
-            results = cursor.fetchall()
-            self.result_text.clear()
-            if results:
-                for row in results:
-                    # Remove first 3 characters from the username
-                    modified_username = row[0][3:] if len(row[0]) > 3 else row[0]
-                    self.result_text.append(f"User: {modified_username}\nMessage: {row[1]}\nReadability Score: {row[2]:.2f}\nTimestamp: {row[3]}\n")
-                    self.result_text.append("-" * 50)
-            else:
-                self.result_text.append("No results found.")
+    def fetch_next_page(self, ticket):
+        """Fetch the next page of the current search on the thread pool."""
+        if ticket != self.ticket or self.search_state is None:
+            return
+        state = self.search_state
+        self.run_task(ticket, fetch_search_page, state['user'], state['keyword'], state['last_id'], state['scope'],
+                      on_finished=self.on_search_page, error_title="Error searching messages in the database")
 
-            cursor.close()
-            conn.close()
-        except Error as e:
-            QMessageBox.critical(self, "Database Error", f"Error searching messages in the database: {e}")
+    def on_search_page(self, ticket, results):
+        """Add a page of search results to the table."""
+        if ticket != self.ticket:
+            return
+        if results:
+            self.search_state['last_id'] = results[-1][0]
+        self.result_model.add_rows(results, more_available=len(results) == PAGE_SIZE)
+        self.show_search_status()
+        self.text_export = self.search_results_text
+
+    def show_search_status(self):
+        """Shows how many results the search has so far."""
+        if not self.result_model.rows:
+            self.status_label.setText("No results found.")
+        else:
+            more = "+" if self.result_model.more_available else ""
+            self.status_label.setText(f"{len(self.result_model.rows)}{more} results")
+
+    def search_results_text(self):
+        """Format the fetched search results the way they are copied to the clipboard."""
+        lines = []
+        for row in self.result_model.rows:
+            lines.append(f"Channel: {channel_label(row[5], row[6])}\nUser: {display_nick(row[1])}\nMessage: {row[2]}\nReadability Score: {row[3]:.2f}\nTimestamp: {row[4]}\n")
+            lines.append("-" * 50)
+        return "\n".join(lines) if lines else "No results found."
 
     def show_averages(self):
-        """Calculate and display the average readability scores for all users."""
-        try:
-            conn = mysql.connector.connect(**DB_CONFIG)
-            cursor = conn.cursor()
-
-            # Query to get average readability score for each user
-            cursor.execute("SELECT username, AVG(readability_score) FROM messages GROUP BY username")
-            results = cursor.fetchall()
-
-            # Query to get the total number of messages
-            cursor.execute("SELECT COUNT(*) FROM messages")
-            total_messages = cursor.fetchone()[0]
-            
-            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            self.result_text.clear()
-
-            if results:
-                self.result_text.append("--- Average Readability Scores for All Users ---")
-                self.result_text.append(f"--- Total Messages Analyzed {total_messages} ---")
-                self.result_text.append(f"--- {timestamp} ---")
-
-                for row in results:
-                    # Remove first 3 characters from the username
-                    modified_username = row[0][3:] if len(row[0]) > 3 else row[0]
-                    avg_score = row[1]
-                    grade_level = self.score_to_grade_level(avg_score)
-                    self.result_text.append(f"{modified_username}'s average Dale-Chall readability score: {avg_score:.2f} ({grade_level})")
-                
-                self.result_text.append("--- End of Average Readability Scores ---\n")
-            else:
-                self.result_text.append("No data available.")
+        """Calculate and display the average readability scores for all users of the selected channel."""
+        if self.archive is not None:
+            self.show_archive_averages()
+            return
+        ticket = self.new_ticket()
+        scope = self.channel_dropdown.currentData()
+        scope_text = self.channel_dropdown.currentText() if scope is not None else None
+        self.search_state = None
+        self.text_export = None
+        self.set_model(ResultsModel([
+            ("User", lambda row: display_nick(row[0])),
+            ("Average Score", lambda row: f"{row[1]:.2f}"),
+            ("Grade Level", lambda row: score_to_grade_level(row[1])),
+            ("Messages", lambda row: str(row[2])),
+        ] + [(name, lambda row, tag=tag: format_share(row[3], tag)) for tag, name in SHOWN_TAGS]))
+        self.status_label.setText("Calculating averages...")
+        self.run_task(ticket, fetch_averages_live, scope,
+                      on_finished=lambda ticket, result: self.on_averages_loaded(ticket, result, scope, scope_text),
+                      error_title="Error calculating averages")
 
-            cursor.close()
-            conn.close()
-        except Error as e:
-            QMessageBox.critical(self, "Database Error", f"Error calculating averages: {e}")
+    def on_averages_loaded(self, ticket, result, scope=None, scope_text=None):
+        """Show the per-user averages in the table and start following new messages."""
+        if ticket != self.ticket:
+            return
+        latest_id, results = result
+        self.live_state = {
+            'view': 'averages',
+            'scope': scope,
+            'scope_text': scope_text,
+            'last_id': latest_id,
+            'positions': {row[0]: position for position, row in enumerate(results)},
+            'total': sum(row[2] for row in results),
+        }
+        self.result_model.add_rows(results)
+        self.show_averages_status()
+
+    def show_averages_status(self):
+        """Shows the number of messages the averages include."""
+        total_messages = self.live_state['total']
+        scope_text = self.live_state['scope_text']
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        if self.result_model.rows:
+            self.status_label.setText(f"Total Messages Analyzed {total_messages} - {timestamp}")
+        else:
+            self.status_label.setText("No data available.")
+        self.text_export = lambda: self.averages_text(total_messages, timestamp, scope_text)
+
+    def averages_text(self, total_messages, timestamp, scope_text=None):
+        """Format the averages the way they are copied to the clipboard."""
+        if not self.result_model.rows:
+            return "No data available."
+        where = f" in {scope_text}" if scope_text else ""
+        lines = [
+            f"--- Average Readability Scores for All Users{where} ---",
+            f"--- Total Messages Analyzed {total_messages} ---",
+            f"--- {timestamp} ---",
+        ]
+        for row in self.result_model.rows:
+            avg_score = row[1]
+            grade_level = score_to_grade_level(avg_score)
+            style = ", ".join(f"{name.lower()} {format_share(row[3], tag)}" for tag, name in SHOWN_TAGS if tag in row[3])
+            lines.append(f"{display_nick(row[0])}'s average Dale-Chall readability score: {avg_score:.2f} ({grade_level})"
+                         + (f" - {style}" if style else ""))
+        lines.append("--- End of Average Readability Scores ---\n")
+        return "\n".join(lines)
+
+    def show_trend(self):
+        """Show the average score of the selected user, or everyone, per period over the selected dates."""
+        ticket = self.new_ticket()
+        scope = self.channel_dropdown.currentData()
+        user = self.user_dropdown.currentData()
+        start_date, end_date = self.from_edit.date(), self.to_edit.date()
+        period_name, period = self.period_dropdown.currentText(), self.period_dropdown.currentData()
+        self.search_state = None
+        self.text_export = None
+        self.set_model(ResultsModel([
+            ("Period", lambda row: row[0] if period == "hour" else row[0][:10]),
+            ("Average Score", lambda row: f"{row[1]:.2f}"),
+            ("Grade Level", lambda row: score_to_grade_level(row[1])),
+            ("Messages", lambda row: str(row[2])),
+            ("Std. Deviation", lambda row: f"{row[3]:.2f}"),
+            ("Change", lambda row: format_change(row[4])),
+        ]))
+        self.status_label.setText("Reading trend...")
+        self.run_task(ticket, fetch_trend, date_to_epoch(start_date), date_to_epoch(end_date.addDays(1)),
+                      period, user, scope,
+                      on_finished=lambda ticket, results: self.on_trend_loaded(
+                          ticket, results, self.trend_title(period_name, user, scope, start_date, end_date)),
+                      error_title="Error reading the trend")
+
+    def trend_title(self, period_name, user, scope, start_date, end_date):
+        """Describes a trend for the status line and the clipboard."""
+        who = "all users" if user == "ALL USERS" else display_nick(user)
+        where = f" in {channel_label(*scope)}" if scope is not None else ""
+        return (f"{period_name} readability of {who}{where}, "
+                f"{start_date.toString('yyyy-MM-dd')} to {end_date.toString('yyyy-MM-dd')}")
+
+    def on_trend_loaded(self, ticket, results, title):
+        """Show the trend in the table."""
+        if ticket != self.ticket:
+            return
+        self.result_model.add_rows(results)
+        if results:
+            self.status_label.setText(f"{title} - {sum(row[2] for row in results)} messages")
+        else:
+            self.status_label.setText("No data available.")
+        self.text_export = lambda: self.trend_text(title)
+
+    def trend_text(self, title):
+        """Format the trend the way it is copied to the clipboard."""
+        if not self.result_model.rows:
+            return "No data available."
+        lines = [f"--- {title} ---"]
+        for bucket, avg_score, msg_count, stddev, change in self.result_model.rows:
+            change_text = f", {format_change(change)} vs previous" if change is not None else ""
+            lines.append(f"{bucket}: {avg_score:.2f} ({score_to_grade_level(avg_score)}), "
+                         f"{msg_count} messages, std. deviation {stddev:.2f}{change_text}")
+        lines.append("--- End of Trend ---\n")
+        return "\n".join(lines)
+
+    def choose_archive(self):
+        """Asks for an archive folder and opens it."""
+        path = QFileDialog.getExistingDirectory(self, "Open Columnar Archive")
+        if path:
+            self.open_archive(path)
+
+    def open_archive(self, path):
+        """Opens a columnar archive on the thread pool, the database is no longer read once it is open."""
+        self.status_label.setText("Opening archive...")
+        self.run_task(-1, open_archive, path, on_finished=lambda ticket, archive: self.on_archive_opened(path, archive),
+                      error_title=f"Error opening archive {path}", dialog_title="Archive Error")
+
+    def on_archive_opened(self, path, archive):
+        """Switches the window over to an opened archive and shows its averages."""
+        self.new_ticket()
+        self.archive = archive
+        self.setWindowTitle(f"Readability Analyzer - {path}")
+        self.live_checkbox.setChecked(False)
+        # The archive has no search index, live messages or rollups, only the averages are read from it
+        for widget in (self.live_checkbox, self.search_button, self.keyword_edit, self.show_trend_button):
+            widget.setEnabled(False)
+        self.channel_dropdown.setCurrentIndex(self.channel_dropdown.count() - 1)
+        while self.channel_dropdown.count() > 1:
+            self.channel_dropdown.removeItem(0)
+        for network, channel in archive.list_channels():
+            self.add_channel(network, channel)
+        self.load_users()
+        self.show_archive_averages()
+
+    def show_archive_averages(self):
+        """Aggregate and display the per-user averages and percentiles of the open archive."""
+        ticket = self.new_ticket()
+        scope = self.channel_dropdown.currentData()
+        scope_text = self.channel_dropdown.currentText() if scope is not None else None
+        self.search_state = None
+        self.text_export = None
+        self.set_model(ResultsModel([
+            ("User", lambda row: display_nick(row[0])),
+            ("Average Score", lambda row: f"{row[1]:.2f}"),
+            ("Grade Level", lambda row: score_to_grade_level(row[1])),
+            ("Messages", lambda row: str(row[2])),
+            ("Std. Deviation", lambda row: f"{row[3]:.2f}"),
+            ("10th Percentile", lambda row: f"{row[4]:.2f}"),
+            ("Median", lambda row: f"{row[5]:.2f}"),
+            ("90th Percentile", lambda row: f"{row[6]:.2f}"),
+        ]))
+        self.status_label.setText(f"Aggregating {self.archive.rows} archived messages...")
+        start = datetime.datetime.now()
+        self.run_task(ticket, fetch_archive_averages, self.archive, scope,
+                      on_finished=lambda ticket, result: self.on_archive_averages_loaded(ticket, result, scope_text,
+                                                                                         start),
+                      error_title="Error aggregating the archive", dialog_title="Archive Error")
+
+    def on_archive_averages_loaded(self, ticket, result, scope_text, start):
+        """Show the archive's averages in the table and its grade levels in the status line."""
+        if ticket != self.ticket:
+            return
+        rows, grades = result
+        self.result_model.add_rows(rows)
+        total_messages = sum(row[2] for row in rows)
+        seconds = (datetime.datetime.now() - start).total_seconds()
+        if rows:
+            shares = ", ".join(f"{grade} {count / total_messages:.0%}" for grade, count in grades if count)
+            self.status_label.setText(f"Archive: {total_messages} messages aggregated in {seconds:.1f}s - {shares}")
+        else:
+            self.status_label.setText("No data available.")
+        self.text_export = lambda: self.archive_averages_text(total_messages, grades, scope_text)
+
+    def archive_averages_text(self, total_messages, grades, scope_text=None):
+        """Format the archive's averages and grade levels the way they are copied to the clipboard."""
+        if not self.result_model.rows:
+            return "No data available."
+        where = f" in {scope_text}" if scope_text else ""
+        lines = [
+            f"--- Average Readability Scores for All Users{where} ---",
+            f"--- Total Messages Analyzed {total_messages} ({self.archive.path}) ---",
+        ]
+        for username, avg_score, msg_count, deviation, low, median, high in self.result_model.rows:
+            lines.append(f"{display_nick(username)}'s average Dale-Chall readability score: {avg_score:.2f} "
+                         f"({score_to_grade_level(avg_score)}), {msg_count} messages, median {median:.2f}, "
+                         f"10th-90th percentile {low:.2f}-{high:.2f}")
+        lines.append("--- Grade Levels ---")
+        for grade, count in grades:
+            lines.append(f"{grade}: {count} ({count / total_messages:.1%})")
+        lines.append("--- End of Average Readability Scores ---\n")
+        return "\n".join(lines)
+
+    def set_live(self, enabled):
+        """Starts or stops checking for new messages."""
+        if enabled:
+            self.live_timer.start()
+            self.check_new_messages()
+        else:
+            self.live_timer.stop()
+
+    def check_new_messages(self):
+        """Timer callback reading the messages logged since the last check, one query at a time."""
+        state = self.live_state
+        if state is None or self.live_request is not None:
+            return
+        ticket = self.ticket
+        self.live_request = ticket
+        self.run_task(ticket, fetch_new_messages, state['last_id'], state['scope'], state.get('user'),
+                      state.get('keyword', ""), on_finished=self.on_new_messages,
+                      error_title="Error reading new messages", on_failed=self.on_live_failed)
+
+    def on_live_failed(self, ticket, error):
+        """Stops live mode after a database error instead of showing a dialog every few seconds."""
+        if ticket != self.ticket:
+            return
+        self.live_request = None
+        self.live_checkbox.setChecked(False)
+        self.status_label.setText(f"Live updates stopped, error reading new messages: {error}")
+
+    def on_new_messages(self, ticket, result):
+        """Adds the new messages to the dropdowns and the shown results."""
+        if ticket != self.ticket or self.live_state is None:
+            return
+        self.live_request = None
+        rows, matches = result
+        if not rows:
+            return
+        state = self.live_state
+        state['last_id'] = rows[-1][0]
+        for message_id, username, message, score, timestamp, network, channel in rows:
+            self.add_channel(network, channel)
+            if self.users_scope is None or self.users_scope == (network, channel):
+                self.add_user(username)
+
+        if state['view'] == 'search':
+            self.result_model.prepend_rows(matches[::-1])
+            self.show_search_status()
+        else:
+            self.add_to_averages(rows)
+            self.show_averages_status()
+        if len(rows) == LIVE_CHUNK:
+            # Still catching up, don't wait for the timer
+            self.check_new_messages()
+
+    def add_to_averages(self, rows):
+        """Adds new messages to the averages shown in the table."""
+        state = self.live_state
+        positions = state['positions']
+        added = []
+        for message_id, username, message, score, timestamp, network, channel in rows:
+            if score is None:
+                continue
+            state['total'] += 1
+            position = positions.get(username)
+            if position is None:
+                positions[username] = len(self.result_model.rows) + len(added)
+                added.append((username, score, 1, {}))
+            elif position >= len(self.result_model.rows):
+                user, avg_score, msg_count, shares = added[position - len(self.result_model.rows)]
+                added[position - len(self.result_model.rows)] = (
+                    user, (avg_score * msg_count + score) / (msg_count + 1), msg_count + 1, shares)
+            else:
+                user, avg_score, msg_count, shares = self.result_model.rows[position]
+                self.result_model.update_row(position, (user, (avg_score * msg_count + score) / (msg_count + 1),
+                                                        msg_count + 1, shares))
+        self.result_model.add_rows(added)
 
     def copy_to_clipboard(self):
-        """Copy the contents of the result text box to the clipboard."""
+        """Copy the current results as text to the clipboard."""
         clipboard = QApplication.clipboard()
-        clipboard.setText(self.result_text.toPlainText())
+        clipboard.setText(self.text_export() if self.text_export else "")
         QMessageBox.information(self, "Copy to Clipboard", "Results copied to clipboard.")
 
-    def score_to_grade_level(self, score):
-        """Convert the Dale-Chall readability score to a grade level."""
-        if score <= 4.9:
-            return "4th Grade or below"
-        elif score <= 5.9:
-            return "5th - 6th Grade"
-        elif score <= 6.9:
-            return "7th - 8th Grade"
-        elif score <= 7.9:
-            return "9th - 10th Grade"
-        elif score <= 8.9:
-            return "11th - 12th Grade"
-        else:
-            return "College Level"
-
 def main():
     app = QApplication(sys.argv)
     app.setStyle("Fusion")
-    window = ReadabilityAnalyzerGUI()
+    # An archive folder given on the command line is opened without connecting to the database
+    arguments = app.arguments()[1:]
+    window = ReadabilityAnalyzerGUI(arguments[0] if arguments else None)
     window.show()
     sys.exit(app.exec_())
 
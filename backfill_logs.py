@@ -0,0 +1,314 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from lexicon import default_lexicon_path
+from readability_core import calculate_readability, calculate_readability_many, use_lexicon
+from storage import StorageError, hexchat_config_dir, open_storage
+
+# Storage configuration, same settings as the plugin
+STORAGE_CONFIG = {
+    'backend': 'mariadb',       # 'mariadb' or 'sqlite'
+    'sqlite_path': None,        # SQLite database file, the one in HexChat's config folder by default
+    'dedupe_texts': False       # Store repeated message texts once, same setting as the plugin
+}
+
+# Database configuration
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'UserNameHere',     # Replace with your MariaDB username
+    'password': 'PassWordHere', # Replace with your MariaDB password
+    'database': 'readability_analyzer' # Replace with your database name
+}
+
+DEFAULT_LOG_DIR = os.path.join(hexchat_config_dir(), "logs")
+CHECKPOINT_FILE = "backfill_checkpoints.json"
+
+# HexChat's default log timestamp format, and the header written when a log is opened
+STAMP_FORMAT = "%b %d %H:%M:%S"
+BEGIN_LOGGING = "**** BEGIN LOGGING AT "
+BEGIN_FORMAT = "%a %b %d %H:%M:%S %Y"
+NICK_PREFIXES = "~&@%+"
+
+class LogParser:
+    """
+    Turns HexChat log lines into (nick, text, timestamp) tuples.
+
+    HexChat's default timestamps have no year, so the year is taken from the
+    last "BEGIN LOGGING" header and bumped when the month wraps around.
+    """
+
+    def __init__(self, stamp_format=STAMP_FORMAT, year=None, month=0):
+        """
+        :param stamp_format: strftime format of the line timestamps
+        :param year: Year to assume until a header is seen, the current year by default
+        :param month: Month of the last parsed line, used to detect a new year
+        """
+        self.stamp_format = stamp_format
+        self.year = year or datetime.date.today().year
+        self.month = month
+
+    def parse(self, line):
+        """
+        Parses one log line.
+
+        :param line: A decoded log line without the trailing newline
+        :return: (nick, text, timestamp) tuple, or None for lines that are not channel messages
+        """
+        if line.startswith(BEGIN_LOGGING):
+            try:
+                begin = datetime.datetime.strptime(line[len(BEGIN_LOGGING):].strip(), BEGIN_FORMAT)
+            except ValueError:
+                return None
+            self.year, self.month = begin.year, begin.month
+            return None
+
+        stamp, sep, rest = line.partition(" <")
+        if not sep:
+            return None
+        nick, sep, text = rest.partition(">")
+        if not sep or not nick or len(nick.split()) != 1:
+            # Not a <nick>, e.g. the "<--" of a quit line
+            return None
+        nick = nick.lstrip(NICK_PREFIXES)
+        text = text[1:] if text[:1] in ("\t", " ") else text
+        if not nick or not text.strip():
+            return None
+
+        try:
+            parsed = datetime.datetime.strptime(stamp, self.stamp_format)
+        except ValueError:
+            return None
+        if "%Y" not in self.stamp_format and "%y" not in self.stamp_format:
+            if parsed.month < self.month:
+                self.year += 1
+            self.month = parsed.month
+            try:
+                parsed = parsed.replace(year=self.year)
+            except ValueError:
+                # Feb 29 in a log without a usable year
+                return None
+        return nick, text, parsed.timestamp()
+
+def read_log(path, offset, parser, chunk_size):
+    """
+    Streams a log file from a byte offset in chunks of parsed messages.
+
+    :param path: Path of the log file
+    :param offset: Byte offset to start reading at
+    :param parser: LogParser keeping the year state for this file
+    :param chunk_size: Number of messages per chunk
+    :return: Generator of (messages, checkpoint) tuples, the checkpoint recording
+             the offset and year state right after the chunk
+    """
+    chunk = []
+    with open(path, 'rb') as log_file:
+        log_file.seek(offset)
+        for raw_line in log_file:
+            if not raw_line.endswith(b"\n"):
+                # HexChat is still writing this line, pick it up on the next run
+                break
+            offset += len(raw_line)
+            parsed = parser.parse(raw_line.decode('utf-8', errors='replace').rstrip("\r\n"))
+            if parsed is not None:
+                chunk.append(parsed)
+            if len(chunk) >= chunk_size:
+                yield chunk, {'offset': offset, 'year': parser.year, 'month': parser.month}
+                chunk = []
+    yield chunk, {'offset': offset, 'year': parser.year, 'month': parser.month}
+
+def score_chunk(messages, network, channel, batch=False):
+    """
+    Scores a chunk of parsed messages. Runs in a worker process.
+
+    :param messages: List of (nick, text, timestamp) tuples
+    :param network: Network the log belongs to
+    :param channel: Channel the log belongs to
+    :param batch: Score the whole chunk at once with the built-in Dale-Chall engine instead of textstat
+    :return: List of (username, message, readability_score, timestamp, network, channel) rows
+    """
+    texts = [text for nick, text, timestamp in messages]
+    scores = calculate_readability_many(texts) if batch else [calculate_readability(text) for text in texts]
+    return [(nick, text, score, timestamp, network, channel)
+            for (nick, text, timestamp), score in zip(messages, scores)]
+
+def find_logs(log_dir):
+    """
+    Lists the channel logs under a HexChat log folder.
+
+    :param log_dir: The HexChat logs folder, with one folder per network
+    :return: Sorted list of (network, channel, path) tuples
+    """
+    logs = []
+    for network in sorted(os.listdir(log_dir)):
+        network_dir = os.path.join(log_dir, network)
+        if not os.path.isdir(network_dir):
+            continue
+        for name in sorted(os.listdir(network_dir)):
+            if name.endswith(".log") and name.startswith(("#", "&")):
+                logs.append((network, name[:-4], os.path.join(network_dir, name)))
+    return logs
+
+def load_checkpoints(path):
+    """Reads the per-file checkpoints, an empty dictionary if there are none yet."""
+    if not os.path.exists(path):
+        return {}
+    with open(path, 'r', encoding='utf-8') as checkpoint_file:
+        return json.load(checkpoint_file)
+
+def save_checkpoints(path, checkpoints):
+    """Writes the per-file checkpoints atomically."""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as checkpoint_file:
+        json.dump(checkpoints, checkpoint_file, indent=2)
+    os.replace(temp_path, path)
+
+def drop_stored(storage, network, channel, messages):
+    """
+    Leaves out the messages the database holds already, because the plugin logged them
+    while HexChat wrote the log or another copy of the log was loaded.
+
+    A line matches a stored message with the same nick and text within a second of its
+    timestamp, since the plugin and the log each take the time themselves. Messages
+    archived without their text match on the nick alone. Each stored message matches
+    one line at most, so a line repeated in the same second is only dropped as often as
+    it was stored.
+
+    :param storage: Storage backend the rows are loaded into
+    :param network: Network the log belongs to
+    :param channel: Channel the log belongs to
+    :param messages: List of (nick, text, timestamp) tuples from the log
+    :return: The messages that aren't stored yet
+    """
+    if not messages:
+        return messages
+    stored = {}
+    start = min(message[2] for message in messages) - 1
+    end = max(message[2] for message in messages) + 1
+    for username, text, timestamp in storage.messages_between(network, channel, start, end):
+        stored.setdefault(username, []).append((timestamp, text))
+    if not stored:
+        return messages
+    new = []
+    for nick, text, timestamp in messages:
+        candidates = stored.get(nick, [])
+        for index, (stored_timestamp, stored_text) in enumerate(candidates):
+            if abs(stored_timestamp - timestamp) <= 1 and stored_text in (None, text):
+                del candidates[index]
+                break
+        else:
+            new.append((nick, text, timestamp))
+    return new
+
+def backfill_file(storage, executor, network, channel, path, checkpoint, args, on_checkpoint):
+    """
+    Scores the new lines of one log file and bulk loads them into the messages table.
+
+    Chunks are scored in parallel, but written and checkpointed in file order,
+    and only a few chunks are in flight at a time so memory stays flat.
+
+    :param storage: Storage backend the rows are loaded into
+    :param executor: Process pool scoring the chunks
+    :param network: Network the log belongs to
+    :param channel: Channel the log belongs to
+    :param path: Path of the log file
+    :param checkpoint: Checkpoint saved by the previous run, empty for a new file
+    :param args: Parsed command line arguments
+    :param on_checkpoint: Callable invoked with the new checkpoint after each committed batch
+    :return: Number of messages loaded
+    """
+    if os.path.getsize(path) < checkpoint.get('offset', 0):
+        # The log was truncated or replaced, start over
+        checkpoint = {}
+    parser = LogParser(args.stamp_format, checkpoint.get('year'), checkpoint.get('month', 0))
+
+    loaded = 0
+    rows = []
+    pending = deque()
+    max_pending = args.processes * 2
+
+    def collect(force):
+        nonlocal loaded, rows
+        future, chunk_checkpoint = pending.popleft()
+        rows.extend(future.result())
+        if force or len(rows) >= args.batch_size:
+            if rows:
+                storage.insert_messages(rows)
+                loaded += len(rows)
+                rows = []
+            on_checkpoint(chunk_checkpoint)
+
+    for messages, chunk_checkpoint in read_log(path, checkpoint.get('offset', 0), parser, args.chunk_size):
+        messages = drop_stored(storage, network, channel, messages)
+        pending.append((executor.submit(score_chunk, messages, network, channel, args.batch_scoring),
+                        chunk_checkpoint))
+        while len(pending) > max_pending:
+            collect(False)
+    while pending:
+        collect(len(pending) == 1)
+
+    return loaded
+
+def main():
+    parser = argparse.ArgumentParser(description="Score existing HexChat logs and load them into the messages table.")
+    parser.add_argument("log_dir", nargs="?", default=DEFAULT_LOG_DIR, help="HexChat logs folder")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Scoring processes")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Messages sent to a process at a time")
+    parser.add_argument("--batch-size", type=int, default=10000, help="Rows per bulk insert")
+    parser.add_argument("--lexicon", default=default_lexicon_path(),
+                        help="Word lexicon built by lexicon.py, shared by the scoring processes when it exists")
+    parser.add_argument("--batch-scoring", action="store_true",
+                        help="Score each chunk at once with the built-in Dale-Chall engine (dale_chall.py, needs "
+                             "NumPy), scores match textstat's within dale_chall.TEXTSTAT_TOLERANCE")
+    parser.add_argument("--stamp-format", default=STAMP_FORMAT, help="strftime format of the log timestamps")
+    parser.add_argument("--checkpoints", default=os.path.join(DEFAULT_LOG_DIR, CHECKPOINT_FILE),
+                        help="File recording how far each log has been loaded")
+    args = parser.parse_args()
+
+    if args.batch_scoring:
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            print("--batch-scoring needs NumPy: python3 -m pip install numpy")
+            sys.exit(1)
+
+    checkpoints = load_checkpoints(args.checkpoints)
+    start = time.perf_counter()
+    total = 0
+
+    storage = open_storage(STORAGE_CONFIG, DB_CONFIG)
+    try:
+        storage.initialize()
+    except StorageError as e:
+        print(f"Error connecting to the database: {e}")
+        sys.exit(1)
+
+    try:
+        with ProcessPoolExecutor(max_workers=args.processes, initializer=use_lexicon,
+                                 initargs=(args.lexicon,)) as executor:
+            for network, channel, path in find_logs(args.log_dir):
+                def on_checkpoint(checkpoint, path=path):
+                    checkpoints[path] = checkpoint
+                    save_checkpoints(args.checkpoints, checkpoints)
+
+                loaded = backfill_file(storage, executor, network, channel, path, checkpoints.get(path, {}),
+                                       args, on_checkpoint)
+                total += loaded
+                if loaded:
+                    print(f"{network}/{channel}: {loaded} messages")
+    except StorageError as e:
+        print(f"Error loading messages into the database: {e}")
+    finally:
+        save_checkpoints(args.checkpoints, checkpoints)
+        storage.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Loaded {total} messages in {elapsed:.1f}s ({total / elapsed if elapsed else 0:.0f} messages/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+import queue
+import random
+import threading
+import time
+
+# Overflow policies understood by BackgroundWorker
+OVERFLOW_DROP_OLDEST = "drop-oldest"
+OVERFLOW_SAMPLE = "sample"
+OVERFLOW_BLOCK = "block"
+OVERFLOW_POLICIES = (OVERFLOW_DROP_OLDEST, OVERFLOW_SAMPLE, OVERFLOW_BLOCK)
+
+_STOP = object()
+
+class BackgroundWorker:
+    """
+    Bounded queue plus a small pool of worker threads.
+
+    The HexChat hook calls submit() with a message tuple and returns right away;
+    the worker threads call the handler with each item. The handler must not use
+    the hexchat module, since HexChat's API is only safe on its own thread.
+
+    Overflow policies when the queue is full:
+      drop-oldest  discard the oldest queued item to make room for the new one
+      sample       above the high-water mark only keep one in every sample_every items,
+                   and drop the new item once the queue is completely full
+      block        wait (up to block_timeout seconds, None = forever) for room
+    """
+
+    def __init__(self, handler, num_workers=1, max_queue=5000, overflow=OVERFLOW_DROP_OLDEST,
+                 sample_every=10, high_water=0.8, block_timeout=None, on_error=None,
+                 name="readability-worker"):
+        """
+        :param handler: Callable invoked with each submitted item on a worker thread
+        :param num_workers: Number of worker threads
+        :param max_queue: Maximum number of queued items
+        :param overflow: One of OVERFLOW_POLICIES
+        :param sample_every: Keep one in every N items when sampling
+        :param high_water: Fraction of max_queue at which sampling starts
+        :param block_timeout: Seconds to wait for room with the block policy
+        :param on_error: Callable invoked with (item, exception) when the handler raises
+        :param name: Prefix for the worker thread names
+        """
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy {overflow!r}, expected one of {OVERFLOW_POLICIES}")
+
+        self.handler = handler
+        self.num_workers = max(1, int(num_workers))
+        self.max_queue = max(1, int(max_queue))
+        self.overflow = overflow
+        self.sample_every = max(1, int(sample_every))
+        self.high_water = max(1, int(self.max_queue * high_water))
+        self.block_timeout = block_timeout
+        self.on_error = on_error
+        self.name = name
+
+        self._queue = queue.Queue(maxsize=self.max_queue)
+        self._threads = []
+        self._lock = threading.Lock()
+        self._sample_counter = 0
+        self._running = False
+
+        # Counters, read by the plugin for its status output
+        self.submitted = 0
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.max_depth = 0
+
+    @property
+    def depth(self):
+        """Current number of queued items."""
+        return self._queue.qsize()
+
+    def start(self):
+        """Start the worker threads."""
+        if self._running:
+            return
+        self._running = True
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=5.0):
+        """
+        Let the workers drain the queue, then stop them.
+
+        :param timeout: Maximum number of seconds to wait for the workers
+        """
+        if not self._running:
+            return
+        self._running = False
+        deadline = time.monotonic() + timeout
+        for _ in self._threads:
+            try:
+                self._queue.put(_STOP, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                break
+        for thread in self._threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self._threads = []
+
+    def submit(self, item):
+        """
+        Queue an item for the workers without doing any work on the caller's thread.
+
+        :param item: The item to hand to the handler
+        :return: True if the item was queued, False if it was dropped
+        """
+        with self._lock:
+            self.submitted += 1
+
+        if self.overflow == OVERFLOW_BLOCK:
+            try:
+                self._queue.put(item, timeout=self.block_timeout)
+            except queue.Full:
+                self._count_drop()
+                return False
+            self._note_depth()
+            return True
+
+        if self.overflow == OVERFLOW_SAMPLE and self._queue.qsize() >= self.high_water:
+            with self._lock:
+                self._sample_counter += 1
+                keep = self._sample_counter % self.sample_every == 0
+            if not keep:
+                self._count_drop()
+                return False
+
+        while True:
+            try:
+                self._queue.put_nowait(item)
+                self._note_depth()
+                return True
+            except queue.Full:
+                if self.overflow == OVERFLOW_SAMPLE:
+                    self._count_drop()
+                    return False
+            # drop-oldest: make room and try again
+            try:
+                old = self._queue.get_nowait()
+            except queue.Empty:
+                continue
+            self._queue.task_done()
+            if old is _STOP:
+                # Never swallow a stop request, put it back and give up on the new item
+                self._queue.put_nowait(old)
+                self._count_drop()
+                return False
+            self._count_drop()
+
+    def _count_drop(self):
+        with self._lock:
+            self.dropped += 1
+
+    def _note_depth(self):
+        depth = self._queue.qsize()
+        if depth > self.max_depth:
+            self.max_depth = depth
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                try:
+                    self.handler(item)
+                except Exception as e:
+                    with self._lock:
+                        self.errors += 1
+                    if self.on_error is not None:
+                        self.on_error(item, e)
+                with self._lock:
+                    self.processed += 1
+            finally:
+                self._queue.task_done()
+
+    def stats(self):
+        """Return a snapshot of the queue counters as a dictionary."""
+        with self._lock:
+            return {
+                'depth': self.depth,
+                'max_depth': self.max_depth,
+                'submitted': self.submitted,
+                'processed': self.processed,
+                'dropped': self.dropped,
+                'errors': self.errors,
+            }
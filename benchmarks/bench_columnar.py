@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import numpy as np
+
+from columnar import ARCHIVE_FORMAT, MANIFEST_FILE, ColumnarArchive, code_dtype, export_archive
+from storage import SQLiteStorage
+
+def write_synthetic_archive(path, rows, users, channels, seed=1):
+    """
+    Writes an archive of random rows straight from NumPy, in the layout ArchiveWriter produces,
+    so aggregation can be timed on sizes that would take hours to log.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(path)
+    np.save(os.path.join(path, "id.npy"), np.arange(1, rows + 1, dtype=np.int64))
+    start = np.datetime64("2020-01-01T00:00:00")
+    np.save(os.path.join(path, "timestamp.npy"), start + np.sort(rng.integers(0, 4 * 365 * 86400, rows)))
+    np.save(os.path.join(path, "score.npy"), rng.normal(7.0, 2.0, rows).clip(0.0, 20.0).astype(np.float32))
+    np.save(os.path.join(path, "username.npy"), rng.zipf(1.3, rows).clip(1, users).astype(code_dtype(users)) - 1)
+    np.save(os.path.join(path, "channel.npy"), rng.integers(0, channels, rows).astype(code_dtype(channels)))
+    with open(os.path.join(path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump({'format': ARCHIVE_FORMAT, 'rows': rows, 'source': "synthetic", 'with_text': False,
+                   'usernames': [f"user{i}" for i in range(users)],
+                   'channels': [["Libera", f"#channel{i}"] for i in range(channels)]}, f)
+
+def time_call(name, function, unit_count, unit):
+    start = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - start
+    print(f"  {name + ':':18} {elapsed:8.2f} s  ({unit_count / elapsed / 1e6:7.1f} M {unit}/s)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Times the columnar export and the archive aggregations.")
+    parser.add_argument("--rows", type=int, default=20000000, help="Rows of the synthetic archive aggregated")
+    parser.add_argument("--users", type=int, default=20000, help="Distinct users of the synthetic archive")
+    parser.add_argument("--channels", type=int, default=50, help="Channels of the synthetic archive")
+    parser.add_argument("--export-rows", type=int, default=100000, help="Rows logged to SQLite and exported")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        print(f"Export of {args.export_rows} rows from SQLite")
+        storage = SQLiteStorage(os.path.join(temp_dir, "export.db"))
+        storage.initialize()
+        rng = random.Random(1)
+        for offset in range(0, args.export_rows, 1000):
+            storage.insert_messages([(f"user{rng.randrange(200)}", "a message of a few words", rng.uniform(4.0, 10.0),
+                                      1700000000.0 + offset + i, "Libera", f"#channel{rng.randrange(20)}")
+                                     for i in range(min(1000, args.export_rows - offset))])
+        time_call("export", lambda: export_archive(storage, os.path.join(temp_dir, "export")), args.export_rows, "rows")
+        time_call("export with text", lambda: export_archive(storage, os.path.join(temp_dir, "export"), with_text=True),
+                  args.export_rows, "rows")
+        storage.close()
+
+        print(f"Aggregation of {args.rows} rows, {args.users} users, {args.channels} channels")
+        path = os.path.join(temp_dir, "synthetic")
+        write_synthetic_archive(path, args.rows, args.users, args.channels)
+        archive = ColumnarArchive(path)
+        time_call("user_averages", archive.user_averages, args.rows, "rows")
+        time_call("channel averages", lambda: archive.user_averages(network="Libera", channel="#channel0"),
+                  args.rows, "rows")
+        time_call("one year", lambda: archive.user_averages(start="2021-01-01", end="2022-01-01"), args.rows, "rows")
+        time_call("grade_histogram", archive.grade_histogram, args.rows, "rows")
+        time_call("score_histogram", archive.score_histogram, args.rows, "rows")
+        time_call("user_percentiles", archive.user_percentiles, args.rows, "rows")
+        del archive
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+import dale_chall
+from irc_corpus import HARD_WORDS
+
+def generate_messages(count, seed=1):
+    """
+    Builds pre-filtered chat lines from the easy word list plus the corpus' hard words.
+
+    :param count: Number of messages to generate
+    :param seed: Random seed, so runs are comparable
+    :return: List of message strings
+    """
+    rng = random.Random(seed)
+    vocabulary = sorted(dale_chall.get_easy_words()) + HARD_WORDS * 20
+    messages = []
+    for _ in range(count):
+        words = rng.choices(vocabulary, k=rng.randint(1, 20))
+        text = ' '.join(words)
+        if rng.random() < 0.3:
+            text += rng.choice(['.', '?', '!']) + ' ' + ' '.join(rng.choices(vocabulary, k=rng.randint(3, 10)))
+        messages.append(text)
+    return messages
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare textstat and the built-in Dale-Chall engine.")
+    parser.add_argument("--messages", type=int, default=20000, help="Number of messages to score")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the generated messages")
+    args = parser.parse_args()
+
+    messages = generate_messages(args.messages, args.seed)
+
+    start = time.perf_counter()
+    native = dale_chall.score_many(messages, filter_words=False)
+    native_time = time.perf_counter() - start
+    print(f"score_many:        {len(messages) / native_time:12.0f} messages/s")
+
+    try:
+        import textstat
+    except ImportError:
+        print("textstat is not installed, skipping the comparison")
+        return
+
+    start = time.perf_counter()
+    reference = [textstat.dale_chall_readability_score(message) for message in messages]
+    textstat_time = time.perf_counter() - start
+    print(f"textstat per call: {len(messages) / textstat_time:12.0f} messages/s")
+    print(f"speedup:           {textstat_time / native_time:12.1f}x")
+
+    max_diff = max(abs(a - b) for a, b in zip(native, reference))
+    status = "OK" if max_diff <= dale_chall.TEXTSTAT_TOLERANCE else "OUT OF TOLERANCE"
+    print(f"max difference:    {max_diff:12.6f} ({status}, tolerance {dale_chall.TEXTSTAT_TOLERANCE})")
+
+if __name__ == "__main__":
+    main()
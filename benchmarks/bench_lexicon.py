@@ -0,0 +1,76 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+import dale_chall
+from irc_corpus import HARD_WORDS, generate_corpus
+from lexicon import Lexicon, build_lexicon, write_lexicon
+from readability_core import tokenize
+
+def time_lookups(check, tokens):
+    """
+    Looks every token up once.
+
+    :return: (lookups per second, set of the tokens found) tuple
+    """
+    start = time.perf_counter()
+    found = [check(token) for token in tokens]
+    elapsed = time.perf_counter() - start
+    return len(tokens) / elapsed, {token for token, valid in zip(tokens, found) if valid}
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare word lookups in the memory-mapped lexicon and in PyEnchant.")
+    parser.add_argument("word_lists", nargs="*",
+                        help="Dictionary word lists to compile, the easy and hard corpus words when omitted")
+    parser.add_argument("--jargon", help="Channel jargon allow-list compiled in as well")
+    parser.add_argument("--messages", type=int, default=50000, help="Generated messages whose tokens are looked up")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for the generated messages")
+    args = parser.parse_args()
+
+    tokens = [token for network, channel, nick, text in generate_corpus(args.messages, args.seed)
+              for token in tokenize(text)]
+    print(f"{len(tokens)} tokens, {len(set(tokens))} distinct, looked up without a word cache")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "lexicon.bin")
+        start = time.perf_counter()
+        if args.word_lists:
+            count = build_lexicon(path, args.word_lists, args.jargon)
+        else:
+            count = write_lexicon(path, dale_chall.get_easy_words() | set(HARD_WORDS))
+        print(f"build:             {time.perf_counter() - start:12.2f} s  ({count} words, "
+              f"{os.path.getsize(path)} bytes)")
+
+        start = time.perf_counter()
+        lexicon = Lexicon(path)
+        print(f"open:              {(time.perf_counter() - start) * 1e6:12.0f} us")
+        lexicon_rate, lexicon_found = time_lookups(lexicon.check, tokens)
+        print(f"lexicon:           {lexicon_rate:12.0f} lookups/s")
+
+        try:
+            import enchant
+        except ImportError:
+            print("PyEnchant is not installed, skipping the comparison")
+            lexicon.close()
+            return
+
+        start = time.perf_counter()
+        dictionary = enchant.Dict("en_US")
+        print(f"enchant load:      {(time.perf_counter() - start) * 1e6:12.0f} us")
+        enchant_rate, enchant_found = time_lookups(dictionary.check, tokens)
+        print(f"enchant:           {enchant_rate:12.0f} lookups/s")
+        print(f"speedup:           {lexicon_rate / enchant_rate:12.1f}x")
+
+        # Words only the lexicon accepts come from the easy list and the jargon, words only
+        # PyEnchant accepts are the misses the fallback still answers
+        print(f"lexicon only:      {len(lexicon_found - enchant_found):12d} distinct words")
+        print(f"fallback needed:   {len(enchant_found - lexicon_found):12d} distinct words")
+        lexicon.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+import argparse
+import datetime
+import importlib.util
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import fake_hexchat
+import storage as storage_module
+from irc_corpus import CORPUS_CONFIG, generate_corpus
+from readability_core import calculate_readability, filter_valid_words, score_cache, word_cache
+
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+# Benchmarks run by default, in this order
+BENCHMARKS = ["filter_valid_words", "calculate_readability", "on_message", "report", "on_message_db", "report_db"]
+
+class MemoryStorage(storage_module.Storage):
+    """Storage kept in Python lists and dictionaries, so the database plugin can be measured without any database."""
+
+    def __init__(self):
+        self.messages = []
+        self.totals = {}
+        self._lock = threading.Lock()
+
+    def initialize(self):
+        pass
+
+    def insert_messages(self, rows):
+        with self._lock:
+            for row in map(storage_module.with_location, rows):
+                self.messages.append((len(self.messages) + 1,) + row)
+            for network, channel, username, count, score_sum, score_sq_sum in storage_module.summarize_rows(rows):
+                total = self.totals.setdefault((network, channel, username), [0, 0.0, 0.0])
+                total[0] += count
+                total[1] += score_sum
+                total[2] += score_sq_sum
+
+    def user_averages(self, usernames=None, network=None, channel=None):
+        wanted = None if usernames is None else set(usernames)
+        sums = {}
+        with self._lock:
+            for (row_network, row_channel, username), (count, score_sum, _) in self.totals.items():
+                if (network is not None and row_network != network) or (channel is not None and row_channel != channel):
+                    continue
+                if wanted is not None and username not in wanted:
+                    continue
+                total = sums.setdefault(username, [0, 0.0])
+                total[0] += count
+                total[1] += score_sum
+        return [(username, score_sum / count, count) for username, (count, score_sum) in sums.items() if count]
+
+    def search_messages(self, user=None, keyword="", last_id=None, limit=200, network=None, channel=None):
+        terms = [' '.join(words).lower() for is_phrase, words in storage_module.parse_keyword(keyword)]
+        results = []
+        with self._lock:
+            for message_id, username, message, score, timestamp, row_network, row_channel in reversed(self.messages):
+                if last_id is not None and message_id >= last_id:
+                    continue
+                if user is not None and username != user:
+                    continue
+                if (network is not None and row_network != network) or (channel is not None and row_channel != channel):
+                    continue
+                if all(term in message.lower() for term in terms):
+                    results.append((message_id, username, message, score, storage_module.format_timestamp(timestamp),
+                                    row_network, row_channel))
+                    if len(results) >= limit:
+                        break
+        return results
+
+    def list_users(self, network=None, channel=None):
+        return sorted({username for row_network, row_channel, username in self.totals
+                       if (network is None or row_network == network) and (channel is None or row_channel == channel)})
+
+    def list_channels(self):
+        return sorted({(network, channel) for network, channel, username in self.totals})
+
+def summarize_latencies(latencies, elapsed=None):
+    """
+    Turns per-call latencies into the numbers saved with the results.
+
+    :param latencies: List of per-call latencies in nanoseconds
+    :param elapsed: Wall time of the whole run in seconds, the sum of the latencies by default
+    :return: Dictionary with count, mean, p50, p90, p99 and max in microseconds, and calls per second
+    """
+    if not latencies:
+        return {'count': 0}
+    ordered = sorted(latencies)
+    total = sum(ordered)
+    if elapsed is None:
+        elapsed = total / 1e9
+
+    def percentile(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] / 1000
+
+    return {
+        'count': len(ordered),
+        'mean_us': total / len(ordered) / 1000,
+        'p50_us': percentile(0.50),
+        'p90_us': percentile(0.90),
+        'p99_us': percentile(0.99),
+        'max_us': ordered[-1] / 1000,
+        'per_second': len(ordered) / elapsed if elapsed else 0.0,
+    }
+
+def time_calls(function, arguments):
+    """
+    Calls a function once per argument tuple and times every call.
+
+    :param function: Function to measure
+    :param arguments: Iterable of argument tuples
+    :return: Result of summarize_latencies
+    """
+    clock = time.perf_counter_ns
+    latencies = []
+    start = time.perf_counter()
+    for args in arguments:
+        before = clock()
+        function(*args)
+        latencies.append(clock() - before)
+    return summarize_latencies(latencies, time.perf_counter() - start)
+
+def load_plugin(file_name, config_dir):
+    """
+    Loads a plugin file as a fresh module against the fake hexchat module, and waits
+    for its warm-up, so the benchmarks time handling messages rather than buffering them.
+
+    :param file_name: Plugin file in the repository folder
+    :param config_dir: Folder get_info('configdir') points at
+    :return: The loaded module
+    """
+    fake_hexchat.reset()
+    fake_hexchat.install(configdir=config_dir)
+    path = os.path.join(REPO_DIR, file_name)
+    spec = importlib.util.spec_from_file_location(f"bench_{os.path.splitext(file_name)[0]}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    module.warm_up.wait()
+    fake_hexchat.run_timers()
+    return module
+
+def send_message(network, channel, nick, text):
+    """Delivers one channel message to the loaded plugin's hooks."""
+    fake_hexchat.info['network'] = network
+    fake_hexchat.info['channel'] = channel
+    fake_hexchat.emit_print("Channel Message", nick, text)
+
+def bench_filter_valid_words(corpus, args):
+    """Word filtering with a cold word cache, so lookups start at the dictionary."""
+    word_cache.clear()
+    result = time_calls(filter_valid_words, [(text,) for network, channel, nick, text in corpus])
+    result['word_cache'] = word_cache.stats()
+    return result
+
+def bench_calculate_readability(corpus, args):
+    """Scoring of whole messages, with the word cache warmed by the previous benchmark and a cold score cache."""
+    score_cache.clear()
+    result = time_calls(calculate_readability, [(text,) for network, channel, nick, text in corpus])
+    result['score_cache'] = score_cache.stats()
+    return result
+
+def bench_on_message(corpus, args, state):
+    """The in-memory plugin's Channel Message hook, which scores and updates the statistics inline."""
+    with tempfile.TemporaryDirectory() as config_dir:
+        plugin = load_plugin("hexchat_analyze.py", config_dir)
+        score_cache.clear()
+        result = time_calls(send_message, corpus)
+        result['score_cache'] = score_cache.stats()
+        state['plugin'] = plugin
+        fake_hexchat.unload()
+    return result
+
+def bench_report(corpus, args, state):
+    """The in-memory plugin's report timer, fired every report_every messages."""
+    plugin = state.get('plugin')
+    if plugin is None:
+        return {'skipped': "needs the on_message benchmark"}
+    plugin.changed_users.clear()
+    plugin.report_entries.clear()
+    clock = time.perf_counter_ns
+    latencies = []
+    for offset in range(0, len(corpus), args.report_every):
+        # Only the users of this slice changed since the previous report
+        for network, channel, nick, text in corpus[offset:offset + args.report_every]:
+            plugin.changed_users.add((network, channel, nick))
+        before = clock()
+        plugin.on_report_timer(None)
+        latencies.append(clock() - before)
+    result = summarize_latencies(latencies)
+    result['lines_printed'] = sum(1 for kind, tab, text in fake_hexchat.calls if kind == 'prnt')
+    return result
+
+def open_bench_storage(kind, config_dir):
+    """Creates the storage the database plugin is measured with."""
+    if kind == "memory":
+        return MemoryStorage()
+    return storage_module.SQLiteStorage(os.path.join(config_dir, "bench.db"))
+
+def wait_for_worker(worker):
+    """Waits until the worker has handled every message it accepted."""
+    while True:
+        stats = worker.stats()
+        if stats['processed'] + stats['errors'] + stats['dropped'] >= stats['submitted']:
+            return
+        time.sleep(0.005)
+
+def bench_on_message_db(corpus, args, state):
+    """
+    The database plugin's hook, which only queues the message, and the time its
+    worker and batched writer need to score and store everything that was queued.
+    """
+    config_dir = tempfile.mkdtemp(prefix="readability-bench-")
+    bench_storage = open_bench_storage(args.storage, config_dir)
+    open_storage = storage_module.open_storage
+    storage_module.open_storage = lambda config, db_config=None: bench_storage
+    try:
+        plugin = load_plugin("hexchat_analyze_DB.py", config_dir)
+    finally:
+        storage_module.open_storage = open_storage
+
+    score_cache.clear()
+    start = time.perf_counter()
+    result = time_calls(send_message, corpus)
+    wait_for_worker(plugin.worker)
+    plugin.writer.flush()
+    elapsed = time.perf_counter() - start
+
+    stats = plugin.worker.stats()
+    result['end_to_end_per_second'] = stats['processed'] / elapsed if elapsed else 0.0
+    result['worker'] = stats
+    result['writer'] = plugin.writer.stats()
+    result['score_cache'] = score_cache.stats()
+    result['storage'] = args.storage
+    state['plugin_db'] = plugin
+    state['config_dir'] = config_dir
+    return result
+
+def bench_report_db(corpus, args, state):
+    """The database plugin's report query and rendering, for report_every messages' worth of changed users."""
+    plugin = state.get('plugin_db')
+    if plugin is None:
+        return {'skipped': "needs the on_message_db benchmark"}
+    plugin.report_entries.clear()
+    arguments = []
+    for offset in range(0, len(corpus), args.report_every):
+        changes = {(network, channel, nick) for network, channel, nick, text in corpus[offset:offset + args.report_every]}
+        arguments.append((list(changes),))
+    return time_calls(plugin.build_report, arguments)
+
+def close_state(state):
+    """Stops the database plugin's threads and removes its temporary folder."""
+    plugin = state.pop('plugin_db', None)
+    if plugin is not None:
+        fake_hexchat.unload()
+    config_dir = state.pop('config_dir', None)
+    if config_dir is not None:
+        shutil.rmtree(config_dir, ignore_errors=True)
+
+BENCHMARK_FUNCTIONS = {
+    "filter_valid_words": lambda corpus, args, state: bench_filter_valid_words(corpus, args),
+    "calculate_readability": lambda corpus, args, state: bench_calculate_readability(corpus, args),
+    "on_message": bench_on_message,
+    "report": bench_report,
+    "on_message_db": bench_on_message_db,
+    "report_db": bench_report_db,
+}
+
+def git_commit():
+    """Returns the checked out commit, None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def print_results(results, previous=None):
+    """Prints one line per benchmark, with the change against a previous run if given."""
+    print(f"{'benchmark':24} {'calls':>8} {'p50 us':>10} {'p90 us':>10} {'p99 us':>10} {'max us':>10} {'calls/s':>12}")
+    for name, result in results.items():
+        if 'skipped' in result:
+            print(f"{name:24} skipped, {result['skipped']}")
+            continue
+        line = (f"{name:24} {result['count']:8d} {result['p50_us']:10.1f} {result['p90_us']:10.1f} "
+                f"{result['p99_us']:10.1f} {result['max_us']:10.1f} {result['per_second']:12.0f}")
+        before = (previous or {}).get(name)
+        if before and before.get('p50_us'):
+            line += f"  p50 {(result['p50_us'] / before['p50_us'] - 1) * 100:+.1f}%"
+            line += f", calls/s {(result['per_second'] / before['per_second'] - 1) * 100:+.1f}%"
+        print(line)
+        if 'end_to_end_per_second' in result:
+            print(f"{'':24} end to end {result['end_to_end_per_second']:.0f} messages/s, "
+                  f"{result['worker']['dropped']} dropped by the queue")
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the plugins offline against a synthetic IRC corpus.")
+    parser.add_argument("--messages", type=int, default=5000, help="Number of generated messages")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed of the corpus")
+    parser.add_argument("--nicks", type=int, default=CORPUS_CONFIG['nicks'], help="Distinct nicks in the corpus")
+    parser.add_argument("--slang-rate", type=float, default=CORPUS_CONFIG['slang_rate'], help="Share of slang words")
+    parser.add_argument("--nondict-rate", type=float, default=CORPUS_CONFIG['nondict_rate'],
+                        help="Share of typos, URLs, code and emoticons")
+    parser.add_argument("--repeat-rate", type=float, default=CORPUS_CONFIG['repeat_rate'],
+                        help="Share of messages repeating a bot or spam line")
+    parser.add_argument("--report-every", type=int, default=500, help="Messages between two reports")
+    parser.add_argument("--storage", choices=["sqlite", "memory"], default="sqlite",
+                        help="Storage the database plugin writes to")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, help="Benchmarks to run, all by default")
+    parser.add_argument("--output", help="JSON file the results are written to, a new file in benchmarks/results by default")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    args = parser.parse_args()
+
+    corpus = generate_corpus(args.messages, args.seed, nicks=args.nicks, slang_rate=args.slang_rate,
+                             nondict_rate=args.nondict_rate, repeat_rate=args.repeat_rate)
+
+    state = {}
+    results = {}
+    try:
+        for name in args.only or BENCHMARKS:
+            print(f"Running {name}...", file=sys.stderr)
+            results[name] = BENCHMARK_FUNCTIONS[name](corpus, args, state)
+    finally:
+        close_state(state)
+
+    previous = None
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as previous_file:
+            previous = json.load(previous_file)['results']
+    print_results(results, previous)
+
+    now = datetime.datetime.now()
+    output = args.output or os.path.join(RESULTS_DIR, f"plugin-{now:%Y%m%d-%H%M%S}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump({
+            'timestamp': now.isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'arguments': vars(args),
+            'corpus': dict(CORPUS_CONFIG, seed=args.seed, messages=args.messages, nicks=args.nicks,
+                           slang_rate=args.slang_rate, nondict_rate=args.nondict_rate),
+            'results': results,
+        }, output_file, indent=2)
+    print(f"Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+import argparse
+import datetime
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import POS_TAGS, MariaDBStorage, SQLiteStorage
+
+# Fixed rows the conformance checks know the answers for
+KNOWN_ROWS = [
+    ("alice", "the quick brown fox", 5.0, 1700000000.0, "Libera", "#python"),
+    ("alice", "jumps over the lazy dog", 7.0, 1700000060.0, "Libera", "#python"),
+    ("bob", "brown bread for breakfast", 6.0, 1700000120.0, "Libera", "#python"),
+    ("bob", "a lazy afternoon", 4.0, 1700000180.0, "OFTC", "#debian"),
+    ("carol", "quick question about the fox", 9.0, 1700000240.0, "OFTC", "#debian"),
+]
+
+WORDS = ["the", "quick", "brown", "fox", "lazy", "dog", "channel", "server", "message",
+         "network", "bread", "question", "answer", "today", "tomorrow", "python"]
+
+class Checker:
+    """Collects pass/fail results of the conformance checks."""
+
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, name, condition, detail=""):
+        print(f"  {'PASS' if condition else 'FAIL'}  {name}{'' if condition else ' ' + str(detail)}")
+        if not condition:
+            self.failures += 1
+
+def search_all(storage, user=None, keyword="", page_size=2, network=None, channel=None):
+    """Pages through a whole search and returns every row."""
+    rows = []
+    last_id = None
+    while True:
+        page = storage.search_messages(user, keyword, last_id, page_size, network, channel)
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+        last_id = page[-1][0]
+
+def check_conformance(storage):
+    """Runs the behaviour every backend must share against an empty database."""
+    checker = Checker()
+
+    storage.initialize()
+    storage.initialize()
+    checker.check("initialize can run twice", True)
+
+    storage.insert_messages([])
+    checker.check("empty insert is a no-op", storage.list_users() == [], storage.list_users())
+
+    storage.insert_messages(KNOWN_ROWS)
+    checker.check("list_users", storage.list_users() == ["alice", "bob", "carol"], storage.list_users())
+
+    averages = {username: (round(avg, 6), count) for username, avg, count in storage.user_averages()}
+    checker.check("user_averages for everyone",
+                  averages == {"alice": (6.0, 2), "bob": (5.0, 2), "carol": (9.0, 1)}, averages)
+    subset = storage.user_averages(["bob", "nobody"])
+    checker.check("user_averages for a subset", [row[0] for row in subset] == ["bob"], subset)
+    checker.check("user_averages for no users", storage.user_averages([]) == [])
+
+    storage.insert_messages([("alice", "one more", 9.0, 1700000300.0, "Libera", "#python")])
+    alice = storage.user_averages(["alice"])[0]
+    checker.check("totals accumulate across batches", (round(alice[1], 6), alice[2]) == (7.0, 3), alice)
+
+    channels = storage.list_channels()
+    checker.check("list_channels", channels == [("Libera", "#python"), ("OFTC", "#debian")], channels)
+    users = storage.list_users("OFTC", "#debian")
+    checker.check("list_users for a channel", users == ["bob", "carol"], users)
+    averages = {username: (round(avg, 6), count)
+                for username, avg, count in storage.user_averages(None, "Libera", "#python")}
+    checker.check("user_averages for a channel", averages == {"alice": (7.0, 3), "bob": (6.0, 1)}, averages)
+    bob = storage.user_averages(["bob"])[0]
+    checker.check("user_averages sums a user's channels", (round(bob[1], 6), bob[2]) == (5.0, 2), bob)
+
+    everything = search_all(storage)
+    ids = [row[0] for row in everything]
+    checker.check("empty keyword matches every message", len(everything) == len(KNOWN_ROWS) + 1, len(everything))
+    checker.check("results are newest first", ids == sorted(ids, reverse=True), ids)
+    checker.check("paging returns no duplicates", len(set(ids)) == len(ids), ids)
+
+    messages = sorted(row[2] for row in search_all(storage, keyword="fox"))
+    checker.check("word search", messages == ["quick question about the fox", "the quick brown fox"], messages)
+    messages = sorted(row[2] for row in search_all(storage, keyword="brea"))
+    checker.check("word prefix search", messages == ["brown bread for breakfast"], messages)
+    messages = sorted(row[2] for row in search_all(storage, keyword="lazy dog"))
+    checker.check("all words must match", messages == ["jumps over the lazy dog"], messages)
+    messages = sorted(row[2] for row in search_all(storage, keyword='"quick brown"'))
+    checker.check("phrase search", messages == ["the quick brown fox"], messages)
+    messages = sorted(row[2] for row in search_all(storage, user="bob", keyword="lazy"))
+    checker.check("search limited to a user", messages == ["a lazy afternoon"], messages)
+    checker.check("search without matches", search_all(storage, keyword="zebra") == [])
+    rows = search_all(storage, keyword="fox", network="OFTC", channel="#debian")
+    checker.check("search limited to a channel",
+                  [row[2:3] + row[5:] for row in rows] == [("quick question about the fox", "OFTC", "#debian")], rows)
+
+    latest = storage.latest_id()
+    checker.check("latest_id is the newest message", latest == max(ids), (latest, max(ids)))
+    storage.insert_messages([("bob", "another fox", 5.0, 1700000330.0, "OFTC", "#debian"),
+                             ("carol", "a fox again", 5.0, 1700000340.0, "OFTC", "#debian"),
+                             ("carol", "no match", 5.0, 1700000350.0, "OFTC", "#debian")])
+    rows = storage.search_messages(None, "fox", None, 10, "OFTC", "#debian", after_id=latest)
+    checker.check("search after an id returns new matches oldest first",
+                  [row[2] for row in rows] == ["another fox", "a fox again"], rows)
+    rows = storage.search_messages("carol", "", None, 1, after_id=latest)
+    checker.check("search after an id pages with the limit", [row[2] for row in rows] == ["a fox again"], rows)
+
+    storage.insert_messages([("dave", "an old spooled row", 6.0, 1700000360.0)])
+    dave = storage.user_averages(["dave"], "", "")
+    checker.check("rows without a channel are stored with an empty one", [row[0] for row in dave] == ["dave"], dave)
+
+    first = storage.messages_after(0, 3)
+    checker.check("messages_after reads the oldest messages first",
+                  [row[3:] for row in first] == [row[:2] for row in KNOWN_ROWS[:3]], first)
+    after = storage.messages_after(first[-1][0], 1)
+    checker.check("messages_after continues after an id", [row[4] for row in after] == [KNOWN_ROWS[3][1]], after)
+    checker.check("pos_last_id starts at 0", storage.pos_last_id() == 0, storage.pos_last_id())
+    counts = tuple(range(len(POS_TAGS)))
+    storage.add_pos_counts([("Libera", "#python", "alice", 10, counts), ("OFTC", "#debian", "alice", 5, counts)],
+                           first[-1][0], 0)
+    storage.add_pos_counts([("Libera", "#python", "alice", 1, counts)], after[-1][0], first[-1][0])
+    checker.check("add_pos_counts records progress", storage.pos_last_id() == after[-1][0], storage.pos_last_id())
+    stale = storage.add_pos_counts([("Libera", "#python", "alice", 1, counts)], after[-1][0], first[-1][0])
+    checker.check("add_pos_counts skips a batch counted elsewhere", stale is False, stale)
+    profiles = storage.pos_profiles()
+    checker.check("pos_profiles sums a user's channels",
+                  profiles == [("alice", 16, tuple(3 * count for count in counts))], profiles)
+    profiles = storage.pos_profiles(["alice", "bob"], "Libera", "#python")
+    checker.check("pos_profiles for a channel", profiles == [("alice", 11, tuple(2 * count for count in counts))],
+                  profiles)
+
+    counted = {row[0]: row[2] for row in storage.user_averages()}
+    for period in ("hour", "day", "week", "month"):
+        trend = storage.score_trend(1690000000, 1710000000, period)
+        totals = {}
+        for bucket, username, avg_score, msg_count, stddev in trend:
+            totals[username] = totals.get(username, 0) + msg_count
+        checker.check(f"{period} trend counts every message", totals == counted, (totals, counted))
+    buckets = [row[0] for row in storage.score_trend(1690000000, 1710000000, "day", per_user=False)]
+    checker.check("trend is ordered by bucket", buckets == sorted(set(buckets)), buckets)
+    trend = storage.score_trend(1690000000, 1710000000, "month", ["alice"], "Libera", "#python", per_user=False)
+    msg_count = sum(row[3] for row in trend)
+    avg_score = sum(row[2] * row[3] for row in trend) / msg_count if msg_count else None
+    checker.check("trend for a user in a channel",
+                  {row[1] for row in trend} == {None} and (round(avg_score, 6), msg_count) == (7.0, 3), trend)
+    trend = storage.score_trend(1690000000, 1699990000, "hour", ["carol"], "OFTC", "#debian")
+    checker.check("trend ending before a user's first message is empty", trend == [], trend)
+    storage.insert_messages([("erin", "steady", 4.0, 1700000400.0, "EFnet", "#trend"),
+                             ("erin", "steady", 8.0, 1700000410.0, "EFnet", "#trend")])
+    trend = storage.score_trend(1700000000, 1700001000, "day", network="EFnet", channel="#trend")
+    checker.check("trend averages and deviation",
+                  [(row[1], round(row[2], 6), row[3], round(row[4], 6)) for row in trend] == [("erin", 6.0, 2, 2.0)],
+                  trend)
+    checker.check("trend for no users", storage.score_trend(1690000000, 1710000000, usernames=[]) == [])
+
+    return checker.failures
+
+def check_migration(storage, create_old_schema):
+    """
+    Checks that initialize() upgrades a database created before messages had a network and channel,
+    and merges the nicks older plugins stored with their color.
+
+    :param storage: Storage backend on an empty database
+    :param create_old_schema: Callable creating the old tables with one message through the backend's connection
+    """
+    checker = Checker()
+    create_old_schema(storage)
+    storage.initialize()
+    averages = storage.user_averages(None, "", "")
+    checker.check("old messages are counted with an empty channel",
+                  [(row[0], round(row[1], 6), row[2]) for row in averages] == [("alice", 5.0, 1)], averages)
+    storage.insert_messages(KNOWN_ROWS[:1])
+    checker.check("new rows are counted per channel", storage.list_channels() == [("", ""), ("Libera", "#python")],
+                  storage.list_channels())
+    trend = storage.score_trend(time.time() - 2 * 86400, time.time() + 86400, "day", None, "", "")
+    checker.check("rollups are filled from the old messages", [(row[1], row[3]) for row in trend] == [("alice", 1)],
+                  trend)
+    rows = search_all(storage, keyword="hello")
+    checker.check("old messages are found by search", [row[2] for row in rows] == ["hello"], rows)
+
+    # Older plugins stored nicks with HexChat's nick color
+    storage.insert_messages([("\x0304alice", "colored nick", 9.0, KNOWN_ROWS[0][3] + 1, "Libera", "#python")])
+    storage.initialize()
+    averages = storage.user_averages(["alice"], "Libera", "#python")
+    checker.check("colored nicks are merged into the plain nick", storage.list_users() == ["alice"]
+                  and [(row[0], round(row[1], 6), row[2]) for row in averages] == [("alice", 7.0, 2)],
+                  (storage.list_users(), averages))
+    return checker.failures
+
+def check_dedupe(storage, count_texts):
+    """
+    Checks that with dedupe_texts repeated texts are stored once and still read back in full.
+
+    :param storage: Storage backend with dedupe_texts on, already initialized
+    :param count_texts: Callable returning the number of rows in message_texts
+    """
+    checker = Checker()
+    before = count_texts(storage)
+    spam = "buy cheap followers now"
+    storage.insert_messages([("spambot", spam, 3.0, 1700001000.0 + i, "Libera", "#python") for i in range(3)])
+    storage.insert_messages([("spambot", spam, 3.0, 1700001010.0, "Libera", "#python")])
+    checker.check("a repeated text is stored once", count_texts(storage) == before + 1, count_texts(storage))
+    rows = search_all(storage, user="spambot", keyword="followers")
+    checker.check("deduplicated messages are found and read back", [row[2] for row in rows] == [spam] * 4, rows)
+    return checker.failures
+
+def check_retention(storage, count_texts):
+    """
+    Checks that archive_messages moves old messages into the monthly archives without changing the totals.
+
+    :param storage: Storage backend, already initialized and holding no messages before 2021
+    :param count_texts: Callable returning the number of rows in message_texts
+    """
+    checker = Checker()
+    texts = count_texts(storage)
+    long_text = "the quick brown fox jumps over the lazy dog " * 4
+    september = [("frank", long_text if i % 2 else f"short note {i}", 5.0 + i, 1600000000.0 + i * 60, "Libera", "#archive")
+                 for i in range(5)]
+    october = [("frank", f"october note {i}", 8.0, 1602500000.0 + i * 60, "Libera", "#archive") for i in range(3)]
+    storage.insert_messages(september + october)
+    averages = storage.user_averages(None, "Libera", "#archive")
+    trend = storage.score_trend(1590000000, 1610000000, "month", network="Libera", channel="#archive")
+
+    moved = []
+    while not moved or moved[-1][0] == 2:
+        moved.append(storage.archive_messages(1601000000, 2, "compress"))
+    checker.check("archive_messages moves old messages in batches", [batch[0] for batch in moved] == [2, 2, 1],
+                  moved)
+    checker.check("archive_messages reports the bytes it moved", sum(batch[1] for batch in moved) > 0
+                  and 0 < sum(batch[2] for batch in moved) < sum(batch[1] for batch in moved), moved)
+    archived = storage.archived_messages("202009")
+    checker.check("archived messages are read back in full",
+                  [row[1:4] for row in archived] == [row[:3] for row in september], archived)
+    later = storage.archived_messages("202009", archived[2][0])
+    checker.check("archived messages page by id", later == archived[3:], later)
+    storage.archive_messages(1650000000, 100, "drop-text")
+    archived = storage.archived_messages("202010")
+    checker.check("drop-text keeps only the scores", [(row[2], row[3]) for row in archived] == [(None, 8.0)] * 3,
+                  archived)
+    checker.check("list_archives", [month for month in storage.list_archives() if month < "2021"] == ["202009", "202010"],
+                  storage.list_archives())
+
+    rows = search_all(storage, network="Libera", channel="#archive")
+    checker.check("archived messages leave messages", rows == [], rows)
+    rows = search_all(storage, keyword="october")
+    checker.check("archived messages leave the search index", rows == [], rows)
+    checker.check("archived texts are released", count_texts(storage) == texts, (count_texts(storage), texts))
+    checker.check("averages still count archived messages",
+                  storage.user_averages(None, "Libera", "#archive") == averages, averages)
+    checker.check("trends still count archived messages",
+                  storage.score_trend(1590000000, 1610000000, "month", network="Libera", channel="#archive") == trend,
+                  trend)
+    checker.check("newer messages are kept", storage.archive_messages(1650000000, 100, "delete")[0] == 0)
+    return checker.failures
+
+def check_backfill(storage):
+    """
+    Checks that backfill_logs.py loads every log line except the ones the plugin stored already.
+
+    :param storage: Storage backend, already initialized and holding nothing for Libera #backfill
+    """
+    import types
+    from concurrent.futures import ThreadPoolExecutor
+    from backfill_logs import STAMP_FORMAT, backfill_file
+
+    checker = Checker()
+    try:
+        # The backfill scores the lines it loads
+        import enchant
+    except ImportError:
+        print("  SKIP  backfill checks, PyEnchant is not installed")
+        return checker.failures
+    day = lambda number: datetime.datetime(2026, 1, number, 12, 0, 0)
+    # The plugin was loaded on January 5th only, its clock a second ahead of the log's
+    storage.insert_messages([("alice", "note for day 5", 5.0, day(5).timestamp() + 1, "Libera", "#backfill")])
+    args = types.SimpleNamespace(stamp_format=STAMP_FORMAT, processes=1, batch_size=10, chunk_size=4,
+                                 batch_scoring=False)
+    with tempfile.TemporaryDirectory() as temp_dir, ThreadPoolExecutor(1) as executor:
+        path = os.path.join(temp_dir, "#backfill.log")
+        with open(path, 'w', encoding='utf-8') as log_file:
+            log_file.write(f"**** BEGIN LOGGING AT {day(1):%a %b %d %H:%M:%S %Y}\n")
+            log_file.writelines(f"{day(number):{STAMP_FORMAT}} <alice>\tnote for day {number}\n"
+                                for number in range(1, 29))
+        checkpoints = []
+        loaded = backfill_file(storage, executor, "Libera", "#backfill", path, {}, args, checkpoints.append)
+        checker.check("backfill skips only the lines the plugin stored", loaded == 27, loaded)
+        with open(path, 'a', encoding='utf-8') as log_file:
+            log_file.write(f"{day(29):{STAMP_FORMAT}} <alice>\tnote for day 29\n")
+        loaded = backfill_file(storage, executor, "Libera", "#backfill", path, checkpoints[-1], args,
+                               checkpoints.append)
+        checker.check("backfill loads new lines on the next run", loaded == 1, loaded)
+    rows = search_all(storage, network="Libera", channel="#backfill", page_size=100)
+    texts = sorted(row[2] for row in rows)
+    expected = sorted(f"note for day {number}" for number in range(1, 30))
+    checker.check("backfill stores every day once", texts == expected, texts)
+    return checker.failures
+
+def check_sqlite_fts_rebuild(path):
+    """
+    Checks that an SQLite database from before the full-text index gets its old messages indexed,
+    deduplicated ones included, and that they still leave the index when deleted.
+
+    :param path: Database file that doesn't exist yet
+    """
+    checker = Checker()
+    storage = SQLiteStorage(path, dedupe_texts=True)
+    storage.initialize()
+    storage.insert_messages([("dave", text, 4.0, 1700002000.0 + i, "Libera", "#fts")
+                             for i, text in enumerate(["index me later", "index me later", "plain words"])])
+    with storage.connect() as conn:
+        for trigger in ("messages_fts_insert", "messages_fts_delete", "messages_fts_update"):
+            conn.execute(f"DROP TRIGGER {trigger}")
+        conn.execute("DROP TABLE messages_fts")
+    storage.close()
+
+    storage = SQLiteStorage(path, dedupe_texts=True)
+    storage.initialize()
+    rows = search_all(storage, keyword="later")
+    checker.check("messages from before the index are found", [row[2] for row in rows] == ["index me later"] * 2,
+                  rows)
+    rows = search_all(storage, keyword="plain")
+    checker.check("plain messages from before the index are found", [row[2] for row in rows] == ["plain words"], rows)
+    with storage.connect() as conn:
+        try:
+            conn.execute("DELETE FROM messages WHERE channel = '#fts'")
+            conn.execute("INSERT INTO messages_fts (messages_fts, rank) VALUES ('integrity-check', 1)")
+        except sqlite3.DatabaseError as e:
+            checker.check("rebuilt index survives deletes", False, e)
+        else:
+            checker.check("rebuilt index survives deletes", True)
+    checker.check("deleted messages leave the rebuilt index", search_all(storage, keyword="later") == [])
+    storage.close()
+    return checker.failures
+
+def count_sqlite_texts(storage):
+    """Counts the rows of message_texts in an SQLite database."""
+    return storage.connect().execute("SELECT COUNT(*) FROM message_texts").fetchone()[0]
+
+def count_mariadb_texts(storage):
+    """Counts the rows of message_texts in a MariaDB database."""
+    def work(cursor):
+        cursor.execute("SELECT COUNT(*) FROM message_texts")
+        return cursor.fetchone()[0]
+    return storage._run(work)
+
+def create_old_sqlite_schema(storage):
+    """Creates the messages and user_stats tables the way SQLite databases had them before channels."""
+    with storage.connect() as conn:
+        conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT NOT NULL, "
+                     "message TEXT NOT NULL, readability_score REAL, timestamp TEXT DEFAULT CURRENT_TIMESTAMP)")
+        conn.execute("CREATE TABLE user_stats (username TEXT NOT NULL PRIMARY KEY, msg_count INTEGER NOT NULL DEFAULT 0, "
+                     "score_sum REAL NOT NULL DEFAULT 0, score_sq_sum REAL NOT NULL DEFAULT 0)")
+        conn.execute("INSERT INTO messages (username, message, readability_score) VALUES ('alice', 'hello', 5.0)")
+        conn.execute("INSERT INTO user_stats VALUES ('alice', 1, 5.0, 25.0)")
+
+def run_performance(storage, rows, batch_size, span_days=365, seed=1):
+    """Times batched inserts, aggregate reads, searches and trends, the rows spread over span_days."""
+    rng = random.Random(seed)
+    users = [f"user{i}" for i in range(200)]
+    channels = [("Libera", f"#channel{i}") for i in range(20)]
+    start_time = 1700000000.0
+    spacing = span_days * 86400.0 / rows
+
+    start = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        storage.insert_messages([
+            (rng.choice(users), ' '.join(rng.choices(WORDS, k=rng.randint(3, 15))),
+             rng.uniform(4.0, 10.0), start_time + (offset + i) * spacing) + rng.choice(channels)
+            for i in range(min(batch_size, rows - offset))
+        ])
+    elapsed = time.perf_counter() - start
+    print(f"  insert:         {rows / elapsed:10.0f} rows/s (batches of {batch_size})")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        storage.user_averages(rng.sample(users, 20))
+    print(f"  user_averages:  {(time.perf_counter() - start) * 10:10.2f} ms per 20-user report")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        storage.search_messages(None, rng.choice(WORDS), None, 200)
+    print(f"  search:         {(time.perf_counter() - start) * 10:10.2f} ms per first page")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        storage.search_messages(None, rng.choice(WORDS), None, 200, *rng.choice(channels))
+    print(f"  channel search: {(time.perf_counter() - start) * 10:10.2f} ms per first page")
+
+    end_time = start_time + span_days * 86400.0
+    start = time.perf_counter()
+    for _ in range(100):
+        storage.score_trend(start_time, end_time, "day", None, *rng.choice(channels), per_user=False)
+    print(f"  channel trend:  {(time.perf_counter() - start) * 10:10.2f} ms per {span_days}-day daily trend")
+
+    start = time.perf_counter()
+    for _ in range(100):
+        storage.score_trend(start_time, end_time, "week", [rng.choice(users)])
+    print(f"  user trend:     {(time.perf_counter() - start) * 10:10.2f} ms per {span_days}-day weekly trend")
+
+    start = time.perf_counter()
+    moved = removed = 0
+    while True:
+        count, batch_removed, archived = storage.archive_messages(start_time + span_days * 43200.0, 1000, "compress")
+        moved += count
+        removed += batch_removed
+        if count < 1000:
+            break
+    elapsed = time.perf_counter() - start
+    print(f"  archive:        {moved / elapsed if elapsed else 0:10.0f} rows/s ({moved} rows, "
+          f"{removed / 1024:.0f} KiB of text, batches of 1000)")
+
+def main():
+    parser = argparse.ArgumentParser(description="Conformance and performance checks for the storage backends.")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows inserted by the performance run")
+    parser.add_argument("--batch-size", type=int, default=200, help="Rows per insert batch")
+    parser.add_argument("--span-days", type=int, default=365, help="Days the performance run's rows are spread over")
+    parser.add_argument("--mariadb", action="store_true",
+                        help="Also check MariaDB. Use an empty scratch database, the checks write to it")
+    parser.add_argument("--dedupe-texts", action="store_true", help="Check MariaDB with dedupe_texts on")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--user", default="")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--database", default="readability_analyzer_check")
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        print("SQLite conformance")
+        storage = SQLiteStorage(os.path.join(temp_dir, "conformance.db"))
+        failures += check_conformance(storage)
+        failures += check_retention(storage, count_sqlite_texts)
+        failures += check_backfill(storage)
+        storage.close()
+
+        print("SQLite conformance with dedupe_texts")
+        storage = SQLiteStorage(os.path.join(temp_dir, "dedupe.db"), dedupe_texts=True)
+        failures += check_conformance(storage)
+        failures += check_dedupe(storage, count_sqlite_texts)
+        failures += check_retention(storage, count_sqlite_texts)
+        storage.close()
+        failures += check_sqlite_fts_rebuild(os.path.join(temp_dir, "fts_rebuild.db"))
+
+        print("SQLite migration")
+        storage = SQLiteStorage(os.path.join(temp_dir, "migration.db"))
+        failures += check_migration(storage, create_old_sqlite_schema)
+        storage.close()
+
+        print("SQLite performance")
+        storage = SQLiteStorage(os.path.join(temp_dir, "performance.db"))
+        storage.initialize()
+        run_performance(storage, args.rows, args.batch_size, args.span_days)
+        storage.close()
+
+    if args.mariadb:
+        db_config = {'host': args.host, 'user': args.user, 'password': args.password, 'database': args.database}
+        print("MariaDB conformance")
+        storage = MariaDBStorage(db_config, pool_name="readability_check", dedupe_texts=args.dedupe_texts)
+        failures += check_conformance(storage)
+        if args.dedupe_texts:
+            failures += check_dedupe(storage, count_mariadb_texts)
+        failures += check_retention(storage, count_mariadb_texts)
+        failures += check_backfill(storage)
+        print("MariaDB performance")
+        run_performance(storage, args.rows, args.batch_size, args.span_days)
+        storage.close()
+
+    print("All checks passed" if not failures else f"{failures} checks failed")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+# Stand-in for the hexchat module, which only exists inside HexChat.
+# It implements the calls the plugins make, records every prnt() and command(),
+# and keeps the hooks so a benchmark can drive them directly. install() puts it
+# in sys.modules before a plugin is loaded.
+import sys
+
+EAT_NONE = 0
+EAT_HEXCHAT = 1
+EAT_PLUGIN = 2
+EAT_ALL = 3
+
+PRI_NORM = 0
+
+# Values returned by get_info(), changed with set_info()
+info = {
+    'configdir': '.',
+    'network': 'BenchNet',
+    'channel': '#bench',
+    'nick': 'bench',
+    'version': '2.16.2',
+}
+
+# Every prnt() and command() made by the plugin, as (kind, context name, text) tuples
+calls = []
+
+# Registered hooks, as lists of (callback, userdata)
+print_hooks = {}
+command_hooks = {}
+timer_hooks = []
+unload_hooks = []
+
+class Context:
+    """A tab, as returned by find_context() and get_context()."""
+
+    def __init__(self, channel):
+        self.channel = channel
+
+    def prnt(self, text):
+        calls.append(('prnt', self.channel, text))
+
+    def command(self, command):
+        calls.append(('command', self.channel, command))
+
+    def get_info(self, name):
+        return self.channel if name == 'channel' else get_info(name)
+
+# Tabs opened so far, by name
+contexts = {}
+
+def prnt(text):
+    calls.append(('prnt', info['channel'], text))
+
+def command(text):
+    calls.append(('command', info['channel'], text))
+    if text.startswith("NEWSERVER"):
+        name = text.split()[-1]
+        contexts.setdefault(name, Context(name))
+
+def get_info(name):
+    return info.get(name)
+
+def set_info(**values):
+    """Changes the values get_info() returns, e.g. the current network and channel."""
+    info.update(values)
+
+def find_context(server=None, channel=None):
+    # Report tabs are server tabs that never connect, named after their server
+    return contexts.get(channel if channel is not None else server)
+
+def get_context():
+    return contexts.setdefault(info['channel'], Context(info['channel']))
+
+def hook_print(name, callback, userdata=None, priority=PRI_NORM):
+    print_hooks.setdefault(name, []).append((callback, userdata))
+    return (name, callback)
+
+def hook_command(name, callback, userdata=None, priority=PRI_NORM, help=None):
+    command_hooks.setdefault(name.upper(), []).append((callback, userdata))
+    return (name, callback)
+
+def hook_timer(timeout, callback, userdata=None):
+    timer_hooks.append((callback, userdata))
+    return (timeout, callback)
+
+def hook_unload(callback, userdata=None):
+    unload_hooks.append((callback, userdata))
+    return ('unload', callback)
+
+def unhook(handle):
+    pass
+
+def emit_print(name, *word):
+    """Calls the print hooks of an event the way HexChat would, returns the last hook's result."""
+    result = EAT_NONE
+    for callback, userdata in print_hooks.get(name, []):
+        result = callback(list(word), [' '.join(word[i:]) for i in range(len(word))], userdata)
+    return result
+
+def run_command(text):
+    """Runs a /COMMAND registered by the plugin."""
+    word = text.split()
+    for callback, userdata in command_hooks.get(word[0].upper(), []):
+        callback(word, [' '.join(word[i:]) for i in range(len(word))], userdata)
+
+def run_timers():
+    """Fires every timer once."""
+    for callback, userdata in list(timer_hooks):
+        callback(userdata)
+
+def unload():
+    """Calls the unload hooks, as /py unload would."""
+    for callback, userdata in unload_hooks:
+        callback(userdata)
+
+def reset():
+    """Forgets all hooks, calls and tabs, so another plugin can be loaded."""
+    del calls[:]
+    print_hooks.clear()
+    command_hooks.clear()
+    del timer_hooks[:]
+    del unload_hooks[:]
+    contexts.clear()
+
+def install(**values):
+    """Registers this module as 'hexchat' so plugins can import it, and sets get_info() values."""
+    set_info(**values)
+    sys.modules['hexchat'] = sys.modules[__name__]
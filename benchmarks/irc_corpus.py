@@ -0,0 +1,123 @@
+import os
+import random
+import string
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import dale_chall
+
+# Chat shorthand, mostly rejected by the dictionary
+SLANG = ["lol", "lmao", "brb", "afk", "imo", "imho", "tbh", "idk", "afaik", "iirc", "ty", "thx",
+         "np", "omg", "wtf", "btw", "fwiw", "ikr", "smh", "gg", "rofl", "ya", "u", "ur", "pls", "nvm"]
+
+# Words outside the easy list, so some messages score as difficult
+HARD_WORDS = ["analysis", "configuration", "deprecated", "implementation", "latency", "throughput",
+              "protocol", "repository", "synchronous", "volatile", "kernel", "compiler", "regression",
+              "certificate", "bandwidth", "dependency", "encryption", "hypothesis", "legislation"]
+
+EMOTICONS = [":)", ":(", ":D", ";)", ":P", "xD", "<3", "o/", "\\o/", "^^"]
+
+# Defaults of the generated corpus
+CORPUS_CONFIG = {
+    'nicks': 300,               # Distinct nicks
+    'nick_skew': 1.1,           # Zipf exponent of how often each nick talks, higher means a few nicks dominate
+    'mean_words': 9,            # Average words per message
+    'max_words': 60,            # Longest message
+    'hard_rate': 0.05,          # Share of words outside the easy list
+    'slang_rate': 0.08,         # Share of words that are chat slang
+    'nondict_rate': 0.04,       # Share of words that are typos, URLs, code or emoticons
+    'sentence_rate': 0.25,      # Chance of a message holding a second sentence
+    'repeat_rate': 0.05,        # Share of messages repeating a line verbatim, like bot output or flood spam
+    'repeat_lines': 20,         # Distinct lines those repeats are drawn from
+    'channels': [("BenchNet", "#general"), ("BenchNet", "#python"), ("OtherNet", "#linux")]
+}
+
+class CorpusGenerator:
+    """
+    Seeded generator of synthetic IRC traffic.
+
+    Nicks talk with a Zipf-like frequency, message lengths follow a geometric
+    distribution around mean_words, and words are drawn from the Dale-Chall easy
+    list mixed with hard words, slang and tokens no dictionary knows. A share of
+    messages repeats a small pool of lines verbatim, the way bots and spammers do.
+    """
+
+    def __init__(self, seed=1, **config):
+        """
+        :param seed: Random seed, the same seed always gives the same corpus
+        :param config: Overrides of CORPUS_CONFIG
+        """
+        self.config = dict(CORPUS_CONFIG, **config)
+        self.rng = random.Random(seed)
+        self.easy_words = sorted(dale_chall.get_easy_words())
+        self.nicks = [self._nick(i) for i in range(self.config['nicks'])]
+        self.nick_weights = [1.0 / (rank + 1) ** self.config['nick_skew'] for rank in range(len(self.nicks))]
+        self.repeat_lines = [self.message() for _ in range(self.config['repeat_lines'])]
+
+    def _nick(self, index):
+        stem = ''.join(self.rng.choices(string.ascii_lowercase, k=self.rng.randint(3, 9)))
+        suffix = self.rng.choice(["", "", "", "_", "|away", str(index)])
+        return stem + suffix
+
+    def nondict_word(self):
+        """Returns a token no dictionary knows: a typo, a URL, a code fragment or an emoticon."""
+        kind = self.rng.random()
+        if kind < 0.4:
+            word = list(self.rng.choice(self.easy_words))
+            position = self.rng.randrange(len(word))
+            word[position] = self.rng.choice(string.ascii_lowercase)
+            return ''.join(word) + self.rng.choice(string.ascii_lowercase)
+        if kind < 0.6:
+            host = ''.join(self.rng.choices(string.ascii_lowercase, k=self.rng.randint(4, 10)))
+            return f"https://{host}.example.org/{self.rng.randint(1, 99999)}"
+        if kind < 0.8:
+            return self.rng.choice(["foo()", "x=1", "./configure", "--help", "0xdeadbeef", "sys.path", "$HOME"])
+        return self.rng.choice(EMOTICONS)
+
+    def word(self):
+        """Draws one word with the configured mix of easy, hard, slang and non-dictionary words."""
+        roll = self.rng.random()
+        config = self.config
+        if roll < config['nondict_rate']:
+            return self.nondict_word()
+        roll -= config['nondict_rate']
+        if roll < config['slang_rate']:
+            return self.rng.choice(SLANG)
+        roll -= config['slang_rate']
+        if roll < config['hard_rate']:
+            return self.rng.choice(HARD_WORDS)
+        return self.rng.choice(self.easy_words)
+
+    def message(self):
+        """Returns the text of one message."""
+        config = self.config
+        count = min(config['max_words'], 1 + int(self.rng.expovariate(1.0 / max(config['mean_words'] - 1, 1))))
+        text = ' '.join(self.word() for _ in range(count))
+        if self.rng.random() < config['sentence_rate']:
+            text += self.rng.choice(['.', '?', '!']) + ' ' + ' '.join(
+                self.word() for _ in range(self.rng.randint(2, 8)))
+        return text
+
+    def generate(self, count):
+        """
+        Generates a list of messages.
+
+        :param count: Number of messages
+        :return: List of (network, channel, nick, text) tuples
+        """
+        nicks = self.rng.choices(self.nicks, weights=self.nick_weights, k=count)
+        channels = self.config['channels']
+        repeat_rate = self.config['repeat_rate']
+        return [self.rng.choice(channels) + (nick, self.rng.choice(self.repeat_lines)
+                                             if self.rng.random() < repeat_rate else self.message())
+                for nick in nicks]
+
+def generate_corpus(count, seed=1, **config):
+    """
+    Shortcut for CorpusGenerator(seed, **config).generate(count).
+
+    :param count: Number of messages
+    :param seed: Random seed
+    :return: List of (network, channel, nick, text) tuples
+    """
+    return CorpusGenerator(seed, **config).generate(count)
@@ -0,0 +1,477 @@
+import argparse
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from readability_core import channel_label, score_to_grade_level
+from storage import StorageError, open_storage
+
+# Storage configuration for exporting, same settings as the plugin
+STORAGE_CONFIG = {
+    'backend': 'mariadb',       # 'mariadb' or 'sqlite'
+    'sqlite_path': None         # SQLite database file, the one in HexChat's config folder by default
+}
+
+# Database configuration
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'UserNameHere',     # Replace with your MariaDB username
+    'password': 'PassWordHere', # Replace with your MariaDB password
+    'database': 'readability_analyzer' # Replace with your database name
+}
+
+# Version of the archive layout written to manifest.json
+ARCHIVE_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+
+# Rows read from the database per query while exporting
+EXPORT_CHUNK = 50000
+
+# Rows aggregated at a time, bounding the memory a query over a memory-mapped column takes
+SCAN_CHUNK = 4 * 1024 * 1024
+
+# Upper bounds of score_to_grade_level's grades, the last grade has none
+GRADE_BOUNDS = np.array([4.9, 5.9, 6.9, 7.9, 8.9])
+GRADE_LEVELS = [score_to_grade_level(bound) for bound in GRADE_BOUNDS] + [score_to_grade_level(float('inf'))]
+
+def code_dtype(size):
+    """Returns the narrowest unsigned integer type holding codes for a dictionary of some size."""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if size <= np.iinfo(dtype).max + 1:
+            return dtype
+    return np.uint64
+
+def to_datetime64(timestamps):
+    """
+    Converts timestamps as the backends return them ("YYYY-MM-DD HH:MM:SS" strings from
+    SQLite, naive datetimes from MariaDB, both local time) to datetime64 seconds.
+    """
+    return np.array([timestamp if timestamp is not None else "NaT" for timestamp in timestamps], dtype='datetime64[s]')
+
+def is_archive(path):
+    """Returns True if a folder holds a manifest.json written by ArchiveWriter."""
+    try:
+        with open(os.path.join(path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return isinstance(manifest, dict) and 'format' in manifest and 'rows' in manifest
+
+class ArchiveWriter:
+    """
+    Writes a columnar archive: a folder of .npy column files, one row per message.
+
+    Columns are appended chunk by chunk to raw files and turned into .npy files by
+    close(), once the row count and the size of the username and channel
+    dictionaries are known. Usernames and channels are dictionary-encoded with the
+    narrowest integer type that fits, scores are float32 (NaN where missing) and
+    timestamps are local datetime64 seconds, so a row takes 10 to 20 bytes plus its
+    text when texts are exported.
+
+    The archive is written to a temporary folder next to the destination and moved
+    into place by close(), so an export that fails leaves the previous archive as it
+    was. Only an empty folder or an earlier archive is ever replaced.
+    """
+
+    # Column name, dtype while streaming
+    COLUMNS = (("id", np.int64), ("timestamp", 'datetime64[s]'), ("score", np.float32),
+               ("username", np.uint32), ("channel", np.uint32))
+
+    def __init__(self, path, with_text=False):
+        """
+        :param path: Archive folder, created, or replaced if it's empty or holds an archive
+        :param with_text: Also store the message texts, as UTF-8 bytes with an offsets column
+        :raises ValueError: If the path exists and is anything but an empty folder or an archive
+        """
+        if os.path.exists(path) and not (os.path.isdir(path) and (not os.listdir(path) or is_archive(path))):
+            raise ValueError(f"{path} exists and is not a readability archive, refusing to replace it")
+        self.destination = path
+        self.with_text = with_text
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        self.path = tempfile.mkdtemp(prefix=f".{os.path.basename(os.path.abspath(path))}.", dir=parent)
+        self.rows = 0
+        self.usernames = {}
+        self.channels = {}
+        self._raw = {name: open(self._raw_path(name), 'wb') for name, dtype in self.COLUMNS}
+        self._text = open(os.path.join(self.path, "text.bin"), 'wb') if with_text else None
+        self._text_offsets = [np.zeros(1, dtype=np.uint64)] if with_text else None
+        self._text_size = 0
+
+    def _raw_path(self, name):
+        return os.path.join(self.path, name + ".raw")
+
+    def add(self, rows):
+        """
+        Appends a chunk of rows.
+
+        :param rows: List of (id, username, message, readability_score, timestamp, network, channel) rows,
+                     the order Storage.search_messages returns
+        """
+        if not rows:
+            return
+        count = len(rows)
+        columns = {
+            "id": np.fromiter((row[0] for row in rows), np.int64, count),
+            "timestamp": to_datetime64([row[4] for row in rows]),
+            "score": np.fromiter((np.nan if row[3] is None else row[3] for row in rows), np.float32, count),
+            "username": np.fromiter((self.usernames.setdefault(row[1], len(self.usernames)) for row in rows),
+                                    np.uint32, count),
+            "channel": np.fromiter((self.channels.setdefault((row[5], row[6]), len(self.channels)) for row in rows),
+                                   np.uint32, count),
+        }
+        for name, dtype in self.COLUMNS:
+            columns[name].astype(dtype, copy=False).tofile(self._raw[name])
+        if self._text is not None:
+            texts = [(row[2] or "").encode('utf-8') for row in rows]
+            self._text.write(b"".join(texts))
+            lengths = np.fromiter((len(text) for text in texts), np.uint64, count)
+            self._text_offsets.append(self._text_size + np.cumsum(lengths, dtype=np.uint64))
+            self._text_size += int(lengths.sum())
+        self.rows += count
+
+    def close(self, source=""):
+        """
+        Turns the raw columns into .npy files and writes the manifest.
+
+        :param source: Description of where the rows came from, kept in the manifest
+        """
+        dtypes = {"username": code_dtype(len(self.usernames)), "channel": code_dtype(len(self.channels))}
+        for name, dtype in self.COLUMNS:
+            self._raw[name].close()
+            column = np.lib.format.open_memmap(os.path.join(self.path, name + ".npy"), mode='w+',
+                                               dtype=dtypes.get(name, dtype), shape=(self.rows,))
+            if self.rows:
+                # Copied through memory maps a chunk at a time, so no column is ever held in memory whole
+                raw = np.memmap(self._raw_path(name), dtype=dtype, mode='r')
+                for first in range(0, self.rows, SCAN_CHUNK):
+                    column[first:first + SCAN_CHUNK] = raw[first:first + SCAN_CHUNK]
+                del raw
+            column.flush()
+            del column
+            os.remove(self._raw_path(name))
+        if self._text is not None:
+            self._text.close()
+            np.save(os.path.join(self.path, "text_offsets.npy"), np.concatenate(self._text_offsets))
+        manifest = {
+            'format': ARCHIVE_FORMAT,
+            'rows': self.rows,
+            'exported': datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'source': source,
+            'with_text': self.with_text,
+            'usernames': sorted(self.usernames, key=self.usernames.get),
+            'channels': [list(key) for key in sorted(self.channels, key=self.channels.get)],
+        }
+        with open(os.path.join(self.path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        self._replace()
+
+    def _replace(self):
+        """Moves the finished archive to its destination, removing the one it replaces."""
+        old = None
+        if os.path.isdir(self.destination):
+            # A folder can only be renamed over an empty one, so the old archive is moved aside first
+            old = self.path + ".old"
+            os.replace(self.destination, old)
+        os.replace(self.path, self.destination)
+        if old is not None:
+            shutil.rmtree(old, ignore_errors=True)
+        self.path = self.destination
+
+    def abort(self):
+        """Removes the unfinished archive, leaving the destination as it was."""
+        for raw in self._raw.values():
+            raw.close()
+        if self._text is not None:
+            self._text.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+def export_archive(storage, path, with_text=False, include_archives=False, chunk_size=EXPORT_CHUNK, progress=None):
+    """
+    Streams the messages table, and optionally the monthly archive tables, into a columnar archive.
+
+    :param storage: Storage backend to read
+    :param path: Archive folder to write, replaced if it's empty or holds an archive
+    :param with_text: Also store the message texts
+    :param include_archives: Also export the messages moved to the monthly archive tables by retention.py
+    :param chunk_size: Rows read per query
+    :param progress: Callable invoked with the number of rows exported so far after every chunk
+    :return: Number of rows exported
+    """
+    writer = ArchiveWriter(path, with_text)
+    sources = []
+    if include_archives:
+        for month in storage.list_archives():
+            sources.append((f"archive {month}",
+                            lambda last_id, month=month: storage.archived_messages(month, last_id, chunk_size)))
+    sources.append(("messages", lambda last_id: storage.search_messages(None, "", None, chunk_size,
+                                                                        after_id=last_id)))
+    try:
+        for name, read in sources:
+            last_id = 0
+            while True:
+                rows = read(last_id)
+                writer.add(rows)
+                if progress is not None:
+                    progress(writer.rows)
+                if len(rows) < chunk_size:
+                    break
+                last_id = rows[-1][0]
+        writer.close(", ".join(name for name, read in sources))
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.rows
+
+class ColumnarArchive:
+    """
+    Read side of a columnar archive written by export_archive().
+
+    Columns are memory-mapped, so opening an archive is instant and the operating
+    system pages in only what a query touches. Queries scan the columns in chunks
+    of SCAN_CHUNK rows with vectorized NumPy operations, using no database.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Archive folder
+        """
+        self.path = path
+        try:
+            with open(os.path.join(path, MANIFEST_FILE), encoding='utf-8') as f:
+                self.manifest = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ValueError(f"{path} is not a readability archive: {e}") from e
+        if self.manifest.get('format') != ARCHIVE_FORMAT:
+            raise ValueError(f"{path} has archive format {self.manifest.get('format')}, expected {ARCHIVE_FORMAT}")
+        self.rows = self.manifest['rows']
+        self.usernames = self.manifest['usernames']
+        self.channels = [tuple(channel) for channel in self.manifest['channels']]
+        self._user_codes = {username: code for code, username in enumerate(self.usernames)}
+        self._channel_codes = {channel: code for code, channel in enumerate(self.channels)}
+        self._columns = {}
+
+    def column(self, name):
+        """Returns a memory-mapped column: id, timestamp, score, username, channel or text_offsets."""
+        column = self._columns.get(name)
+        if column is None:
+            column = self._columns[name] = np.load(os.path.join(self.path, name + ".npy"), mmap_mode='r')
+        return column
+
+    def message(self, row):
+        """Returns the text of the message at a row, None if the archive has no texts."""
+        if not self.manifest.get('with_text'):
+            return None
+        offsets = self.column("text_offsets")
+        with open(os.path.join(self.path, "text.bin"), 'rb') as f:
+            f.seek(int(offsets[row]))
+            return f.read(int(offsets[row + 1] - offsets[row])).decode('utf-8')
+
+    def list_channels(self):
+        """Returns every (network, channel) pair in the archive."""
+        return sorted(self.channels)
+
+    def list_users(self, network=None, channel=None):
+        """Returns every username with messages, optionally only those seen in one network or channel."""
+        if network is None and channel is None:
+            return sorted(self.usernames)
+        seen = np.zeros(len(self.usernames), dtype=bool)
+        for start, stop, selected in self._scan(None, network, channel):
+            seen[self.column("username")[start:stop][selected]] = True
+        return sorted(self.usernames[code] for code in np.flatnonzero(seen))
+
+    def _selection(self, usernames, network, channel):
+        """Returns the username codes and channel codes a query is limited to, None for any."""
+        user_codes = None
+        if usernames is not None:
+            user_codes = np.array([self._user_codes[name] for name in usernames if name in self._user_codes],
+                                  dtype=np.int64)
+        channel_codes = None
+        if network is not None or channel is not None:
+            channel_codes = np.array([code for code, (net, chan) in enumerate(self.channels)
+                                      if (network is None or net == network) and (channel is None or chan == channel)],
+                                     dtype=np.int64)
+        return user_codes, channel_codes
+
+    def _scan(self, usernames=None, network=None, channel=None, start=None, end=None):
+        """
+        Yields (start, stop, selected) for every chunk of rows, selected being a boolean
+        mask of the chunk's rows matching the filters that have a score.
+
+        :param start: First local time included, anything numpy.datetime64 accepts, None for no limit
+        :param end: Local time the rows end before, None for no limit
+        """
+        user_codes, channel_codes = self._selection(usernames, network, channel)
+        user_mask = channel_mask = None
+        if user_codes is not None:
+            user_mask = np.zeros(len(self.usernames), dtype=bool)
+            user_mask[user_codes] = True
+        if channel_codes is not None:
+            channel_mask = np.zeros(len(self.channels), dtype=bool)
+            channel_mask[channel_codes] = True
+        start = np.datetime64(start, 's') if start is not None else None
+        end = np.datetime64(end, 's') if end is not None else None
+        scores = self.column("score")
+        for first in range(0, self.rows, SCAN_CHUNK):
+            last = min(first + SCAN_CHUNK, self.rows)
+            selected = ~np.isnan(scores[first:last])
+            if user_mask is not None:
+                selected &= user_mask[self.column("username")[first:last]]
+            if channel_mask is not None:
+                selected &= channel_mask[self.column("channel")[first:last]]
+            if start is not None or end is not None:
+                timestamps = self.column("timestamp")[first:last]
+                if start is not None:
+                    selected &= timestamps >= start
+                if end is not None:
+                    selected &= timestamps < end
+            yield first, last, selected
+
+    def user_averages(self, usernames=None, network=None, channel=None, start=None, end=None):
+        """
+        Computes per-user averages, like Storage.user_averages but from the archive.
+
+        :return: List of (username, average score, message count, standard deviation) tuples ordered by username
+        """
+        size = len(self.usernames)
+        counts = np.zeros(size, dtype=np.int64)
+        sums = np.zeros(size)
+        squares = np.zeros(size)
+        for first, last, selected in self._scan(usernames, network, channel, start, end):
+            codes = self.column("username")[first:last][selected]
+            scores = self.column("score")[first:last][selected].astype(np.float64)
+            counts += np.bincount(codes, minlength=size)
+            sums += np.bincount(codes, weights=scores, minlength=size)
+            squares += np.bincount(codes, weights=scores * scores, minlength=size)
+        present = np.flatnonzero(counts)
+        means = sums[present] / counts[present]
+        deviations = np.sqrt(np.maximum(squares[present] / counts[present] - means * means, 0.0))
+        rows = [(self.usernames[code], float(mean), int(counts[code]), float(deviation))
+                for code, mean, deviation in zip(present, means, deviations)]
+        return sorted(rows)
+
+    def user_percentiles(self, percentiles=(10, 50, 90), usernames=None, network=None, channel=None,
+                         start=None, end=None):
+        """
+        Computes percentiles of every user's scores with one sort over the selected rows.
+
+        :param percentiles: Percentiles to compute, between 0 and 100
+        :return: Dictionary of username to a list of scores, one per percentile (nearest rank)
+        """
+        codes = []
+        scores = []
+        for first, last, selected in self._scan(usernames, network, channel, start, end):
+            codes.append(self.column("username")[first:last][selected])
+            scores.append(self.column("score")[first:last][selected])
+        if not codes:
+            return {}
+        codes = np.concatenate(codes)
+        scores = np.concatenate(scores)
+        if not len(codes):
+            return {}
+        # Sorting one float64 key of user and score is several times faster than lexsort on both
+        low = float(scores.min())
+        width = np.floor(float(scores.max()) - low) + 1.0
+        keys = codes * width + (scores - low)
+        keys.sort()
+        codes = (keys // width).astype(np.int64)
+        scores = keys - codes * width + low
+        users, starts, counts = np.unique(codes, return_index=True, return_counts=True)
+        result = {}
+        ranks = [np.minimum(starts + np.floor(counts * percentile / 100.0).astype(np.int64), starts + counts - 1)
+                 for percentile in percentiles]
+        values = [scores[rank] for rank in ranks]
+        for index, code in enumerate(users):
+            result[self.usernames[code]] = [float(value[index]) for value in values]
+        return result
+
+    def score_histogram(self, bins=20, score_range=(0.0, 15.0), usernames=None, network=None, channel=None,
+                        start=None, end=None):
+        """
+        Counts the scores in equal-width bins.
+
+        :return: (counts, edges) tuple as numpy.histogram returns them
+        """
+        edges = np.linspace(score_range[0], score_range[1], bins + 1)
+        counts = np.zeros(bins, dtype=np.int64)
+        for first, last, selected in self._scan(usernames, network, channel, start, end):
+            counts += np.histogram(self.column("score")[first:last][selected], edges)[0]
+        return counts, edges
+
+    def grade_histogram(self, usernames=None, network=None, channel=None, start=None, end=None):
+        """
+        Counts the messages per grade level.
+
+        :return: List of (grade level, message count) tuples, easiest grade first
+        """
+        counts = np.zeros(len(GRADE_LEVELS), dtype=np.int64)
+        for first, last, selected in self._scan(usernames, network, channel, start, end):
+            scores = self.column("score")[first:last][selected]
+            counts += np.bincount(np.searchsorted(GRADE_BOUNDS, scores, side='left'), minlength=len(GRADE_LEVELS))
+        return list(zip(GRADE_LEVELS, (int(count) for count in counts)))
+
+def print_report(archive, network=None, channel=None):
+    """Prints the per-user averages and the grade-level histogram of an archive."""
+    start = time.perf_counter()
+    averages = archive.user_averages(network=network, channel=channel)
+    grades = archive.grade_histogram(network=network, channel=channel)
+    elapsed = time.perf_counter() - start
+    total = sum(row[2] for row in averages)
+    where = f" in {channel_label(network or '', channel or '')}" if network is not None or channel is not None else ""
+    print(f"--- {archive.rows} archived messages, {total} scored{where}, aggregated in {elapsed:.2f}s ---")
+    for username, avg_score, msg_count, deviation in sorted(averages, key=lambda row: -row[2]):
+        print(f"{username}: {avg_score:.2f} ({score_to_grade_level(avg_score)}), {msg_count} messages, "
+              f"std. deviation {deviation:.2f}")
+    print("--- Grade levels ---")
+    for grade, count in grades:
+        print(f"{grade}: {count} ({count / total if total else 0:.1%})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the logged messages to a columnar archive, or report on one "
+                                                 "without a database.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Write the messages table to an archive folder")
+    export.add_argument("path", help="Archive folder, replaced if it's empty or holds an earlier archive")
+    export.add_argument("--with-text", action="store_true", help="Also store the message texts")
+    export.add_argument("--include-archives", action="store_true",
+                        help="Also export the messages retention.py moved to the monthly archive tables")
+    export.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK, help="Rows read per query")
+    report = commands.add_parser("report", help="Print per-user averages and grade levels from an archive")
+    report.add_argument("path", help="Archive folder")
+    report.add_argument("--network", help="Only count this network")
+    report.add_argument("--channel", help="Only count this channel")
+    args = parser.parse_args()
+
+    if args.command == "report":
+        try:
+            archive = ColumnarArchive(args.path)
+        except ValueError as e:
+            print(e)
+            sys.exit(1)
+        print_report(archive, args.network, args.channel)
+        return
+
+    storage = open_storage(STORAGE_CONFIG, DB_CONFIG)
+    start = time.perf_counter()
+    try:
+        rows = export_archive(storage, args.path, args.with_text, args.include_archives, args.chunk_size,
+                              progress=lambda rows: print(f"\r{rows} rows", end="", flush=True))
+    except StorageError as e:
+        print(f"\nError reading messages from the database: {e}")
+        sys.exit(1)
+    except (OSError, ValueError) as e:
+        print(f"\nError writing the archive: {e}")
+        sys.exit(1)
+    finally:
+        storage.close()
+    elapsed = time.perf_counter() - start
+    print(f"\rExported {rows} messages to {args.path} in {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Built-in Dale-Chall readability engine.
+
+Follows the textstat 0.7.x implementation of dale_chall_readability_score:
+words are counted after removing punctuation (apostrophes in contractions are
+kept), a word is difficult when its lowercase form is not in the Dale-Chall
+easy word list, and fragments of two words or less don't count as sentences.
+
+Scores match textstat within TEXTSTAT_TOLERANCE. The only differences come from
+textstat releases that round their output to two decimals.
+"""
+import os
+import re
+
+TEXTSTAT_TOLERANCE = 0.01
+
+# Same constants and patterns as textstat
+DIFFICULT_WEIGHT = 0.1579
+SENTENCE_WEIGHT = 0.0496
+DIFFICULT_ADJUSTMENT = 3.6365
+DIFFICULT_THRESHOLD = 5
+
+RE_NONCONTRACTION_APOSTROPHE = re.compile(r"\'(?![tsd]|ve|ll|re)")
+RE_PUNCTUATION = re.compile(r"[^\w\s\']")
+RE_SENTENCE = re.compile(r"\b[^.!?]+[.!?]*", re.UNICODE)
+
+_easy_words = None
+
+def easy_words_path():
+    """Returns the path of the Dale-Chall easy word list shipped with textstat."""
+    import textstat
+    return os.path.join(os.path.dirname(os.path.abspath(textstat.__file__)), 'resources', 'en', 'easy_words.txt')
+
+def load_easy_words(path=None):
+    """
+    Loads the Dale-Chall easy word list into a frozenset.
+
+    :param path: Word list with one word per line, textstat's copy by default
+    :return: frozenset of lowercase easy words
+    """
+    global _easy_words
+    with open(path or easy_words_path(), 'r', encoding='utf-8') as word_file:
+        _easy_words = frozenset(line.strip() for line in word_file if line.strip())
+    return _easy_words
+
+def get_easy_words():
+    """Returns the easy word set, loading it on first use."""
+    if _easy_words is None:
+        load_easy_words()
+    return _easy_words
+
+def list_words(text):
+    """
+    Splits text into words the way textstat counts them.
+
+    :param text: The text to split
+    :return: List of words with punctuation removed
+    """
+    text = RE_NONCONTRACTION_APOSTROPHE.sub("", text)
+    return RE_PUNCTUATION.sub("", text).split()
+
+def count_sentences(text):
+    """
+    Counts sentences, ignoring fragments of two words or less.
+
+    :param text: The text to count sentences in
+    :return: Number of sentences, 0 for empty text and at least 1 otherwise
+    """
+    if not text:
+        return 0
+    sentences = RE_SENTENCE.findall(text)
+    ignored = sum(1 for sentence in sentences if len(list_words(sentence)) <= 2)
+    return max(1, len(sentences) - ignored)
+
+def text_counts(text, easy_words=None):
+    """
+    Counts what the Dale-Chall formula needs for one text.
+
+    :param text: The text to count
+    :param easy_words: Easy word set, the Dale-Chall list by default
+    :return: (word count, difficult word count, sentence count) tuple
+    """
+    if easy_words is None:
+        easy_words = get_easy_words()
+    words = list_words(text)
+    if not words:
+        return 0, 0, count_sentences(text)
+    difficult = sum(1 for word in words if word.lower() not in easy_words)
+    return len(words), difficult, count_sentences(text)
+
+def score_from_counts(word_count, difficult_count, sentence_count):
+    """
+    Applies the Dale-Chall formula to precomputed counts.
+
+    :return: Dale-Chall readability score, 0.0 for text without words
+    """
+    if word_count == 0:
+        return 0.0
+    per_difficult_words = 100 * difficult_count / word_count
+    score = DIFFICULT_WEIGHT * per_difficult_words + SENTENCE_WEIGHT * (word_count / sentence_count)
+    if per_difficult_words > DIFFICULT_THRESHOLD:
+        score += DIFFICULT_ADJUSTMENT
+    return score
+
+def score(text):
+    """
+    Calculate the Dale-Chall readability score of a text without textstat.
+
+    :param text: The text to score
+    :return: Dale-Chall readability score
+    """
+    return score_from_counts(*text_counts(text))
+
+def score_many(messages, filter_words=True):
+    """
+    Scores a batch of messages with one vectorized evaluation of the formula.
+
+    Each message is tokenized once into word, difficult word and sentence counts,
+    which are collected into NumPy arrays and scored together.
+
+    :param messages: Iterable of message strings
+    :param filter_words: Drop non-dictionary words first, as calculate_readability does
+    :return: NumPy array of scores, 0 for messages without valid words
+    """
+    import numpy as np
+
+    if filter_words:
+        from readability_core import filter_valid_words
+        messages = [filter_valid_words(message) for message in messages]
+    elif not isinstance(messages, list):
+        messages = list(messages)
+
+    easy_words = get_easy_words()
+    counts = np.array([text_counts(message, easy_words) for message in messages], dtype=np.float64).reshape(-1, 3)
+    word_count, difficult_count, sentence_count = counts[:, 0], counts[:, 1], counts[:, 2]
+
+    has_words = word_count > 0
+    per_difficult_words = np.divide(100 * difficult_count, word_count,
+                                    out=np.zeros_like(word_count), where=has_words)
+    words_per_sentence = np.divide(word_count, sentence_count,
+                                   out=np.zeros_like(word_count), where=sentence_count > 0)
+
+    scores = DIFFICULT_WEIGHT * per_difficult_words + SENTENCE_WEIGHT * words_per_sentence
+    scores += np.where(per_difficult_words > DIFFICULT_THRESHOLD, DIFFICULT_ADJUSTMENT, 0.0)
+    scores[~has_words] = 0.0
+    return scores
@@ -0,0 +1,260 @@
+import json
+import os
+import threading
+import time
+
+from storage import StorageDataError, StorageError
+
+def is_outage(error):
+    """True if a write failed because the database is unreachable or unavailable, not because of the rows."""
+    return isinstance(error, StorageError) and not isinstance(error, StorageDataError)
+
+class BatchWriter:
+    """
+    Buffers rows and writes them to the database in batches from its own thread.
+
+    A batch is flushed every batch_size rows or flush_interval_ms milliseconds,
+    whichever comes first. The actual write is done by the sink callable, which
+    receives a list of rows and raises if the database can't be reached.
+
+    While the database is unreachable, batches are appended to a local spool file
+    (one JSON row per line). The spool is replayed, in order, once the sink works
+    again, so no rows are lost and callers of add() never wait on the database.
+
+    Only outages (a StorageError that isn't a StorageDataError) are spooled. A batch
+    the database rejects for its data is written again one row at a time, and the
+    rows rejected on their own go to the reject file, so one bad row never holds up
+    the spool behind it.
+    """
+
+    def __init__(self, sink, batch_size=200, flush_interval_ms=1000, spool_path=None,
+                 retry_interval=30.0, on_error=None, name="readability-writer", reject_path=None):
+        """
+        :param sink: Callable writing a list of rows to the database, raising StorageError on failure
+        :param batch_size: Number of buffered rows that triggers a flush
+        :param flush_interval_ms: Maximum time in milliseconds a row stays buffered
+        :param spool_path: File rows are appended to while the database is down
+        :param retry_interval: Seconds between attempts to replay the spool
+        :param on_error: Callable invoked with a message when a write fails
+        :param name: Name of the writer thread
+        :param reject_path: File rows the database refuses are appended to, with the error
+        """
+        self.sink = sink
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.001, flush_interval_ms / 1000.0)
+        self.spool_path = spool_path
+        self.reject_path = reject_path
+        self.retry_interval = retry_interval
+        self.on_error = on_error
+        self.name = name
+
+        self._buffer = []
+        self._cond = threading.Condition()
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._running = False
+        self._next_retry = 0.0
+
+        # Counters, read by the plugin for its status output
+        self.rows_written = 0
+        self.batches_written = 0
+        self.rows_spooled = 0
+        self.rows_replayed = 0
+        self.rows_rejected = 0
+        self.write_errors = 0
+
+    @property
+    def pending(self):
+        """Number of rows buffered in memory."""
+        with self._cond:
+            return len(self._buffer)
+
+    @property
+    def spooled(self):
+        """True while the spool file holds rows waiting to be replayed."""
+        return bool(self.spool_path) and os.path.exists(self.spool_path) and os.path.getsize(self.spool_path) > 0
+
+    def start(self):
+        """Start the flush thread."""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def add(self, row):
+        """
+        Buffer a row for the next batch.
+
+        :param row: A tuple understood by the sink
+        """
+        with self._cond:
+            self._buffer.append(row)
+            if len(self._buffer) >= self.batch_size:
+                self._cond.notify()
+
+    def close(self, timeout=10.0):
+        """
+        Stop the flush thread and write out everything that is still buffered.
+
+        :param timeout: Maximum number of seconds to wait for the flush thread
+        """
+        if self._running:
+            with self._cond:
+                self._running = False
+                self._cond.notify()
+            self._thread.join(timeout)
+            self._thread = None
+        self.flush()
+
+    def flush(self):
+        """Write the buffered rows now. Rows that can't be written are spooled."""
+        with self._cond:
+            rows, self._buffer = self._buffer, []
+        with self._write_lock:
+            if self.spooled:
+                # Keep rows in order behind the ones already waiting in the spool
+                if rows:
+                    self._spool(rows)
+                if time.monotonic() >= self._next_retry:
+                    self._replay_spool()
+                return
+            if rows:
+                self._write(rows)
+
+    def _write(self, rows):
+        try:
+            self.sink(rows)
+        except Exception as e:
+            self.write_errors += 1
+            if is_outage(e):
+                self._next_retry = time.monotonic() + self.retry_interval
+                self._report(f"Error writing {len(rows)} rows to the database: {e}")
+                self._spool(rows)
+                return False
+            self._report(f"Database rejected a batch of {len(rows)} rows, writing them one at a time: {e}")
+            done = self._write_singly(rows)
+            if done < len(rows):
+                self._spool(rows[done:])
+                return False
+            return True
+        self.rows_written += len(rows)
+        self.batches_written += 1
+        return True
+
+    def _write_singly(self, rows):
+        """
+        Writes rows one at a time, moving those the database rejects to the reject file.
+
+        :return: Number of rows written or rejected, fewer than all of them if the database went away meanwhile
+        """
+        for index, row in enumerate(rows):
+            try:
+                self.sink([row])
+            except Exception as e:
+                if is_outage(e):
+                    self._next_retry = time.monotonic() + self.retry_interval
+                    return index
+                self._reject(row, e)
+            else:
+                self.rows_written += 1
+        return len(rows)
+
+    def reject(self, row, error):
+        """
+        Moves a row that can't be stored to the reject file, from any thread.
+
+        :param row: The row, in the shape the sink takes
+        :param error: Why it can't be stored
+        """
+        with self._write_lock:
+            self._reject(row, error)
+
+    def _reject(self, row, error):
+        self.rows_rejected += 1
+        if not self.reject_path:
+            self._report(f"Dropped a row the database rejected: {error}")
+            return
+        with open(self.reject_path, 'a', encoding='utf-8') as rejects:
+            rejects.write(json.dumps({'row': row, 'error': str(error)}, default=str) + '\n')
+
+    def _spool(self, rows):
+        if not self.spool_path:
+            self._report(f"No spool file configured, {len(rows)} rows were lost")
+            return
+        with open(self.spool_path, 'a', encoding='utf-8') as spool:
+            for row in rows:
+                spool.write(json.dumps(row) + '\n')
+        self.rows_spooled += len(rows)
+
+    def _replay_spool(self):
+        """Write the spooled rows batch by batch, keeping whatever could not be written."""
+        with open(self.spool_path, 'r', encoding='utf-8') as spool:
+            lines = [line for line in spool if line.strip()]
+
+        written = 0
+        while written < len(lines):
+            batch = [tuple(json.loads(line)) for line in lines[written:written + self.batch_size]]
+            done = self._write_replayed(batch)
+            written += done
+            if done < len(batch):
+                break
+
+        if written == len(lines):
+            os.remove(self.spool_path)
+        elif written:
+            # Rewrite the spool with only the rows that are still missing
+            temp_path = self.spool_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as spool:
+                spool.writelines(lines[written:])
+            os.replace(temp_path, self.spool_path)
+
+    def _write_replayed(self, batch):
+        """
+        Writes a batch read back from the spool.
+
+        :return: Number of its rows that are done with, written or rejected
+        """
+        try:
+            self.sink(batch)
+        except Exception as e:
+            self.write_errors += 1
+            if is_outage(e):
+                self._next_retry = time.monotonic() + self.retry_interval
+                self._report(f"Database still unavailable, keeping spooled rows: {e}")
+                return 0
+            self._report(f"Database rejected {len(batch)} spooled rows, writing them one at a time: {e}")
+            done = self._write_singly(batch)
+            self.rows_replayed += done
+            return done
+        self.rows_written += len(batch)
+        self.rows_replayed += len(batch)
+        self.batches_written += 1
+        return len(batch)
+
+    def _report(self, text):
+        if self.on_error is not None:
+            self.on_error(text)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if self._running and len(self._buffer) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                running = self._running
+            if not running:
+                return
+            self.flush()
+
+    def stats(self):
+        """Return a snapshot of the writer counters as a dictionary."""
+        return {
+            'pending': self.pending,
+            'rows_written': self.rows_written,
+            'batches_written': self.batches_written,
+            'rows_spooled': self.rows_spooled,
+            'rows_replayed': self.rows_replayed,
+            'rows_rejected': self.rows_rejected,
+            'write_errors': self.write_errors,
+            'spooled': self.spooled,
+        }
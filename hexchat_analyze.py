@@ -1,99 +1,230 @@
 import hexchat
-import spacy
-import textstat
-import enchant
+import os
+import sys
+import time
+from collections import deque
 
-nlp = spacy.load("en_core_web_sm")
-english_dict = enchant.Dict("en_US")
+# Helper modules live next to this plugin in the addons folder
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from startup import StartupProfile, WarmUp
+startup_profile = StartupProfile()
 
+from readability_core import calculate_readability, channel_label, score_cache, use_lexicon, word_cache
+from readability_core import warm_up as warm_up_scoring
+from streaming_stats import RunningStats
+from instrumentation import metrics
+from plugin_report import REPORT_CONFIG, channel_selected, print_report, render_report
+startup_profile.mark("imports")
+
+# Running statistics sharded per (network, channel), then per user
 user_scores = {}
-message_count = 0
 
-def filter_valid_words(sentence):
-    """
-    Filters out non-English words from the sentence using PyEnchant.
+# (network, channel, username) keys whose stats changed since the last report,
+# and the report entries of everyone reported so far, per (network, channel)
+changed_users = set()
+report_entries = {}
 
-    :param sentence: The sentence to filter
-    :return: A sentence containing only valid English words
-    """
-    words = sentence.split()
-    valid_words = [word for word in words if english_dict.check(word)]
+WORD_CACHE_FILE = "readability_word_cache.json"  # Word validity cache kept between sessions
+
+# Precompiled word lexicon built by lexicon.py, checked before PyEnchant
+LEXICON_CONFIG = {
+    'file': "readability_lexicon.bin",  # Lexicon file in the HexChat config folder, used when it exists
+    'fallback': True            # Ask PyEnchant about words the lexicon doesn't hold
+}
+
+# textstat, PyEnchant and the caches are loaded by a warm-up thread, so /py load returns at once.
+# Messages arriving meanwhile are buffered and scored when it is done.
+STARTUP_CONFIG = {
+    'background': True,         # Warm up on a background thread, False to load everything during /py load
+    'max_buffer': 5000,         # Messages buffered during the warm-up, the oldest are dropped beyond this
+    'unload_timeout': 10.0      # Seconds unloading waits for a warm-up in progress before cancelling it
+}
+
+# Messages waiting for the warm-up, and errors it raised, printed from the HexChat thread by a timer
+pending_messages = deque(maxlen=STARTUP_CONFIG['max_buffer'])
+pending_notices = deque(maxlen=100)
+
+# Per-user statistics configuration
+STATS_CONFIG = {
+    'ewma_alpha': 0.1,          # Weight of the newest score in the decayed average, None to disable
+    'window_size': 50           # Scores in the sliding-window average, 0 to disable
+}
+
+# Timing histograms and counters shown by /RSTATS
+INSTRUMENTATION_CONFIG = {
+    'enabled': True,            # Record stage timings and counters
+    'dump_file': None,          # JSON Lines file in the HexChat config folder snapshots are appended to, None to disable
+    'dump_interval_ms': 300000  # How often a snapshot is appended to dump_file
+}
+
+def score_message(network, channel, username, message):
+    """Scores a message and adds it to the running statistics of its user in its channel."""
+    readability_score = calculate_readability(message)
     
-    return ' '.join(valid_words)
+    channel_scores = user_scores.get((network, channel))
+    if channel_scores is None:
+        channel_scores = user_scores[(network, channel)] = {}
+    stats = channel_scores.get(username)
+    if stats is None:
+        stats = channel_scores[username] = RunningStats(**STATS_CONFIG)
+    stats.add(readability_score)
+    changed_users.add((network, channel, username))
+    metrics.count("messages")
 
-def calculate_readability(sentence):
+def on_message(word, word_eol, userdata):
     """
-    Calculate the readability score using the Dale-Chall readability formula.
-    Filters out non-English words before the calculation.
-    
-    :param sentence: The sentence to calculate readability for
-    :return: Dale-Chall readability score
+    Event handler for when a message is received in the IRC chat.
+    Analyzes the readability of the message and maintains running statistics per user and channel.
+    Statistics are kept for the whole session, in constant memory per user.
+    Messages arriving during the warm-up are buffered, and scored in order once it is done.
     """
-    valid_sentence = filter_valid_words(sentence)
-    
-    
-    if not valid_sentence:
-        return 0
-    
-    readability_score = textstat.dale_chall_readability_score(valid_sentence)
-    return readability_score
+    start = time.perf_counter_ns()
+    network = hexchat.get_info('network') or ""
+    channel = hexchat.get_info('channel') or ""
+
+    if pending_messages or not warm_up.ready:
+        if len(pending_messages) == pending_messages.maxlen:
+            startup_profile.dropped += 1
+        pending_messages.append((network, channel, word[0], word[1]))
+        startup_profile.buffered += 1
+        return hexchat.EAT_NONE
+
+    score_message(network, channel, word[0], word[1])
+    metrics.record("on_message", time.perf_counter_ns() - start)
+    return hexchat.EAT_NONE
+
+def on_warm_up_timer(userdata):
+    """Timer callback printing warm-up errors and scoring the buffered messages once the warm-up is done."""
+    while pending_notices:
+        hexchat.prnt(pending_notices.popleft())
+    if not warm_up.ready:
+        return 1
+    while pending_messages:
+        score_message(*pending_messages.popleft())
+    return 0
 
-def score_to_grade_level(score):
+def on_report_timer(userdata):
     """
-    Convert the Dale-Chall readability score to a grade level.
-    
-    :param score: Dale-Chall readability score
-    :return: Corresponding grade level as a string
+    Timer callback printing a report for every channel with activity into the report tab.
+    Only users whose stats changed since the last report are recomputed.
     """
-    if score <= 4.9:
-        return "4th Grade or below"
-    elif score <= 5.9:
-        return "5th - 6th Grade"
-    elif score <= 6.9:
-        return "7th - 8th Grade"
-    elif score <= 7.9:
-        return "9th - 10th Grade"
-    elif score <= 8.9:
-        return "11th - 12th Grade"
+    start = time.perf_counter_ns()
+    changed_channels = set()
+    for network, channel, user in changed_users:
+        if not channel_selected(network, channel, REPORT_CONFIG['channels']):
+            continue
+        stats = user_scores[(network, channel)][user]
+        details = f"median {stats.median:.2f}, p90 {stats.p90:.2f}"
+        if stats.window_mean is not None:
+            details += f", last {len(stats.window)} {stats.window_mean:.2f}"
+        if stats.ewma is not None:
+            details += f", trend {stats.ewma:.2f}"
+        report_entries.setdefault((network, channel), {})[user] = (stats.mean, stats.count, details)
+        changed_channels.add((network, channel))
+    changed_users.clear()
+
+    lines = []
+    for network, channel in sorted(changed_channels):
+        lines.extend(render_report(report_entries[(network, channel)], REPORT_CONFIG['top_n'],
+                                   REPORT_CONFIG['sort_by'], channel_label(network, channel)))
+    if lines:
+        print_report(lines, REPORT_CONFIG['tab'])
+        metrics.count("reports")
+        metrics.record("report", time.perf_counter_ns() - start)
+    return 1
+
+def stats_lines():
+    """Returns the /RSTATS lines: stage timings, counters and the word cache."""
+    lines = metrics.format_lines()
+    stats = word_cache.stats()
+    lines.append("  word cache: {size}/{maxsize} words, {hits} hits, {misses} misses "
+                 "({hit_rate:.1%} hit rate)".format(**stats))
+    stats = score_cache.stats()
+    lines.append("  score cache: {size}/{maxsize} messages, {hits} hits, {misses} misses "
+                 "({hit_rate:.1%} hit rate)".format(**stats))
+    lines.append(f"  tracking {sum(len(scores) for scores in user_scores.values())} users in {len(user_scores)} channels")
+    return lines
+
+def dump_stats():
+    """Appends a snapshot of the metrics to the dump file."""
+    try:
+        metrics.dump(stats_dump_path, {'word_cache': word_cache.stats(), 'score_cache': score_cache.stats()})
+    except OSError as e:
+        hexchat.prnt(f"Error writing readability stats to {stats_dump_path}: {e}")
+
+def on_rstats(word, word_eol, userdata):
+    """/RSTATS [RESET|DUMP] command printing stage percentiles, rates and counters."""
+    action = word[1].upper() if len(word) > 1 else ""
+    if action == "RESET":
+        metrics.reset()
+        hexchat.prnt("Readability stats reset")
+    elif action == "DUMP":
+        dump_stats()
+        hexchat.prnt(f"Readability stats appended to {stats_dump_path}")
     else:
-        return "College Level"
+        for line in stats_lines():
+            hexchat.prnt(line)
+    return hexchat.EAT_ALL
 
-def on_message(word, word_eol, userdata):
+def on_dump_timer(userdata):
+    """Timer callback appending a snapshot to the dump file."""
+    dump_stats()
+    return 1
+
+def on_rstartup(word, word_eol, userdata):
+    """/RSTARTUP command printing the time and memory each startup phase took."""
+    for line in startup_profile.format_lines():
+        hexchat.prnt(line)
+    return hexchat.EAT_ALL
+
+def on_unload(userdata):
+    """Saves the word cache for the next session, unless the warm-up never got to load it."""
+    if warm_up.stop(STARTUP_CONFIG['unload_timeout']):
+        word_cache.save(word_cache_path)
+
+lexicon = None
+lexicon_path = os.path.join(hexchat.get_info('configdir'), LEXICON_CONFIG['file'])
+word_cache_path = os.path.join(hexchat.get_info('configdir'), WORD_CACHE_FILE)
+
+def load_lexicon():
+    """Maps the precompiled word lexicon, if one was built."""
+    global lexicon
+    try:
+        lexicon = use_lexicon(lexicon_path, LEXICON_CONFIG['fallback'])
+    except (OSError, ValueError) as e:
+        pending_notices.append(f"Error loading the word lexicon: {e}")
+
+def load_word_cache():
     """
-    Event handler for when a message is received in the IRC chat.
-    Analyzes the readability of the message and maintains a running average per user.
+    Warms the word cache from the previous session, unless the lexicon was rebuilt
+    since, as it may accept words the cache remembers as invalid.
     """
-    global message_count
+    if lexicon is None or not os.path.exists(word_cache_path) or \
+            os.path.getmtime(word_cache_path) > os.path.getmtime(lexicon_path):
+        word_cache.load(word_cache_path)
 
-    username = word[0]
-    message = word[1]
-    
-    readability_score = calculate_readability(message)
-    
-    if username not in user_scores:
-        user_scores[username] = [readability_score]
-    else:
-        user_scores[username].append(readability_score)
-    
-    message_count += 1
-    
-    if message_count >= 50:
-        average_scores = {user: sum(scores) / len(scores) for user, scores in user_scores.items()}
-        
-        hexchat.command(f"MSG {hexchat.get_info('nick')} --- Average Readability Scores after {message_count} messages ---")
-        
-        for user, avg_score in average_scores.items():
-            grade_level = score_to_grade_level(avg_score)
-            hexchat.command(f"MSG {hexchat.get_info('nick')} {user}'s average Dale-Chall readability score: {avg_score:.2f} ({grade_level})")
-        
-        hexchat.command(f"MSG {hexchat.get_info('nick')} --- End of Average Readability Scores ---\n")
-        
-        message_count = 0
-        user_scores.clear()
+warm_up = WarmUp([("lexicon", load_lexicon), ("word cache", load_word_cache),
+                  ("textstat and PyEnchant", warm_up_scoring)], startup_profile, on_error=pending_notices.append)
 
-    return hexchat.EAT_NONE
+metrics.enabled = INSTRUMENTATION_CONFIG['enabled']
+stats_dump_path = os.path.join(hexchat.get_info('configdir'), INSTRUMENTATION_CONFIG['dump_file'] or "readability_stats.jsonl")
+startup_profile.mark("plugin setup")
 
 hexchat.hook_print("Channel Message", on_message)
+hexchat.hook_command("RSTATS", on_rstats, help="/RSTATS [RESET|DUMP] Shows the readability analyzer's timings and counters")
+hexchat.hook_command("RSTARTUP", on_rstartup, help="/RSTARTUP Shows the time and memory each startup phase of the readability analyzer took")
+hexchat.hook_timer(100, on_warm_up_timer)
+hexchat.hook_timer(REPORT_CONFIG['interval_ms'], on_report_timer)
+if INSTRUMENTATION_CONFIG['dump_file']:
+    hexchat.hook_timer(INSTRUMENTATION_CONFIG['dump_interval_ms'], on_dump_timer)
+hexchat.hook_unload(on_unload)
+
+# Load the scoring dependencies and the caches, in the background unless configured otherwise
+if STARTUP_CONFIG['background']:
+    warm_up.start()
+else:
+    warm_up.run()
+startup_profile.finish_loading()
 
 hexchat.prnt("Readability Analyzer Plugin Loaded - Analyzing each user's message for you!")
 
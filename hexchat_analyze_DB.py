@@ -1,17 +1,117 @@
 import hexchat
-import spacy
-import textstat
-import enchant
-import mysql.connector
-from mysql.connector import Error
+import os
+import sys
+import time
+import threading
+from collections import deque
 
-# Load language processing tools
-nlp = spacy.load("en_core_web_sm")
-english_dict = enchant.Dict("en_US")
+# Helper modules live next to this plugin in the addons folder
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from startup import StartupProfile, WarmUp
+startup_profile = StartupProfile()
 
-# Global variables
-user_scores = {}
-message_count = 0
+from background_worker import BackgroundWorker
+from db_writer import BatchWriter
+from storage import StorageError, open_storage
+from readability_core import calculate_readability, channel_label, display_nick, score_cache, use_lexicon, word_cache
+from readability_core import warm_up as warm_up_scoring
+from plugin_report import REPORT_CONFIG, channel_selected, print_report, render_report
+from instrumentation import metrics
+from scorer_client import ScorerClient, ScorerUnavailable, default_socket_path
+from stylometry import StylometryJob
+from retention import RetentionJob, format_bytes
+startup_profile.mark("imports")
+
+# (network, channel, username) keys whose stats changed since the last report (filled by
+# the worker threads), and the report entries of everyone reported so far, per (network, channel)
+changed_users = set()
+changed_users_lock = threading.Lock()
+report_entries = {}
+report_thread = None
+
+# Rendered report waiting to be printed on the HexChat thread
+pending_report = deque(maxlen=1)
+
+# The database, textstat, PyEnchant and the caches are loaded by a warm-up thread, so /py load
+# returns at once. Messages arriving meanwhile wait in the worker queue.
+STARTUP_CONFIG = {
+    'background': True,         # Warm up on a background thread, False to load everything during /py load
+    'unload_timeout': 10.0      # Seconds unloading waits for a warm-up in progress before cancelling it
+}
+
+# Background worker configuration
+WORKER_CONFIG = {
+    'num_workers': 1,           # Threads doing the scoring and database logging (PyEnchant is not thread-safe)
+    'max_queue': 5000,          # Messages waiting to be processed
+    'overflow': 'drop-oldest',  # 'drop-oldest', 'sample' or 'block'
+    'sample_every': 10,         # With 'sample', keep one in every N messages when the queue is nearly full
+    'block_timeout': 0.5        # With 'block', seconds the hook may wait for room
+}
+
+# Batched database writer configuration
+WRITER_CONFIG = {
+    'batch_size': 200,          # Rows per INSERT batch
+    'flush_interval_ms': 1000,  # Longest time a row waits before being written
+    'retry_interval': 30.0      # Seconds between reconnect attempts while the database is down
+}
+SPOOL_FILE = "readability_spool.jsonl"  # Rows written here while the database is unreachable
+REJECT_FILE = "readability_rejected.jsonl"  # Rows the database refused (bad encoding, too long), with the error
+WORD_CACHE_FILE = "readability_word_cache.json"  # Word validity cache kept between sessions
+
+# Precompiled word lexicon built by lexicon.py, checked before PyEnchant
+LEXICON_CONFIG = {
+    'file': "readability_lexicon.bin",  # Lexicon file in the HexChat config folder, used when it exists
+    'fallback': True            # Ask PyEnchant about words the lexicon doesn't hold
+}
+
+# Out-of-process scoring by scorer_daemon.py, which uses every core. Messages are scored
+# in the plugin as usual while the daemon isn't running.
+DAEMON_CONFIG = {
+    'enabled': False,           # Stream messages to the scorer daemon when it is running
+    'socket_path': default_socket_path(hexchat.get_info('configdir')),
+    'retry_interval': 10.0,     # Seconds between connection attempts while the daemon is down
+    'max_buffer': 1000          # Messages the daemon may fall behind before the plugin scores them itself
+}
+
+# Part-of-speech counts per user, shown by ResultsGUI.py. spaCy is only loaded by the
+# background job once there are messages to tag.
+STYLOMETRY_CONFIG = {
+    'enabled': True,            # Tag logged messages with spaCy in the background
+    'interval_ms': 60000,       # Time between two runs over the new messages
+    'batch_size': 500,          # Messages tagged at a time
+    'max_per_run': 20000        # Most messages tagged per run, run stylometry.py to catch up a large history
+}
+
+# Messages older than keep_days move out of the messages table into monthly archive tables
+# (messages_archive_YYYYMM). Averages and trends keep counting them, search no longer finds them.
+RETENTION_CONFIG = {
+    'enabled': False,           # Archive old messages in the background
+    'keep_days': 365,           # Messages younger than this stay searchable
+    'mode': 'compress',         # 'keep', 'compress' or 'drop-text' the archived text, or 'delete' old messages
+    'interval_ms': 3600000,     # Time between two runs
+    'batch_size': 1000,         # Messages moved per transaction
+    'max_per_run': 50000        # Most messages moved per run, run retention.py to compact a large history at once
+}
+
+# Timing histograms and counters shown by /RSTATS
+INSTRUMENTATION_CONFIG = {
+    'enabled': True,            # Record stage timings and counters
+    'dump_file': None,          # JSON Lines file in the HexChat config folder snapshots are appended to, None to disable
+    'dump_interval_ms': 300000  # How often a snapshot is appended to dump_file
+}
+
+# Errors raised on worker threads, printed from the HexChat thread by a timer
+pending_notices = deque(maxlen=100)
+
+# Storage configuration
+STORAGE_CONFIG = {
+    'backend': 'mariadb',       # 'mariadb' for the server below, or 'sqlite' for an embedded database file
+    'sqlite_path': os.path.join(hexchat.get_info('configdir'), "readability_analyzer.db"),
+    'pool_size': 2,             # Pooled MariaDB connections
+    'partition_by': None,       # Partition the MariaDB messages table by 'channel' or 'month' (disables full-text search)
+    'partitions': 16,           # Number of partitions with 'channel'
+    'dedupe_texts': False       # Store repeated message texts (bots, relays, spam) once in a message_texts table
+}
 
 # Database configuration
 DB_CONFIG = {
@@ -21,165 +121,353 @@ DB_CONFIG = {
     'database': 'readability_analyzer' # Replace with your database name
 }
 
-def initialize_database():
-    """Initializes the MariaDB database connection and creates necessary tables if they do not exist."""
-    try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        # Create database if it doesn't exist
-        cursor.execute("CREATE DATABASE IF NOT EXISTS readability_analyzer")
-        cursor.execute("USE readability_analyzer")
-
-        # Create messages table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                username VARCHAR(255) NOT NULL,
-                message TEXT NOT NULL,
-                readability_score FLOAT,
-                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-    except Error as e:
-        hexchat.prnt(f"Error initializing database: {e}")
-
-def log_message_to_db(username, message, readability_score):
-    """Logs the message to the MariaDB database."""
+# Created by open_database() on the warm-up thread
+storage = None
+stylometry_job = None
+retention_job = None
+lexicon = None
+
+# Set when the storage couldn't be opened, messages are then no longer queued
+logging_disabled = False
+
+lexicon_path = os.path.join(hexchat.get_info('configdir'), LEXICON_CONFIG['file'])
+word_cache_path = os.path.join(hexchat.get_info('configdir'), WORD_CACHE_FILE)
+
+def notify(text):
+    """Queues a notice for the HexChat thread. Safe to call from worker threads."""
+    pending_notices.append(text)
+
+def flush_notices(userdata):
+    """Timer callback printing notices and the report queued by the worker threads."""
+    while pending_notices:
+        hexchat.prnt(pending_notices.popleft())
+    while pending_report:
+        print_report(pending_report.popleft(), REPORT_CONFIG['tab'])
+    return 1
+
+def insert_batch(rows):
+    """Writes a batch of rows for the batched writer, timing the insert and counting failures."""
+    start = time.perf_counter_ns()
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-
-        cursor.execute('''
-            INSERT INTO messages (username, message, readability_score) 
-            VALUES (%s, %s, %s)
-        ''', (username, message, readability_score))
-        
-        conn.commit()
-        cursor.close()
-        conn.close()
-    except Error as e:
-        hexchat.prnt(f"Error logging message to database: {e}")
-
-def filter_valid_words(sentence):
-    """
-    Filters out non-English words from the sentence using PyEnchant.
+        storage.insert_messages(rows)
+    except StorageError:
+        metrics.count("db_errors")
+        raise
+    finally:
+        metrics.record("db_insert", time.perf_counter_ns() - start)
+    metrics.count("db_rows", len(rows))
 
-    :param sentence: The sentence to filter
-    :return: A sentence containing only valid English words
-    """
-    words = sentence.split()
-    valid_words = [word for word in words if english_dict.check(word)]
+writer = BatchWriter(insert_batch, spool_path=os.path.join(hexchat.get_info('configdir'), SPOOL_FILE),
+                     reject_path=os.path.join(hexchat.get_info('configdir'), REJECT_FILE),
+                     on_error=notify, **WRITER_CONFIG)
+
+def log_message_to_db(username, message, readability_score, timestamp=None, network="", channel=""):
+    """Queues the message for the batched database writer."""
+    if timestamp is None:
+        timestamp = time.time()
+    with metrics.timed("log_message"):
+        writer.add((username, message, readability_score, timestamp, network, channel))
+
+scorer = ScorerClient(DAEMON_CONFIG['socket_path'], DAEMON_CONFIG['retry_interval'],
+                      DAEMON_CONFIG['max_buffer']) if DAEMON_CONFIG['enabled'] else None
+
+def score_and_log(item):
+    """Scores a message in the plugin and logs it to the database."""
+    network, channel, username, message, timestamp = item
+
+    readability_score = calculate_readability(message)
     
-    return ' '.join(valid_words)
+    # Log the message to the database
+    log_message_to_db(username, message, readability_score, timestamp, network, channel)
 
-def calculate_readability(sentence):
+def process_message(item):
     """
-    Calculate the readability score using the Dale-Chall readability formula.
-    Filters out non-English words before the calculation.
-    
-    :param sentence: The sentence to calculate readability for
-    :return: Dale-Chall readability score
+    Hands a queued message to the scorer daemon, or scores and logs it here when
+    the daemon isn't available. Runs on a worker thread.
+
+    :param item: (network, channel, nick, text, timestamp) tuple queued by on_message
     """
-    valid_sentence = filter_valid_words(sentence)
-    
-    if not valid_sentence:
-        return 0
-    
-    readability_score = textstat.dale_chall_readability_score(valid_sentence)
-    return readability_score
+    start = time.perf_counter_ns()
+    if scorer is None:
+        score_and_log(item)
+    else:
+        for unsent in scorer.send(item):
+            score_and_log(unsent)
+            metrics.count("daemon_fallbacks")
+
+    with changed_users_lock:
+        changed_users.add(item[:3])
 
-def score_to_grade_level(score):
+    metrics.count("messages")
+    metrics.record("process_message", time.perf_counter_ns() - start)
+
+def on_worker_error(item, error):
+    """Reports a message the worker failed to process."""
+    metrics.count("worker_errors")
+    notify(f"Error processing message from {item[2]}: {error}")
+
+worker = BackgroundWorker(process_message, on_error=on_worker_error, **WORKER_CONFIG)
+
+def retention_limit():
+    """Returns the largest id the retention job may archive, keeping messages the stylometry job hasn't tagged yet."""
+    if stylometry_job is None or stylometry_job.disabled:
+        return None
+    return storage.pos_last_id()
+
+def open_database():
     """
-    Convert the Dale-Chall readability score to a grade level.
-    
-    :param score: Dale-Chall readability score
-    :return: Corresponding grade level as a string
+    Opens the storage backend and creates the necessary tables and indexes if they do not exist.
+    Runs on the warm-up thread, which is also where the MariaDB connector gets imported.
     """
-    if score <= 4.9:
-        return "4th Grade or below"
-    elif score <= 5.9:
-        return "5th - 6th Grade"
-    elif score <= 6.9:
-        return "7th - 8th Grade"
-    elif score <= 7.9:
-        return "9th - 10th Grade"
-    elif score <= 8.9:
-        return "11th - 12th Grade"
-    else:
-        return "College Level"
+    global storage, stylometry_job, retention_job
+    storage = open_storage(STORAGE_CONFIG, DB_CONFIG)
+    try:
+        storage.initialize()
+    except StorageError as e:
+        notify(f"Error initializing database: {e}")
+    if STYLOMETRY_CONFIG['enabled']:
+        stylometry_job = StylometryJob(storage, STYLOMETRY_CONFIG['interval_ms'], STYLOMETRY_CONFIG['batch_size'],
+                                       STYLOMETRY_CONFIG['max_per_run'], on_error=notify)
+    if RETENTION_CONFIG['enabled']:
+        retention_job = RetentionJob(storage, RETENTION_CONFIG['keep_days'], RETENTION_CONFIG['mode'],
+                                     RETENTION_CONFIG['interval_ms'], RETENTION_CONFIG['batch_size'],
+                                     RETENTION_CONFIG['max_per_run'], up_to_id=retention_limit, on_error=notify)
 
-def get_average_readability_from_db(username):
-    """Calculates the average readability score for a given user based on all messages in the database."""
+def load_lexicon():
+    """Maps the precompiled word lexicon, if one was built."""
+    global lexicon
     try:
-        conn = mysql.connector.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-
-        # Query to calculate the average readability score for the user
-        cursor.execute('''
-            SELECT AVG(readability_score) 
-            FROM messages 
-            WHERE username = %s
-        ''', (username,))
-
-        result = cursor.fetchone()
-        cursor.close()
-        conn.close()
-
-        # Return the average score if found, otherwise 0
-        return result[0] if result[0] is not None else 0
-    except Error as e:
-        hexchat.prnt(f"Error calculating average readability from database: {e}")
-        return 0
+        lexicon = use_lexicon(lexicon_path, LEXICON_CONFIG['fallback'])
+    except (OSError, ValueError) as e:
+        notify(f"Error loading the word lexicon: {e}")
 
-def on_message(word, word_eol, userdata):
-    global message_count
+def load_word_cache():
+    """
+    Warms the word cache from the previous session, unless the lexicon was rebuilt
+    since, as it may accept words the cache remembers as invalid.
+    """
+    if lexicon is None or not os.path.exists(word_cache_path) or \
+            os.path.getmtime(word_cache_path) > os.path.getmtime(lexicon_path):
+        word_cache.load(word_cache_path)
 
-    username = word[0]
-    message = word[1]
-    
-    readability_score = calculate_readability(message)
-    
-    # Log the message to the database
-    log_message_to_db(username, message, readability_score)
-    
-    # Update user scores
-    if username not in user_scores:
-        user_scores[username] = []
-    user_scores[username].append(readability_score)
-    
-    message_count += 1
-    
-    # After 20 messages, calculate average readability from the database and send private message
-    if message_count >= 20:
-        hexchat.command(f"MSG {hexchat.get_info('nick')} --- Average Readability Scores for All Users ---")
-        
-        users = set(user_scores.keys())
-        
-        for user in users:
-            avg_score = get_average_readability_from_db(user)
-            grade_level = score_to_grade_level(avg_score)
-            hexchat.command(f"MSG {hexchat.get_info('nick')} {user}'s average Dale-Chall readability score: {avg_score:.2f} ({grade_level})")
-        
-        hexchat.command(f"MSG {hexchat.get_info('nick')} --- End of Average Readability Scores ---\n")
-        
-        # Reset message count and user scores for the next batch
-        message_count = 0
-        user_scores.clear()
+def start_workers():
+    """Starts the background workers, which process the messages queued during the warm-up first."""
+    global logging_disabled
+    if storage is None:
+        # Raised so the warm-up reports it and /RSTARTUP shows the workers as not started
+        logging_disabled = True
+        raise StorageError("workers not started, logging disabled because the database couldn't be opened. "
+                           "Fix STORAGE_CONFIG or DB_CONFIG and reload the plugin.")
+    startup_profile.buffered = worker.depth
+    startup_profile.dropped = worker.dropped
+    writer.start()
+    worker.start()
+    if stylometry_job is not None:
+        stylometry_job.start()
+    if retention_job is not None:
+        retention_job.start()
+
+warm_up = WarmUp([("database", open_database), ("lexicon", load_lexicon), ("word cache", load_word_cache),
+                  ("textstat and PyEnchant", warm_up_scoring), ("workers", start_workers)],
+                 startup_profile, on_error=notify)
+
+def on_message(word, word_eol, userdata):
+    # Only queue the message here, scoring and logging happen on the worker threads
+    if logging_disabled:
+        return hexchat.EAT_NONE
+    start = time.perf_counter_ns()
+    # The nick is stored without HexChat's nick color, the way log files and backfill_logs.py have it
+    worker.submit((hexchat.get_info('network') or "", hexchat.get_info('channel') or "", display_nick(word[0]), word[1],
+                   time.time()))
+    metrics.record("on_message", time.perf_counter_ns() - start)
 
     return hexchat.EAT_NONE
 
+def user_averages(users, network, channel):
+    """
+    Reads the averages of some users in a channel, from the scorer daemon when
+    messages are streamed to it, so its unwritten rows are included.
+    """
+    if scorer is not None and scorer.connected:
+        try:
+            return scorer.user_averages(users, network, channel)
+        except ScorerUnavailable as e:
+            metrics.count("daemon_errors")
+            notify(f"Scorer daemon didn't answer, reading averages from the database: {e}")
+    return storage.user_averages(users, network, channel)
+
+def build_report(changes):
+    """
+    Reads the averages of the users that changed since the last report and renders
+    one report per channel. Runs on its own thread so the database is never queried
+    on the HexChat thread. Each query only reads the totals of its own channel.
+
+    :param changes: (network, channel, username) keys to recompute
+    """
+    start = time.perf_counter_ns()
+    changed_channels = {}
+    for network, channel, username in changes:
+        if channel_selected(network, channel, REPORT_CONFIG['channels']):
+            changed_channels.setdefault((network, channel), []).append(username)
+
+    # Write out buffered rows first so the report includes them
+    if scorer is not None:
+        for unsent in scorer.flush():
+            score_and_log(unsent)
+    writer.flush()
+    lines = []
+    try:
+        for (network, channel), users in sorted(changed_channels.items()):
+            entries = report_entries.setdefault((network, channel), {})
+            for username, avg_score, msg_count in user_averages(users, network, channel):
+                entries[username] = (avg_score, msg_count, None)
+            lines.extend(render_report(entries, REPORT_CONFIG['top_n'], REPORT_CONFIG['sort_by'],
+                                       channel_label(network, channel)))
+    except StorageError as e:
+        metrics.count("report_errors")
+        notify(f"Error calculating average readability from database: {e}")
+        with changed_users_lock:
+            changed_users.update(changes)
+        return
+    if lines:
+        pending_report.append(lines)
+    metrics.count("reports")
+    metrics.record("report", time.perf_counter_ns() - start)
+
+def on_report_timer(userdata):
+    """Timer callback starting a report if any user's stats changed since the last one."""
+    global report_thread
+    if report_thread is not None and report_thread.is_alive():
+        return 1
+    with changed_users_lock:
+        changes = list(changed_users)
+        changed_users.clear()
+    if changes:
+        report_thread = threading.Thread(target=build_report, args=(changes,), name="readability-report", daemon=True)
+        report_thread.start()
+    return 1
+
+def queue_lines():
+    """Returns the lines describing the worker queue, the writer and the word cache."""
+    lines = ["Readability logging disabled: the database couldn't be opened"] if logging_disabled else []
+    stats = worker.stats()
+    lines += ["Readability queue: depth {depth} (max {max_depth}), submitted {submitted}, "
+              "processed {processed}, dropped {dropped}, errors {errors}".format(**stats)]
+    stats = writer.stats()
+    lines.append("Readability writer: {pending} buffered, {rows_written} rows in {batches_written} batches, "
+                 "{rows_spooled} spooled, {rows_replayed} replayed, {rows_rejected} rejected, {write_errors} errors".format(**stats))
+    stats = word_cache.stats()
+    lines.append("Readability word cache: {size}/{maxsize} words, {hits} hits, {misses} misses "
+                 "({hit_rate:.1%} hit rate)".format(**stats))
+    stats = score_cache.stats()
+    lines.append("Readability score cache: {size}/{maxsize} messages, {hits} hits, {misses} misses "
+                 "({hit_rate:.1%} hit rate)".format(**stats))
+    if scorer is not None:
+        stats = scorer.stats()
+        lines.append("Readability scorer daemon: {state} ({socket_path}), {sent} sent, {buffered} buffered, "
+                     "{fallbacks} scored in the plugin".format(
+                         state="connected" if stats['connected'] else "not connected", **stats))
+    if stylometry_job is not None:
+        stats = stylometry_job.stats()
+        progress = "not run yet" if stats['last_id'] is None else "up to message {last_id}".format(**stats)
+        lines.append("Readability stylometry: {messages_tagged} messages tagged ({tokens_tagged} tokens) in {runs} runs, "
+                     "{progress}, {batches_skipped} batches tagged elsewhere first, {errors} errors{state}".format(
+                         progress=progress, state=", off: " + stats['disabled'] if stats['disabled'] else "", **stats))
+    if retention_job is not None:
+        stats = retention_job.stats()
+        progress = "not run yet" if stats['last_run'] is None else time.strftime("last run %H:%M:%S",
+                                                                                   time.localtime(stats['last_run']))
+        lines.append("Readability retention: {messages_archived} messages older than {keep_days} days archived "
+                     "({mode}), {removed} removed, {archived} archived, {progress}, {errors} errors".format(
+                         removed=format_bytes(stats['bytes_removed']), archived=format_bytes(stats['bytes_archived']),
+                         progress=progress, **stats))
+    return lines
+
+def on_rstartup(word, word_eol, userdata):
+    """/RSTARTUP command printing the time and memory each startup phase took."""
+    for line in startup_profile.format_lines():
+        hexchat.prnt(line)
+    return hexchat.EAT_ALL
 
+def on_rqueue(word, word_eol, userdata):
+    """/RQUEUE command printing the background worker's queue counters."""
+    for line in queue_lines():
+        hexchat.prnt(line)
+    return hexchat.EAT_ALL
 
-# Initialize the database
-initialize_database()
+def dump_stats():
+    """Appends a snapshot of the metrics and queues to the dump file."""
+    try:
+        metrics.dump(stats_dump_path, {'worker': worker.stats(), 'writer': writer.stats(),
+                                       'word_cache': word_cache.stats(), 'score_cache': score_cache.stats(),
+                                       'scorer': scorer.stats() if scorer is not None else None,
+                                       'stylometry': stylometry_job.stats() if stylometry_job is not None else None,
+                                       'retention': retention_job.stats() if retention_job is not None else None})
+    except OSError as e:
+        hexchat.prnt(f"Error writing readability stats to {stats_dump_path}: {e}")
+
+def on_rstats(word, word_eol, userdata):
+    """/RSTATS [RESET|DUMP] command printing stage percentiles, rates, counters and queue depths."""
+    action = word[1].upper() if len(word) > 1 else ""
+    if action == "RESET":
+        metrics.reset()
+        hexchat.prnt("Readability stats reset")
+    elif action == "DUMP":
+        dump_stats()
+        hexchat.prnt(f"Readability stats appended to {stats_dump_path}")
+    else:
+        for line in metrics.format_lines() + queue_lines():
+            hexchat.prnt(line)
+    return hexchat.EAT_ALL
+
+def on_dump_timer(userdata):
+    """Timer callback appending a snapshot to the dump file."""
+    dump_stats()
+    return 1
+
+def on_unload(userdata):
+    """Lets the workers finish the queued messages and flushes the writer when the plugin is unloaded."""
+    ready = warm_up.stop(STARTUP_CONFIG['unload_timeout'])
+    if retention_job is not None:
+        retention_job.stop()
+    if stylometry_job is not None:
+        stylometry_job.stop()
+    worker.stop()
+    if scorer is not None:
+        for unsent in scorer.close():
+            score_and_log(unsent)
+    writer.close()
+    # The cache file isn't overwritten with a cache the warm-up didn't get to load
+    if ready:
+        word_cache.save(word_cache_path)
+    if storage is not None:
+        storage.close()
+    flush_notices(None)
+
+
+
+metrics.enabled = INSTRUMENTATION_CONFIG['enabled']
+stats_dump_path = os.path.join(hexchat.get_info('configdir'), INSTRUMENTATION_CONFIG['dump_file'] or "readability_stats.jsonl")
+
+startup_profile.mark("plugin setup")
 
 # Hook the message event
 hexchat.hook_print("Channel Message", on_message)
+hexchat.hook_command("RQUEUE", on_rqueue, help="/RQUEUE Shows the readability analyzer's queue depth and counters")
+hexchat.hook_command("RSTATS", on_rstats, help="/RSTATS [RESET|DUMP] Shows the readability analyzer's timings and counters")
+hexchat.hook_command("RSTARTUP", on_rstartup, help="/RSTARTUP Shows the time and memory each startup phase of the readability analyzer took")
+hexchat.hook_timer(1000, flush_notices)
+hexchat.hook_timer(REPORT_CONFIG['interval_ms'], on_report_timer)
+if INSTRUMENTATION_CONFIG['dump_file']:
+    hexchat.hook_timer(INSTRUMENTATION_CONFIG['dump_interval_ms'], on_dump_timer)
+hexchat.hook_unload(on_unload)
+
+# Load the database and the scoring dependencies, in the background unless configured otherwise
+if STARTUP_CONFIG['background']:
+    warm_up.start()
+else:
+    warm_up.run()
+startup_profile.finish_loading()
 
 hexchat.prnt("Readability Analyzer Plugin Loaded - Analyzing each user's message for you!")
 
@@ -0,0 +1,185 @@
+import bisect
+import json
+import threading
+import time
+
+# Histogram bucket upper bounds in nanoseconds: four buckets per doubling from 1 microsecond to about 70 seconds,
+# so a percentile is never off by more than 19%
+BUCKET_BOUNDS = [int(1000 * 2 ** (i / 4)) for i in range(105)]
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram. Recording is a bisect and a few additions,
+    and memory never grows, so it can stay on in production.
+
+    Recording takes no lock: a lock would double its cost, and every stage is
+    normally recorded from a single thread. With several scoring threads an
+    update can rarely be lost, which doesn't matter for percentiles.
+    """
+
+    __slots__ = ('counts', 'count', 'total', 'maximum')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0
+        self.maximum = 0
+
+    def record(self, elapsed_ns):
+        """Adds one measurement in nanoseconds."""
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS, elapsed_ns)] += 1
+        self.count += 1
+        self.total += elapsed_ns
+        if elapsed_ns > self.maximum:
+            self.maximum = elapsed_ns
+
+    def percentile(self, p):
+        """
+        Estimates a percentile from the buckets.
+
+        :param p: Percentile between 0 and 1
+        :return: Upper bound of the bucket holding the percentile in nanoseconds, 0 if nothing was recorded
+        """
+        counts = list(self.counts)
+        total = sum(counts)
+        if not total:
+            return 0
+        rank = max(1, int(p * total + 0.5))
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            seen += bucket_count
+            if seen >= rank:
+                bound = BUCKET_BOUNDS[index] if index < len(BUCKET_BOUNDS) else self.maximum
+                return min(bound, self.maximum)
+        return self.maximum
+
+    def snapshot(self):
+        """Returns count, mean, p50, p90, p99 and max in microseconds as a dictionary."""
+        return {
+            'count': self.count,
+            'mean_us': self.total / self.count / 1000 if self.count else 0.0,
+            'p50_us': self.percentile(0.50) / 1000,
+            'p90_us': self.percentile(0.90) / 1000,
+            'p99_us': self.percentile(0.99) / 1000,
+            'max_us': self.maximum / 1000,
+        }
+
+class _StageTimer:
+    """Context manager recording the time spent in its block."""
+
+    __slots__ = ('metrics', 'stage', 'start')
+
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.metrics.record(self.stage, time.perf_counter_ns() - self.start)
+        return False
+
+class Metrics:
+    """Named stage histograms and counters of one plugin session."""
+
+    def __init__(self, enabled=True):
+        """
+        :param enabled: False turns record() and count() into no-ops
+        """
+        self.enabled = enabled
+        self.started = time.time()
+        self.histograms = {}
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, stage):
+        """Returns the histogram of a stage, creating it on first use."""
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(stage, Histogram())
+        return histogram
+
+    def record(self, stage, elapsed_ns):
+        """
+        Records how long one pass through a stage took.
+
+        :param stage: Stage name, e.g. 'on_message'
+        :param elapsed_ns: Time spent in nanoseconds
+        """
+        if self.enabled:
+            (self.histograms.get(stage) or self.histogram(stage)).record(elapsed_ns)
+
+    def timed(self, stage):
+        """Returns a context manager recording the time spent in its block under a stage name."""
+        return _StageTimer(self, stage)
+
+    def count(self, name, amount=1):
+        """Adds to a counter."""
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def reset(self):
+        """Forgets every measurement and counter and restarts the rate clock."""
+        with self._lock:
+            self.histograms = {}
+            self.counters = {}
+            self.started = time.time()
+
+    def snapshot(self):
+        """
+        Returns every stage and counter as a JSON-friendly dictionary.
+        Rates are per second since the metrics were created or reset.
+        """
+        uptime = max(time.time() - self.started, 1e-9)
+        with self._lock:
+            histograms = dict(self.histograms)
+            counters = dict(self.counters)
+        stages = {}
+        for stage, histogram in sorted(histograms.items()):
+            stages[stage] = histogram.snapshot()
+            stages[stage]['per_second'] = stages[stage]['count'] / uptime
+        return {
+            'time': time.time(),
+            'uptime': uptime,
+            'stages': stages,
+            'counters': counters,
+            'rates': {name: value / uptime for name, value in sorted(counters.items())},
+        }
+
+    def format_lines(self, snapshot=None):
+        """
+        Formats a snapshot as the lines /RSTATS prints.
+
+        :param snapshot: Result of snapshot(), a new one by default
+        :return: List of lines
+        """
+        snapshot = snapshot or self.snapshot()
+        minutes, seconds = divmod(int(snapshot['uptime']), 60)
+        lines = [f"Readability stats over {minutes}m{seconds:02d}s" + ("" if self.enabled else " (disabled)")]
+        for stage, stats in snapshot['stages'].items():
+            lines.append(f"  {stage}: {stats['count']} calls ({stats['per_second']:.1f}/s), "
+                         f"p50 {stats['p50_us']:.0f}us, p90 {stats['p90_us']:.0f}us, "
+                         f"p99 {stats['p99_us']:.0f}us, max {stats['max_us']:.0f}us")
+        if snapshot['counters']:
+            lines.append("  " + ", ".join(f"{name} {value} ({snapshot['rates'][name]:.1f}/s)"
+                                          for name, value in sorted(snapshot['counters'].items())))
+        return lines
+
+    def dump(self, path, extra=None):
+        """
+        Appends a snapshot to a JSON Lines file.
+
+        :param path: File to append to
+        :param extra: Dictionary of other values to store with it, e.g. queue depths
+        """
+        snapshot = self.snapshot()
+        if extra:
+            snapshot.update(extra)
+        with open(path, 'a', encoding='utf-8') as dump_file:
+            dump_file.write(json.dumps(snapshot) + '\n')
+
+metrics = Metrics()
@@ -0,0 +1,246 @@
+import argparse
+import mmap
+import os
+import struct
+import sys
+import time
+import zlib
+from array import array
+
+from storage import hexchat_config_dir
+
+# Lexicon file the plugin and the command line tools look for in HexChat's config folder
+LEXICON_FILE = "readability_lexicon.bin"
+
+# Channel jargon accepted as words, one per line, compiled in when the file exists
+JARGON_FILE = "readability_jargon.txt"
+
+# Version of the file layout, bumped whenever it changes
+LEXICON_FORMAT = 1
+LEXICON_MAGIC = b"RLEX"
+
+# Magic, format, word count, bucket count, blob size
+HEADER = struct.Struct("<4sIIII")
+
+def default_lexicon_path():
+    """Returns the default lexicon file, in HexChat's config folder."""
+    return os.path.join(hexchat_config_dir(), LEXICON_FILE)
+
+def default_jargon_path():
+    """Returns the default jargon allow-list, in HexChat's config folder."""
+    return os.path.join(hexchat_config_dir(), JARGON_FILE)
+
+def bucket_count(word_count):
+    """Returns the number of hash buckets for a lexicon, the next power of two holding every word."""
+    buckets = 1
+    while buckets < word_count:
+        buckets *= 2
+    return buckets
+
+def read_word_list(path):
+    """
+    Reads the words of a word list: one word per line, lines starting with # are comments.
+    Hunspell .dic files are read too, their first line holds the word count and the
+    affix flags after a slash are dropped, so only the stem of each entry is kept.
+
+    :param path: Path of the word list
+    :return: Set of words
+    """
+    words = set()
+    with open(path, 'r', encoding='utf-8', errors='replace') as word_file:
+        for number, line in enumerate(word_file):
+            line = line.strip()
+            if not line or line.startswith('#') or (number == 0 and line.isdigit()):
+                continue
+            word = line.split('/', 1)[0].strip() if path.endswith('.dic') else line
+            if word:
+                words.add(word)
+    return words
+
+def write_lexicon(path, words):
+    """
+    Compiles a set of words into a lexicon file.
+
+    Words are grouped by the CRC-32 of their UTF-8 bytes into a power of two of buckets,
+    so a lookup hashes the word once and compares it against the one or two words of its
+    bucket. The file holds a header, the bucket directory (index of the first word of each
+    bucket), the word offsets into the blob and the blob of concatenated words, with every
+    integer a little-endian uint32.
+
+    :param path: Lexicon file, replaced if it exists
+    :param words: Iterable of words
+    :return: Number of words written
+    """
+    encoded = sorted({word.encode('utf-8') for word in words if word})
+    buckets = bucket_count(len(encoded))
+    mask = buckets - 1
+    encoded.sort(key=lambda data: zlib.crc32(data) & mask)
+
+    directory = array('I', [0]) * (buckets + 1)
+    for data in encoded:
+        directory[(zlib.crc32(data) & mask) + 1] += 1
+    for bucket in range(buckets):
+        directory[bucket + 1] += directory[bucket]
+
+    offsets = array('I', [0])
+    for data in encoded:
+        offsets.append(offsets[-1] + len(data))
+    blob = b''.join(encoded)
+    if sys.byteorder != 'little':
+        directory.byteswap()
+        offsets.byteswap()
+
+    temp_path = path + '.tmp'
+    with open(temp_path, 'wb') as lexicon_file:
+        lexicon_file.write(HEADER.pack(LEXICON_MAGIC, LEXICON_FORMAT, len(encoded), buckets, len(blob)))
+        directory.tofile(lexicon_file)
+        offsets.tofile(lexicon_file)
+        lexicon_file.write(blob)
+    os.replace(temp_path, path)
+    return len(encoded)
+
+class Lexicon:
+    """
+    Read-only word set memory-mapped from a file written by write_lexicon().
+
+    The file is mapped rather than read, so every process using the same lexicon
+    (the plugin, LocalMain.py, the backfill and scorer processes) shares one copy of
+    it in the page cache, and opening it costs nothing until words are looked up.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: Lexicon file
+        :raises ValueError: If the file isn't a lexicon of this format
+        """
+        self.path = path
+        with open(path, 'rb') as lexicon_file:
+            self._map = mmap.mmap(lexicon_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self.word_count, self.bucket_count, blob_size = HEADER.unpack_from(self._map)
+        except struct.error:
+            magic = version = None
+        if magic != LEXICON_MAGIC or version != LEXICON_FORMAT:
+            self._map.close()
+            raise ValueError(f"{path} is not a readability lexicon of format {LEXICON_FORMAT}")
+
+        self._mask = self.bucket_count - 1
+        offsets_start = HEADER.size + 4 * (self.bucket_count + 1)
+        self._blob_start = offsets_start + 4 * (self.word_count + 1)
+        if len(self._map) != self._blob_start + blob_size:
+            self._map.close()
+            raise ValueError(f"{path} is truncated")
+        if sys.byteorder == 'little':
+            self._view = memoryview(self._map)
+            self._directory = self._view[HEADER.size:offsets_start].cast('I')
+            self._offsets = self._view[offsets_start:self._blob_start].cast('I')
+        else:
+            self._view = None
+            self._directory = array('I', self._map[HEADER.size:offsets_start])
+            self._offsets = array('I', self._map[offsets_start:self._blob_start])
+            self._directory.byteswap()
+            self._offsets.byteswap()
+
+    def __len__(self):
+        return self.word_count
+
+    def __contains__(self, word):
+        data = word.encode('utf-8')
+        bucket = zlib.crc32(data) & self._mask
+        offsets = self._offsets
+        base = self._blob_start
+        for index in range(self._directory[bucket], self._directory[bucket + 1]):
+            if self._map[base + offsets[index]:base + offsets[index + 1]] == data:
+                return True
+        return False
+
+    def check(self, word):
+        """
+        Checks a token the way PyEnchant does: as written, and for capitalized or
+        all caps tokens also in lower case and capitalized, so "Hello" and "HELLO"
+        match "hello" and "PARIS" matches "Paris".
+
+        :param word: A normalized token
+        :return: True if the lexicon holds the word
+        """
+        if word in self:
+            return True
+        if word.isupper() or word.istitle():
+            lower = word.lower()
+            return (lower != word and lower in self) or (word.isupper() and word.capitalize() in self)
+        return False
+
+    def words(self):
+        """Yields every word of the lexicon, in bucket order."""
+        base = self._blob_start
+        for index in range(self.word_count):
+            yield self._map[base + self._offsets[index]:base + self._offsets[index + 1]].decode('utf-8')
+
+    def close(self):
+        """Unmaps the file."""
+        if self._map.closed:
+            return
+        if self._view is not None:
+            self._directory.release()
+            self._offsets.release()
+            self._view.release()
+        self._map.close()
+
+def build_lexicon(path, word_lists=(), jargon_path=None, easy_words=True):
+    """
+    Compiles the word lists, the Dale-Chall easy words and the jargon allow-list into a lexicon.
+
+    :param path: Lexicon file, replaced if it exists
+    :param word_lists: Paths of dictionary word lists, plain or Hunspell .dic
+    :param jargon_path: Path of the jargon allow-list, None for none
+    :param easy_words: Also compile in the Dale-Chall easy word list
+    :return: Number of words written
+    """
+    words = set()
+    for word_list in word_lists:
+        words |= read_word_list(word_list)
+    if easy_words:
+        import dale_chall
+        words |= dale_chall.get_easy_words()
+    if jargon_path:
+        words |= read_word_list(jargon_path)
+    return write_lexicon(path, words)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile the word lists into the lexicon word filtering checks "
+                                                 "before PyEnchant, or look words up in it.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="Compile a lexicon file")
+    build.add_argument("word_lists", nargs="*", help="Dictionary word lists, one word per line, or Hunspell .dic files")
+    build.add_argument("-o", "--output", default=default_lexicon_path(), help="Lexicon file, replaced if it exists")
+    build.add_argument("--jargon", default=default_jargon_path(),
+                       help="Channel jargon allow-list, compiled in when the file exists")
+    build.add_argument("--no-easy-words", action="store_true", help="Leave out the Dale-Chall easy word list")
+    check = commands.add_parser("check", help="Look words up in a lexicon")
+    check.add_argument("words", nargs="+", help="Words to look up")
+    check.add_argument("--lexicon", default=default_lexicon_path(), help="Lexicon file")
+    args = parser.parse_args()
+
+    if args.command == "check":
+        try:
+            lexicon = Lexicon(args.lexicon)
+        except (OSError, ValueError) as e:
+            print(e)
+            sys.exit(1)
+        for word in args.words:
+            print(f"{word}: {'yes' if lexicon.check(word) else 'no'}")
+        lexicon.close()
+        return
+
+    jargon_path = args.jargon if os.path.exists(args.jargon) else None
+    start = time.perf_counter()
+    try:
+        count = build_lexicon(args.output, args.word_lists, jargon_path, not args.no_easy_words)
+    except OSError as e:
+        print(f"Error building the lexicon: {e}")
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+    print(f"Compiled {count} words into {args.output} ({os.path.getsize(args.output)} bytes) in {elapsed:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import datetime
+import hexchat
+from readability_core import channel_label, display_nick, score_to_grade_level
+
+# Reporting configuration shared by both plugins
+REPORT_CONFIG = {
+    'interval_ms': 60000,       # How often the report is printed, if any user's stats changed
+    'top_n': 20,                # Users shown per report
+    'sort_by': 'messages',      # 'messages' for the most active users first, or 'average' for the highest scores first
+    'tab': '(readability)',     # Dedicated tab the report is printed in
+    'channels': []              # Only report these channels ('#channel' or 'network/#channel'), empty for all of them
+}
+
+def channel_selected(network, channel, channels=REPORT_CONFIG['channels']):
+    """
+    Tells whether a channel is included in the reports.
+
+    :param network: Network name
+    :param channel: Channel name
+    :param channels: Channel names or network/channel names to report, empty for every channel
+    :return: True if the channel is reported
+    """
+    return not channels or channel in channels or f"{network}/{channel}" in channels
+
+def get_report_context(tab_name):
+    """
+    Returns the context of the dedicated report tab, opening it if needed.
+
+    The tab is a server tab that never connects, so text typed into it by mistake
+    goes nowhere, where a query tab would send it to whoever uses the tab's name as a nick.
+
+    :param tab_name: Name of the tab
+    :return: A HexChat context
+    """
+    context = hexchat.find_context(server=tab_name)
+    if context is None:
+        hexchat.command(f"NEWSERVER -noconnect {tab_name}")
+        context = hexchat.find_context(server=tab_name)
+    return context or hexchat.get_context()
+
+def render_report(entries, top_n=REPORT_CONFIG['top_n'], sort_by=REPORT_CONFIG['sort_by'], scope=None):
+    """
+    Builds one consolidated report.
+
+    :param entries: Dictionary of username to (average score, message count, extra detail text or None)
+    :param top_n: Number of users shown
+    :param sort_by: 'messages' or 'average'
+    :param scope: Channel label shown in the header, None for no channel
+    :return: List of report lines
+    """
+    if sort_by == 'average':
+        key = lambda item: (item[1][0], item[1][1])
+    else:
+        key = lambda item: (item[1][1], item[1][0])
+    ranked = sorted(entries.items(), key=key, reverse=True)[:top_n]
+
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    where = f" in {scope}" if scope else ""
+    lines = [f"--- Average Readability Scores{where}, {timestamp}, top {len(ranked)} of {len(entries)} users by {sort_by} ---"]
+    for username, (avg_score, msg_count, details) in ranked:
+        line = f"{display_nick(username)}: {avg_score:.2f} ({score_to_grade_level(avg_score)}), {msg_count} messages"
+        if details:
+            line += f", {details}"
+        lines.append(line)
+    lines.append("--- End of Average Readability Scores ---")
+    return lines
+
+def print_report(lines, tab_name=REPORT_CONFIG['tab']):
+    """Prints report lines into the dedicated report tab. Must run on the HexChat thread."""
+    context = get_report_context(tab_name)
+    for line in lines:
+        context.prnt(line)
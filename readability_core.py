@@ -0,0 +1,354 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from instrumentation import metrics
+
+# Characters stripped from both ends of a token before it is checked
+STRIP_CHARS = "\"'`.,;:!?()[]{}<>*_~|/\\-"
+
+# Default number of words kept in the validity cache
+WORD_CACHE_SIZE = 50000
+
+# Default number of message scores kept in the score cache
+SCORE_CACHE_SIZE = 20000
+
+# mIRC color and formatting codes HexChat puts around nicks
+RE_FORMATTING = re.compile(r"\x03(\d{1,2}(,\d{1,2})?)?|[\x02\x0f\x11\x16\x1d\x1e\x1f]")
+
+_dictionary = None
+_dictionary_lock = threading.Lock()
+
+# Precompiled lexicon checked before PyEnchant, see use_lexicon()
+_lexicon = None
+_lexicon_fallback = True
+
+def get_dictionary():
+    """Returns the shared PyEnchant en_US dictionary, loading it on first use."""
+    global _dictionary
+    if _dictionary is None:
+        import enchant
+        _dictionary = enchant.Dict("en_US")
+    return _dictionary
+
+def use_lexicon(path, fallback=True):
+    """
+    Memory-maps a lexicon built by lexicon.py and checks words against it before PyEnchant.
+    Words the lexicon holds never reach the spell checker, and without a fallback
+    PyEnchant isn't loaded at all.
+
+    :param path: Lexicon file, None to stop using one
+    :param fallback: Ask PyEnchant about words the lexicon doesn't hold
+    :return: The Lexicon, or None if there is no lexicon at path
+    """
+    global _lexicon, _lexicon_fallback
+    lexicon = None
+    if path and os.path.exists(path):
+        from lexicon import Lexicon
+        lexicon = Lexicon(path)
+    _lexicon, _lexicon_fallback = lexicon, fallback
+    return lexicon
+
+def check_word(word):
+    """
+    Checks a token against the lexicon, then against PyEnchant.
+
+    :param word: A normalized token
+    :return: True if the word is a valid English word
+    """
+    lexicon = _lexicon
+    if lexicon is not None:
+        if lexicon.check(word):
+            return True
+        if not _lexicon_fallback:
+            return False
+    # PyEnchant is not thread-safe, so lookups are serialized
+    with _dictionary_lock:
+        return get_dictionary().check(word)
+
+def tokenize(sentence):
+    """
+    Splits a sentence into normalized word tokens.
+    Tokens are split on whitespace and surrounding punctuation is stripped,
+    so "dog." and "(dog" are both checked as "dog".
+
+    :param sentence: The sentence to split
+    :return: List of tokens, without empty ones
+    """
+    tokens = []
+    for word in sentence.split():
+        word = word.strip(STRIP_CHARS)
+        if word:
+            tokens.append(word)
+    return tokens
+
+class WordCache:
+    """
+    Bounded LRU cache of word validity in front of the lexicon and the PyEnchant dictionary.
+    IRC vocabulary repeats heavily, so most lookups never reach the spell checker.
+    """
+
+    def __init__(self, maxsize=WORD_CACHE_SIZE):
+        """
+        :param maxsize: Maximum number of words kept in the cache
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def is_valid(self, word):
+        """
+        Checks a word against the dictionary, using the cached answer when there is one.
+
+        :param word: A normalized token
+        :return: True if the word is a valid English word
+        """
+        with self._lock:
+            valid = self._entries.get(word)
+            if valid is not None:
+                self._entries.move_to_end(word)
+                self.hits += 1
+                return valid
+            self.misses += 1
+
+        valid = check_word(word)
+
+        with self._lock:
+            self._entries[word] = valid
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return valid
+
+    def clear(self):
+        """Empties the cache and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the cache size and hit/miss counters as a dictionary."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+    def load(self, path):
+        """
+        Warms the cache from a file written by save().
+
+        :param path: Path of the warm cache file
+        :return: Number of words loaded
+        """
+        if not path or not os.path.exists(path):
+            return 0
+        try:
+            with open(path, 'r', encoding='utf-8') as cache_file:
+                entries = json.load(cache_file)
+        except (OSError, ValueError):
+            return 0
+        with self._lock:
+            for word, valid in entries[-self.maxsize:]:
+                self._entries[word] = bool(valid)
+                self._entries.move_to_end(word)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return len(self._entries)
+
+    def save(self, path):
+        """
+        Writes the cached words to a file, least recently used first.
+
+        :param path: Path of the warm cache file
+        """
+        with self._lock:
+            entries = list(self._entries.items())
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as cache_file:
+            json.dump(entries, cache_file)
+        os.replace(temp_path, path)
+
+word_cache = WordCache()
+
+def normalize_message(sentence):
+    """Collapses whitespace, which never changes a message's score."""
+    return ' '.join(sentence.split())
+
+def message_key(sentence):
+    """Returns a 16-byte BLAKE2 hash of the normalized message, the key of the score cache."""
+    return hashlib.blake2b(normalize_message(sentence).encode('utf-8'), digest_size=16).digest()
+
+class ScoreCache:
+    """
+    Bounded LRU cache of message scores keyed by message_key().
+    Bots, relays and flood spam repeat lines verbatim, and those are only scored once.
+    """
+
+    def __init__(self, maxsize=SCORE_CACHE_SIZE):
+        """
+        :param maxsize: Maximum number of scores kept in the cache
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """
+        Looks up a cached score.
+
+        :param key: Result of message_key()
+        :return: The score, or None if the message wasn't scored recently
+        """
+        with self._lock:
+            score = self._entries.get(key)
+            if score is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return score
+
+    def put(self, key, score):
+        """Stores a score, evicting the least recently used one when the cache is full."""
+        with self._lock:
+            self._entries[key] = score
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Empties the cache and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        """Return the cache size and hit/miss counters as a dictionary."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+score_cache = ScoreCache()
+
+def filter_valid_words(sentence):
+    """
+    Filters out non-English words from the sentence using the lexicon and PyEnchant.
+
+    :param sentence: The sentence to filter
+    :return: A sentence containing only valid English words
+    """
+    is_valid = word_cache.is_valid
+    return ' '.join([word for word in tokenize(sentence) if is_valid(word)])
+
+def calculate_readability(sentence):
+    """
+    Calculate the readability score using the Dale-Chall readability formula.
+    Filters out non-English words before the calculation.
+    Messages scored recently are answered from the score cache.
+
+    :param sentence: The sentence to calculate readability for
+    :return: Dale-Chall readability score
+    """
+    key = message_key(sentence)
+    score = score_cache.get(key)
+    if score is not None:
+        return score
+
+    start = time.perf_counter_ns()
+    valid_sentence = filter_valid_words(sentence)
+    filtered = time.perf_counter_ns()
+    metrics.record("filter_words", filtered - start)
+
+    if not valid_sentence:
+        score = 0
+    else:
+        import textstat
+        score = textstat.dale_chall_readability_score(valid_sentence)
+        metrics.record("textstat", time.perf_counter_ns() - filtered)
+    score_cache.put(key, score)
+    return score
+
+def warm_up():
+    """
+    Loads what scoring the first message would otherwise load: textstat with its
+    syllable data, and PyEnchant unless the lexicon answers every word by itself.
+    """
+    import textstat
+    textstat.dale_chall_readability_score("The quick brown fox jumps over the lazy dog.")
+    if _lexicon is None or _lexicon_fallback:
+        with _dictionary_lock:
+            get_dictionary()
+
+def calculate_readability_many(sentences):
+    """
+    Calculate the readability scores of a batch of sentences with the built-in
+    Dale-Chall engine. Scores match calculate_readability within dale_chall.TEXTSTAT_TOLERANCE.
+
+    :param sentences: Iterable of sentences
+    :return: List of Dale-Chall readability scores
+    """
+    import dale_chall
+    return dale_chall.score_many(sentences).tolist()
+
+def display_nick(username):
+    """
+    Strips IRC color and formatting codes from a stored username.
+    Nicks logged by older versions of the plugin carried HexChat's nick color, until
+    Storage.initialize() merged them into the plain nick.
+
+    :param username: Username as stored in the database
+    :return: The plain nick
+    """
+    return RE_FORMATTING.sub("", username)
+
+def channel_label(network, channel):
+    """Returns how a network and channel are named in reports and the GUI."""
+    if not channel:
+        return "(no channel)"
+    return f"{channel} ({network})" if network else channel
+
+def score_to_grade_level(score):
+    """
+    Convert the Dale-Chall readability score to a grade level.
+
+    :param score: Dale-Chall readability score
+    :return: Corresponding grade level as a string
+    """
+    if score <= 4.9:
+        return "4th Grade or below"
+    elif score <= 5.9:
+        return "5th - 6th Grade"
+    elif score <= 6.9:
+        return "7th - 8th Grade"
+    elif score <= 7.9:
+        return "9th - 10th Grade"
+    elif score <= 8.9:
+        return "11th - 12th Grade"
+    else:
+        return "College Level"
@@ -0,0 +1,197 @@
+import argparse
+import sys
+import threading
+import time
+
+from storage import ARCHIVE_MODES, StorageError, open_storage
+
+# Storage configuration for compacting from the command line, same settings as the plugin
+STORAGE_CONFIG = {
+    'backend': 'mariadb',       # 'mariadb' or 'sqlite'
+    'sqlite_path': None         # SQLite database file, the one in HexChat's config folder by default
+}
+
+# Database configuration
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'UserNameHere',     # Replace with your MariaDB username
+    'password': 'PassWordHere', # Replace with your MariaDB password
+    'database': 'readability_analyzer' # Replace with your database name
+}
+
+# Retention configuration for the command line, same settings as the plugin
+RETENTION_CONFIG = {
+    'keep_days': 365,           # Messages younger than this stay searchable in the messages table
+    'mode': 'compress',         # 'keep', 'compress' or 'drop-text' the text in the monthly archive, or 'delete'
+    'batch_size': 1000          # Messages moved per transaction
+}
+
+def format_bytes(size):
+    """Formats a byte count with a binary unit."""
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if abs(size) < 1024 or unit == "GiB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024.0
+
+class RetentionJob:
+    """
+    Background thread moving messages older than keep_days out of the messages
+    table into monthly archive tables.
+
+    Every message is counted in user_stats and the hourly and daily rollups when it
+    is logged, so averages and trends keep including archived messages; only search
+    and live mode stop seeing them. Each batch is its own short transaction, and the
+    job sleeps as long as a batch took before the next one so the writer is never
+    held up for long. max_per_run caps one run; retention.py catches up a large
+    history from the command line.
+    """
+
+    def __init__(self, storage, keep_days=365, mode="compress", interval_ms=3600000, batch_size=1000,
+                 max_per_run=50000, pause_between_batches=True, up_to_id=None, on_error=None,
+                 name="readability-retention"):
+        """
+        :param storage: Storage backend the messages are archived in
+        :param keep_days: Age in days after which messages are archived
+        :param mode: One of storage.ARCHIVE_MODES
+        :param interval_ms: Time in milliseconds between two runs
+        :param batch_size: Messages moved per transaction
+        :param max_per_run: Most messages moved in one run, None for no limit
+        :param pause_between_batches: Sleep as long as a batch took before the next one
+        :param up_to_id: Callable returning the largest id that may be archived, e.g. the last
+                         message the stylometry job tagged, None for any
+        :param on_error: Callable invoked with a message when a run fails
+        :param name: Name of the job thread
+        """
+        if mode not in ARCHIVE_MODES:
+            raise ValueError(f"Unknown archive mode {mode!r}, expected one of {ARCHIVE_MODES}")
+        self.storage = storage
+        self.keep_days = keep_days
+        self.mode = mode
+        self.interval = max(0.001, interval_ms / 1000.0)
+        self.batch_size = max(1, int(batch_size))
+        self.max_per_run = max_per_run
+        self.pause_between_batches = pause_between_batches
+        self.up_to_id = up_to_id
+        self.on_error = on_error
+        self.name = name
+
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Counters, read by the plugin for its status output
+        self.runs = 0
+        self.messages_archived = 0
+        self.bytes_removed = 0
+        self.bytes_archived = 0
+        self.errors = 0
+        self.last_run = None
+
+    def start(self):
+        """Start the job thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """
+        Stop the job thread, letting it finish the batch it is moving.
+
+        :param timeout: Maximum number of seconds to wait for the thread
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except StorageError as e:
+                self.errors += 1
+                if self.on_error is not None:
+                    self.on_error(f"Error archiving old messages: {e}")
+
+    def run_once(self):
+        """
+        Archives the messages that aged past keep_days since the last run.
+
+        :return: (messages moved, text bytes removed from the live tables, bytes written to the archive) tuple
+        """
+        cutoff = time.time() - self.keep_days * 86400
+        up_to_id = self.up_to_id() if self.up_to_id is not None else None
+        moved = removed = archived = 0
+        while not self._stop.is_set() and (self.max_per_run is None or moved < self.max_per_run):
+            start = time.perf_counter()
+            count, batch_removed, batch_archived = self.storage.archive_messages(cutoff, self.batch_size, self.mode,
+                                                                                up_to_id)
+            moved += count
+            removed += batch_removed
+            archived += batch_archived
+            self.messages_archived += count
+            self.bytes_removed += batch_removed
+            self.bytes_archived += batch_archived
+            if count < self.batch_size:
+                break
+            if self.pause_between_batches:
+                self._stop.wait(min(time.perf_counter() - start, 1.0))
+        self.runs += 1
+        self.last_run = time.time()
+        return moved, removed, archived
+
+    def stats(self):
+        """Return a snapshot of the job counters as a dictionary."""
+        return {
+            'runs': self.runs,
+            'messages_archived': self.messages_archived,
+            'bytes_removed': self.bytes_removed,
+            'bytes_archived': self.bytes_archived,
+            'errors': self.errors,
+            'last_run': self.last_run,
+            'keep_days': self.keep_days,
+            'mode': self.mode,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Move messages older than the retention period into monthly "
+                                                 "archive tables. Averages and trends keep counting them.")
+    parser.add_argument("--keep-days", type=float, default=RETENTION_CONFIG['keep_days'],
+                        help="Age in days after which messages are archived")
+    parser.add_argument("--mode", choices=ARCHIVE_MODES, default=RETENTION_CONFIG['mode'],
+                        help="What the archive keeps of each message")
+    parser.add_argument("--batch-size", type=int, default=RETENTION_CONFIG['batch_size'],
+                        help="Messages moved per transaction")
+    parser.add_argument("--ignore-stylometry", action="store_true",
+                        help="Also archive messages stylometry.py hasn't tagged yet, for installs that don't use it")
+    parser.add_argument("--reclaim", action="store_true",
+                        help="Rebuild the database files afterwards to give the freed space back to the file system")
+    args = parser.parse_args()
+
+    storage = open_storage(STORAGE_CONFIG, DB_CONFIG)
+    try:
+        storage.initialize()
+        start = time.perf_counter()
+        # Same bound as the plugin: messages the stylometry job hasn't tagged yet stay in the live table
+        up_to_id = None if args.ignore_stylometry else storage.pos_last_id
+        job = RetentionJob(storage, args.keep_days, args.mode, batch_size=args.batch_size, max_per_run=None,
+                           pause_between_batches=False, up_to_id=up_to_id)
+        moved, removed, archived = job.run_once()
+        elapsed = time.perf_counter() - start
+        print(f"Archived {moved} messages in {elapsed:.1f}s: {format_bytes(removed)} of text removed from the "
+              f"live tables, {format_bytes(archived)} written to the archive ({args.mode})")
+        if not moved and not args.ignore_stylometry and storage.pos_last_id() == 0:
+            print("No message has part-of-speech counts yet, so none were archived. Run stylometry.py first, "
+                  "or pass --ignore-stylometry if you don't use it")
+        if args.reclaim:
+            print(f"Database files shrank by {format_bytes(storage.reclaim_space())}")
+    except StorageError as e:
+        print(f"Error archiving old messages: {e}")
+        sys.exit(1)
+    finally:
+        storage.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import json
+import os
+import socket
+import threading
+import time
+from collections import deque
+
+SOCKET_FILE = "readability_scorer.sock"
+
+def encode_line(value):
+    """Encodes one protocol message as a JSON line."""
+    return (json.dumps(value, separators=(',', ':')) + '\n').encode('utf-8')
+
+def decode_line(line):
+    """Decodes one JSON line, raising ValueError if it is not a JSON object."""
+    value = json.loads(line)
+    if not isinstance(value, dict):
+        raise ValueError("expected a JSON object")
+    return value
+
+class ScorerUnavailable(Exception):
+    """Raised when the scorer daemon can't be reached or doesn't answer."""
+
+class ScorerClient:
+    """
+    Plugin side of the scorer daemon (scorer_daemon.py).
+
+    Messages are streamed as JSON lines over a non-blocking UNIX socket: send()
+    never waits for the daemon, it queues the line and writes whatever the
+    socket accepts right now. When the daemon is down, falls behind by more than
+    max_buffer messages or the connection breaks, send() returns the messages
+    the daemon never fully received so the caller can score them itself.
+    Reconnecting is retried every retry_interval seconds.
+
+    Queries such as user_averages() use their own short-lived connection, so
+    they can run on the report thread while the worker streams messages. The
+    streaming connection starts with a random stream id, and user_averages()
+    passes it with the number of messages written to it, so the daemon first
+    reads the ones still in the socket buffer.
+    """
+
+    def __init__(self, socket_path, retry_interval=10.0, max_buffer=1000, timeout=5.0):
+        """
+        :param socket_path: Path of the daemon's UNIX socket
+        :param retry_interval: Seconds between connection attempts while the daemon is down
+        :param max_buffer: Messages that may wait for the socket before falling back to local scoring
+        :param timeout: Seconds a query may take
+        """
+        self.socket_path = socket_path
+        self.retry_interval = retry_interval
+        self.max_buffer = max(1, int(max_buffer))
+        self.timeout = timeout
+
+        self._sock = None
+        self._pending = deque()
+        self._sent_bytes = 0
+        self._stream = None
+        self._stream_sent = 0
+        self._next_retry = 0.0
+        self._lock = threading.Lock()
+
+        # Counters, read by the plugin for its status output
+        self.sent = 0
+        self.fallbacks = 0
+        self.reconnects = 0
+
+    @property
+    def connected(self):
+        """True while a connection to the daemon is open."""
+        return self._sock is not None
+
+    def _connect(self):
+        if getattr(socket, 'AF_UNIX', None) is None or time.monotonic() < self._next_retry:
+            return False
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            stream = os.urandom(8).hex()
+            sock.sendall(encode_line({'op': 'stream', 'stream': stream}))
+            sock.setblocking(False)
+        except OSError:
+            sock.close()
+            self._next_retry = time.monotonic() + self.retry_interval
+            return False
+        self._sock = sock
+        self._stream = stream
+        self._stream_sent = 0
+        self.reconnects += 1
+        return True
+
+    def _disconnect(self):
+        """Closes the connection and returns the messages the daemon didn't fully receive."""
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+            self._stream = None
+        self._next_retry = time.monotonic() + self.retry_interval
+        unsent = [message for message, data in self._pending]
+        self._pending.clear()
+        self._sent_bytes = 0
+        return unsent
+
+    def _drain(self):
+        """Writes queued lines until the socket would block."""
+        while self._pending:
+            message, data = self._pending[0]
+            sent = self._sock.send(data[self._sent_bytes:])
+            self._sent_bytes += sent
+            if self._sent_bytes < len(data):
+                return
+            self._pending.popleft()
+            self._sent_bytes = 0
+            self.sent += 1
+            self._stream_sent += 1
+
+    def send(self, message):
+        """
+        Streams one message to the daemon without waiting for it.
+
+        :param message: (network, channel, nick, text, timestamp) tuple
+        :return: List of messages the daemon won't score, to be scored locally; empty on success
+        """
+        with self._lock:
+            if self._sock is None and not self._connect():
+                self.fallbacks += 1
+                return [message]
+            self._pending.append((message, encode_line({'op': 'message', 'message': list(message)})))
+            try:
+                self._drain()
+            except BlockingIOError:
+                pass
+            except OSError:
+                unsent = self._disconnect()
+                self.fallbacks += len(unsent)
+                return unsent
+            if len(self._pending) > self.max_buffer:
+                # The daemon stopped reading, take the backlog back
+                unsent = self._disconnect()
+                self.fallbacks += len(unsent)
+                return unsent
+            return []
+
+    def query(self, op, **params):
+        """
+        Sends a request to the daemon and waits for its answer.
+
+        :param op: Name of the request, e.g. 'averages'
+        :param params: Arguments of the request
+        :return: The answer as a dictionary
+        """
+        if getattr(socket, 'AF_UNIX', None) is None:
+            raise ScorerUnavailable("UNIX sockets are not supported on this platform")
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.settimeout(self.timeout)
+                sock.connect(self.socket_path)
+                sock.sendall(encode_line(dict(params, op=op)))
+                with sock.makefile('rb') as reader:
+                    line = reader.readline()
+        except OSError as e:
+            raise ScorerUnavailable(f"scorer daemon at {self.socket_path} is not reachable: {e}") from e
+        if not line:
+            raise ScorerUnavailable("scorer daemon closed the connection")
+        try:
+            answer = decode_line(line)
+        except ValueError as e:
+            raise ScorerUnavailable(f"bad answer from the scorer daemon: {e}") from e
+        if not answer.get('ok'):
+            raise ScorerUnavailable(answer.get('error', "scorer daemon request failed"))
+        return answer
+
+    def user_averages(self, usernames, network, channel):
+        """
+        Asks the daemon for the averages of some users in a channel, once it has
+        scored and stored every message written to the stream before the request.
+        Call flush() first for the queued messages to count as well.
+
+        :return: List of (username, average score, message count) tuples
+        """
+        with self._lock:
+            stream, sent = self._stream, self._stream_sent
+        answer = self.query('averages', users=list(usernames), network=network, channel=channel,
+                            stream=stream, sent=sent)
+        return [tuple(entry) for entry in answer['averages']]
+
+    def flush(self):
+        """
+        Writes out the queued messages, waiting up to timeout seconds.
+
+        :return: List of messages the daemon won't receive because the connection broke
+        """
+        with self._lock:
+            if self._sock is None or not self._pending:
+                return []
+            try:
+                self._sock.settimeout(self.timeout)
+                self._drain()
+                self._sock.setblocking(False)
+            except OSError:
+                unsent = self._disconnect()
+                self.fallbacks += len(unsent)
+                return unsent
+            return []
+
+    def close(self):
+        """
+        Writes out the queued messages and closes the connection.
+
+        :return: List of messages the daemon didn't receive
+        """
+        unsent = self.flush()
+        with self._lock:
+            if self._sock is not None:
+                self._disconnect()
+        return unsent
+
+    def stats(self):
+        """Return a snapshot of the client counters as a dictionary."""
+        with self._lock:
+            return {
+                'connected': self.connected,
+                'socket_path': self.socket_path,
+                'buffered': len(self._pending),
+                'sent': self.sent,
+                'fallbacks': self.fallbacks,
+                'reconnects': self.reconnects,
+            }
+
+def default_socket_path(config_dir):
+    """Returns the daemon's socket path in a HexChat config folder."""
+    return os.path.join(config_dir, SOCKET_FILE)
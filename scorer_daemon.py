@@ -0,0 +1,391 @@
+import argparse
+import asyncio
+import os
+import signal
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from db_writer import BatchWriter
+from instrumentation import metrics
+from lexicon import default_lexicon_path
+from readability_core import calculate_readability, use_lexicon
+from scorer_client import SOCKET_FILE, decode_line, encode_line
+from storage import StorageError, hexchat_config_dir, open_storage
+
+# Storage configuration, same settings as the plugin
+STORAGE_CONFIG = {
+    'backend': 'mariadb',       # 'mariadb' or 'sqlite'
+    'sqlite_path': None,        # SQLite database file, the one in HexChat's config folder by default
+    'pool_size': 2,             # Pooled MariaDB connections
+    'dedupe_texts': False       # Store repeated message texts once, same setting as the plugin
+}
+
+# Database configuration
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'UserNameHere',     # Replace with your MariaDB username
+    'password': 'PassWordHere', # Replace with your MariaDB password
+    'database': 'readability_analyzer' # Replace with your database name
+}
+
+# Daemon configuration
+DAEMON_CONFIG = {
+    'socket_path': os.path.join(hexchat_config_dir(), SOCKET_FILE),
+    'processes': os.cpu_count() or 1,  # Scoring processes
+    'chunk_size': 200,          # Messages sent to a scoring process at a time
+    'chunk_interval_ms': 100,   # Longest time a message waits for its chunk to fill up
+    'stream_wait_ms': 2000,     # Longest time an averages request waits for the messages streamed before it
+    'max_line': 1 << 20         # Longest accepted request line in bytes
+}
+
+# Batched database writer configuration
+WRITER_CONFIG = {
+    'batch_size': 1000,         # Rows per INSERT batch
+    'flush_interval_ms': 1000,  # Longest time a row waits before being written
+    'retry_interval': 30.0      # Seconds between reconnect attempts while the database is down
+}
+SPOOL_FILE = "readability_daemon_spool.jsonl"  # Rows written here while the database is unreachable
+REJECT_FILE = "readability_daemon_rejected.jsonl"  # Rows the database refused, with the error
+
+def score_messages(messages):
+    """
+    Scores a chunk of messages. Runs in a worker process.
+
+    :param messages: List of (network, channel, nick, text, timestamp) lists
+    :return: List of (username, message, readability_score, timestamp, network, channel) rows
+    """
+    return [(nick, text, calculate_readability(text), timestamp, network, channel)
+            for network, channel, nick, text, timestamp in messages]
+
+def score_singly(messages):
+    """
+    Scores a chunk one message at a time in the daemon's own process, when the pool failed on it.
+
+    :param messages: List of (network, channel, nick, text, timestamp) lists
+    :return: The scored rows, and (row, error) pairs for the messages that failed on their own
+    """
+    rows, failed = [], []
+    for network, channel, nick, text, timestamp in messages:
+        try:
+            rows.append((nick, text, calculate_readability(text), timestamp, network, channel))
+        except Exception as e:
+            failed.append(((nick, text, None, timestamp, network, channel), e))
+    return rows, failed
+
+def log(text):
+    """Prints a timestamped line to stderr."""
+    print(time.strftime("%H:%M:%S ") + text, file=sys.stderr, flush=True)
+
+class ScorerDaemon:
+    """
+    asyncio server scoring the messages the plugins stream over a UNIX socket.
+
+    Messages are collected into chunks, scored on a process pool so every core
+    is used, and written by a BatchWriter. Requests, one JSON object per line:
+
+      {"op": "stream", "stream": id}
+          Names the connection's message stream, nothing is answered.
+      {"op": "message", "message": [network, channel, nick, text, timestamp]}
+          Scores and stores a message, nothing is answered.
+      {"op": "averages", "users": [...], "network": ..., "channel": ..., "stream": id, "sent": n}
+          Answers {"ok": true, "averages": [[username, average, count], ...]} once
+          every message received before the request is stored. With a stream, the
+          daemon first waits until it has read that stream's first n messages, the
+          ones still in the socket buffer when the request arrived included.
+      {"op": "stats"}
+          Answers {"ok": true, "stats": {...}} with the daemon's counters.
+
+    Failed requests are answered with {"ok": false, "error": "..."}, except on a
+    connection that streams messages: the plugin never reads answers there, so
+    its bad lines are logged and dropped rather than filling the socket buffer.
+
+    A chunk the process pool fails on is scored again in the daemon's own
+    process, one message at a time; messages that fail there too go to the
+    writer's reject file.
+    """
+
+    def __init__(self, storage, executor, writer, chunk_size=200, chunk_interval_ms=100, max_line=1 << 20,
+                 stream_wait_ms=2000):
+        """
+        :param storage: Storage backend answering the aggregate queries
+        :param executor: Process pool scoring the chunks
+        :param writer: BatchWriter storing the scored rows
+        :param chunk_size: Messages sent to a scoring process at a time
+        :param chunk_interval_ms: Longest time in milliseconds a message waits for its chunk to fill up
+        :param max_line: Longest accepted request line in bytes
+        :param stream_wait_ms: Longest time in milliseconds an averages request waits for its stream
+        """
+        self.storage = storage
+        self.executor = executor
+        self.writer = writer
+        self.chunk_size = max(1, int(chunk_size))
+        self.chunk_interval = max(0.001, chunk_interval_ms / 1000.0)
+        self.max_line = max_line
+        self.stream_wait = max(0.0, stream_wait_ms / 1000.0)
+
+        self._chunk = []
+        self._chunk_timer = None
+        self._scoring = set()
+        self._server = None
+        self._streams = {}          # Stream id -> messages read from it
+        self._stream_waiters = {}   # Stream id -> [(messages awaited, future)]
+
+        # Counters, answered by the stats request
+        self.clients = 0
+        self.received = 0
+        self.scored = 0
+        self.scored_locally = 0
+        self.unscored = 0
+        self.errors = 0
+
+    async def start(self, socket_path):
+        """Listens on a UNIX socket only the current user can connect to."""
+        if os.path.exists(socket_path):
+            # Left behind by a daemon that didn't shut down cleanly
+            os.remove(socket_path)
+        old_umask = os.umask(0o177)
+        try:
+            self._server = await asyncio.start_unix_server(self.handle_client, path=socket_path, limit=self.max_line)
+        finally:
+            os.umask(old_umask)
+
+    async def stop(self):
+        """Stops accepting connections and stores every message received so far."""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        await self.drain()
+
+    async def handle_client(self, reader, writer):
+        """Serves one connection until the client closes it."""
+        self.clients += 1
+        connection = {'streaming': False, 'stream': None}
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    self.errors += 1
+                    if connection['streaming']:
+                        log("Closed a streaming connection that sent a line longer than the limit")
+                    else:
+                        await self.answer(writer, {'ok': False, 'error': "request line too long"})
+                    break
+                if not line:
+                    break
+                if not line.endswith(b"\n"):
+                    # Connection lost in the middle of a line, the plugin scores that message itself
+                    break
+                await self.handle_line(line, writer, connection)
+        except ConnectionError:
+            pass
+        finally:
+            self.clients -= 1
+            self._streams.pop(connection['stream'], None)
+            writer.close()
+
+    async def handle_line(self, line, writer, connection):
+        """
+        Handles one request line.
+
+        :param connection: State of the connection, updated by the line: 'streaming' is True once it
+            named a stream or streamed a message, its client then reads no answers; 'stream' is its stream id
+        """
+        try:
+            request = decode_line(line)
+            op = request.get('op')
+            if op == 'message':
+                connection['streaming'] = True
+                network, channel, nick, text, timestamp = request['message']
+                self.add_message([network, channel, nick, text, timestamp])
+                if connection['stream'] is not None:
+                    self.stream_received(connection['stream'])
+                return
+            if op == 'stream':
+                connection['streaming'] = True
+                stream = str(request['stream'])
+                self._streams.pop(connection['stream'], None)
+                self._streams.setdefault(stream, 0)
+                connection['stream'] = stream
+                return
+            if op == 'averages':
+                await self.wait_for_stream(request.get('stream'), request.get('sent', 0))
+                averages = await self.user_averages(request.get('users'), request.get('network'),
+                                                    request.get('channel'))
+                answer = {'ok': True, 'averages': [list(entry) for entry in averages]}
+            elif op == 'stats':
+                answer = {'ok': True, 'stats': self.stats()}
+            else:
+                answer = {'ok': False, 'error': f"unknown request {op!r}"}
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            self.errors += 1
+            answer = {'ok': False, 'error': f"bad request: {e}"}
+        except StorageError as e:
+            self.errors += 1
+            answer = {'ok': False, 'error': f"database error: {e}"}
+        if connection['streaming']:
+            if not answer['ok']:
+                log(f"Dropped a line from a streaming connection, {answer['error']}")
+            return
+        await self.answer(writer, answer)
+
+    def stream_received(self, stream):
+        """Counts a message read from a stream, waking the requests waiting for it."""
+        received = self._streams[stream] = self._streams.get(stream, 0) + 1
+        for awaited, future in self._stream_waiters.get(stream, ()):
+            if awaited <= received and not future.done():
+                future.set_result(None)
+
+    async def wait_for_stream(self, stream, sent):
+        """
+        Waits until the daemon has read the first messages of a stream, at most stream_wait seconds.
+
+        :param stream: Stream id the client named its streaming connection with, None to not wait
+        :param sent: Number of messages the client wrote to that stream
+        """
+        if stream is None or self._streams.get(stream, 0) >= sent:
+            return
+        future = asyncio.get_running_loop().create_future()
+        waiters = self._stream_waiters.setdefault(stream, [])
+        waiters.append((sent, future))
+        try:
+            await asyncio.wait_for(future, self.stream_wait)
+        except asyncio.TimeoutError:
+            log(f"Answering averages after {self._streams.get(stream, 0)} of the {sent} messages streamed before them")
+        finally:
+            waiters.remove((sent, future))
+            if not waiters:
+                del self._stream_waiters[stream]
+
+    async def answer(self, writer, answer):
+        writer.write(encode_line(answer))
+        await writer.drain()
+
+    def add_message(self, message):
+        """Adds a message to the current chunk, sending the chunk off when it is full."""
+        self.received += 1
+        self._chunk.append(message)
+        if len(self._chunk) >= self.chunk_size:
+            self.send_chunk()
+        elif self._chunk_timer is None:
+            self._chunk_timer = asyncio.get_running_loop().call_later(self.chunk_interval, self.send_chunk)
+
+    def send_chunk(self):
+        """Hands the current chunk to the process pool."""
+        if self._chunk_timer is not None:
+            self._chunk_timer.cancel()
+            self._chunk_timer = None
+        if not self._chunk:
+            return
+        chunk, self._chunk = self._chunk, []
+        task = asyncio.ensure_future(self.score_chunk(chunk))
+        self._scoring.add(task)
+        task.add_done_callback(self._scoring.discard)
+
+    async def score_chunk(self, chunk):
+        start = time.perf_counter_ns()
+        loop = asyncio.get_running_loop()
+        try:
+            rows = await loop.run_in_executor(self.executor, score_messages, chunk)
+        except Exception as e:
+            log(f"Scoring process failed on {len(chunk)} messages, scoring them in the daemon: {e}")
+            rows, failed = await loop.run_in_executor(None, score_singly, chunk)
+            self.scored_locally += len(rows)
+            self.unscored += len(failed)
+            for row, error in failed:
+                await loop.run_in_executor(None, self.writer.reject, row, error)
+        for row in rows:
+            self.writer.add(row)
+        self.scored += len(rows)
+        metrics.count("messages", len(rows))
+        metrics.record("score_chunk", time.perf_counter_ns() - start)
+
+    async def drain(self):
+        """Waits until every message received so far is scored and written."""
+        self.send_chunk()
+        while self._scoring:
+            await asyncio.gather(*self._scoring)
+        await asyncio.get_running_loop().run_in_executor(None, self.writer.flush)
+
+    async def user_averages(self, usernames, network, channel):
+        """Reads the averages of some users in a channel, including every message received so far."""
+        start = time.perf_counter_ns()
+        await self.drain()
+        averages = await asyncio.get_running_loop().run_in_executor(
+            None, self.storage.user_averages, usernames, network, channel)
+        metrics.record("averages", time.perf_counter_ns() - start)
+        return averages
+
+    def stats(self):
+        """Return a snapshot of the daemon counters as a dictionary."""
+        return {
+            'clients': self.clients,
+            'received': self.received,
+            'scored': self.scored,
+            'scored_locally': self.scored_locally,
+            'unscored': self.unscored,
+            'chunked': len(self._chunk),
+            'scoring': len(self._scoring),
+            'errors': self.errors,
+            'writer': self.writer.stats(),
+            'metrics': metrics.snapshot(),
+        }
+
+async def serve(daemon, socket_path):
+    """Runs the daemon until SIGINT or SIGTERM, then stores what it received and removes the socket."""
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+
+    await daemon.start(socket_path)
+    log(f"Scorer daemon listening on {socket_path}")
+    try:
+        await stopping.wait()
+    finally:
+        await daemon.stop()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+    log(f"Scorer daemon stopped, {daemon.scored} messages scored")
+
+def main():
+    parser = argparse.ArgumentParser(description="Score the messages streamed by the HexChat plugin on every core "
+                                                 "and store them in the messages table.")
+    parser.add_argument("--socket", default=DAEMON_CONFIG['socket_path'], help="UNIX socket to listen on")
+    parser.add_argument("--processes", type=int, default=DAEMON_CONFIG['processes'], help="Scoring processes")
+    parser.add_argument("--chunk-size", type=int, default=DAEMON_CONFIG['chunk_size'],
+                        help="Messages sent to a process at a time")
+    parser.add_argument("--lexicon", default=default_lexicon_path(),
+                        help="Word lexicon built by lexicon.py, shared by the scoring processes when it exists")
+    args = parser.parse_args()
+
+    if not hasattr(asyncio, 'start_unix_server'):
+        print("The scorer daemon needs UNIX domain sockets, the plugin scores messages itself on this platform.")
+        sys.exit(1)
+
+    storage = open_storage(STORAGE_CONFIG, DB_CONFIG)
+    try:
+        storage.initialize()
+    except StorageError as e:
+        print(f"Error connecting to the database: {e}")
+        sys.exit(1)
+
+    writer = BatchWriter(storage.insert_messages, spool_path=os.path.join(hexchat_config_dir(), SPOOL_FILE),
+                         reject_path=os.path.join(hexchat_config_dir(), REJECT_FILE),
+                         on_error=log, **WRITER_CONFIG)
+    writer.start()
+    # Chunks the pool fails on are scored in this process
+    use_lexicon(args.lexicon)
+    try:
+        with ProcessPoolExecutor(max_workers=args.processes, initializer=use_lexicon,
+                                 initargs=(args.lexicon,)) as executor:
+            daemon = ScorerDaemon(storage, executor, writer, args.chunk_size, DAEMON_CONFIG['chunk_interval_ms'],
+                                  DAEMON_CONFIG['max_line'], DAEMON_CONFIG['stream_wait_ms'])
+            asyncio.run(serve(daemon, args.socket))
+    finally:
+        writer.close()
+        storage.close()
+
+if __name__ == "__main__":
+    main()
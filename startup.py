@@ -0,0 +1,173 @@
+import os
+import sys
+import threading
+import time
+
+def memory_usage():
+    """
+    Returns the resident memory of this process in bytes, None where it can't be read.
+    On Linux this is the current size, elsewhere the peak size getrusage reports.
+    """
+    try:
+        with open("/proc/self/statm", 'r') as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class StartupProfile:
+    """
+    Time and memory taken by each phase of loading the plugin, shown by /RSTARTUP.
+
+    The phases of /py load itself are recorded with mark(), each one measured from
+    the previous mark. The phases the warm-up thread runs afterwards are recorded
+    by WarmUp. Memory is the change in the resident size of HexChat's process, so
+    it includes whatever other threads allocated meanwhile.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.loaded = None
+        self.ready = None
+        self.buffered = 0
+        self.dropped = 0
+        self.phases = []
+        self._lock = threading.Lock()
+        self._last = (self.started, memory_usage())
+
+    def add(self, name, elapsed, memory_delta, background, error=None):
+        """
+        Records one phase.
+
+        :param name: Name of the phase
+        :param elapsed: Seconds it took
+        :param memory_delta: Change in resident memory in bytes, None if unknown
+        :param background: True if the warm-up thread ran it
+        :param error: Description of the error it failed with, None if it succeeded
+        """
+        with self._lock:
+            self.phases.append((name, elapsed, memory_delta, background, error))
+
+    def mark(self, name):
+        """Records a phase of /py load ending now, measured from the previous mark."""
+        now, memory = time.perf_counter(), memory_usage()
+        last_time, last_memory = self._last
+        self.add(name, now - last_time, None if memory is None or last_memory is None else memory - last_memory, False)
+        self._last = (now, memory)
+
+    def finish_loading(self):
+        """Notes that /py load returned."""
+        self.loaded = time.perf_counter() - self.started
+
+    def finish_warm_up(self):
+        """Notes that the warm-up finished and buffered messages are being processed."""
+        self.ready = time.perf_counter() - self.started
+
+    def format_lines(self):
+        """Returns the lines /RSTARTUP prints."""
+        if self.ready is None:
+            state = "still warming up"
+        else:
+            state = f"ready after {self.ready * 1000:.0f} ms"
+        loaded = "still loading" if self.loaded is None else f"/py load took {self.loaded * 1000:.0f} ms"
+        with self._lock:
+            phases = list(self.phases)
+        failed = sum(1 for phase in phases if phase[4] is not None)
+        if failed:
+            state += f", {failed} {'phase' if failed == 1 else 'phases'} failed"
+        lines = [f"Readability startup: {loaded}, {state}"]
+        for name, elapsed, memory_delta, background, error in phases:
+            memory = "" if memory_delta is None else f", {memory_delta / 1048576:+.1f} MiB"
+            line = f"  {name}: {elapsed * 1000:.1f} ms{memory}" + (" (warm-up)" if background else "")
+            if error is not None:
+                line += f", failed: {error}"
+            lines.append(line)
+        if self.buffered or self.dropped:
+            lines.append(f"  {self.buffered} messages buffered while warming up, {self.dropped} dropped")
+        return lines
+
+class WarmUp:
+    """
+    Runs the slow startup phases (loading dependencies, checking the schema, reading
+    caches) on a background thread, so /py load returns at once.
+
+    Phases run in order, each timed into the profile. A phase that raises is recorded
+    and reported, and the following phases still run, so one failure never keeps the
+    plugin from processing messages. Unloading the plugin cancels the phases that
+    haven't started yet.
+    """
+
+    def __init__(self, phases, profile, on_error=None, name="readability-warm-up"):
+        """
+        :param phases: List of (name, callable) pairs
+        :param profile: StartupProfile the phases are recorded in
+        :param on_error: Callable invoked with a message when a phase fails
+        :param name: Name of the warm-up thread
+        """
+        self.phases = phases
+        self.profile = profile
+        self.on_error = on_error
+        self.name = name
+        self._ready = threading.Event()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        """True once every phase ran."""
+        return self._ready.is_set()
+
+    def start(self):
+        """Start the warm-up thread."""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self.run, args=(True,), name=self.name, daemon=True)
+        self._thread.start()
+
+    def wait(self, timeout=None):
+        """
+        Wait for the warm-up to finish.
+
+        :param timeout: Maximum number of seconds to wait, None for as long as it takes
+        :return: True if it finished
+        """
+        return self._ready.wait(timeout)
+
+    def stop(self, timeout=10.0):
+        """
+        Wait for the warm-up to finish, and cancel the phases that haven't started by the timeout.
+
+        :param timeout: Maximum number of seconds to wait
+        :return: True if every phase ran
+        """
+        if self._thread is not None and not self._ready.wait(timeout):
+            self._cancel.set()
+        return self.ready
+
+    def run(self, background=False):
+        """
+        Runs every phase on the calling thread.
+
+        :param background: True when called on the warm-up thread
+        """
+        for name, function in self.phases:
+            if self._cancel.is_set():
+                return
+            start, memory = time.perf_counter(), memory_usage()
+            error = None
+            try:
+                function()
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if self.on_error is not None:
+                    self.on_error(f"Error warming up the readability analyzer ({name}): {error}")
+            end_memory = memory_usage()
+            self.profile.add(name, time.perf_counter() - start,
+                             None if memory is None or end_memory is None else end_memory - memory, background, error)
+        self.profile.finish_warm_up()
+        self._ready.set()
@@ -0,0 +1,1671 @@
+import datetime
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import zlib
+
+from readability_core import display_nick
+
+# Backends understood by open_storage
+BACKEND_MARIADB = "mariadb"
+BACKEND_SQLITE = "sqlite"
+
+SQLITE_FILE = "readability_analyzer.db"
+
+class StorageError(Exception):
+    """Raised by every storage backend when the database can't be read or written."""
+
+class StorageDataError(StorageError):
+    """
+    Raised when the database rejects the rows themselves (bad encoding, a value too
+    long for its column, a constraint violation), so writing them again can't succeed.
+    """
+
+# MariaDB errors about the values written rather than the connection: incorrect string value,
+# out of range, truncated value and data too long
+MARIADB_DATA_ERRNOS = (1366, 1264, 1292, 1406)
+
+def hexchat_config_dir():
+    """Returns HexChat's default config folder for this platform."""
+    if os.name == "nt":
+        return os.path.join(os.environ.get("APPDATA", os.path.expanduser("~")), "HexChat")
+    return os.path.join(os.path.expanduser("~"), ".config", "hexchat")
+
+def default_sqlite_path():
+    """Returns the default SQLite database file, in HexChat's config folder."""
+    return os.path.join(hexchat_config_dir(), SQLITE_FILE)
+
+def with_location(row):
+    """
+    Fills in the network and channel of a message row.
+
+    :param row: Message row, possibly an older (username, message, readability_score, timestamp)
+                row without network and channel, e.g. replayed from a spool file
+    :return: (username, message, readability_score, timestamp, network, channel) tuple
+    """
+    if len(row) == 4:
+        return tuple(row) + ("", "")
+    username, message, score, timestamp, network, channel = row
+    return username, message, score, timestamp, network or "", channel or ""
+
+def summarize_rows(rows):
+    """
+    Totals a batch of rows per user and channel.
+
+    :param rows: List of message rows
+    :return: List of (network, channel, username, count, score sum, sum of squared scores) tuples
+    """
+    totals = {}
+    for username, message, score, timestamp, network, channel in map(with_location, rows):
+        key = (network, channel, username)
+        count, score_sum, score_sq_sum = totals.get(key, (0, 0.0, 0.0))
+        totals[key] = (count + 1, score_sum + score, score_sq_sum + score * score)
+    return [key + total for key, total in totals.items()]
+
+def bucket_start(timestamp, period):
+    """
+    Returns the start of the local hour, day, week or month holding a timestamp.
+    Hours and days are the keys of the rollup tables, weeks start on Monday.
+
+    :param timestamp: Epoch seconds
+    :param period: One of TREND_PERIODS
+    :return: "YYYY-MM-DD HH:MM:SS" string, the format SQLite stores timestamps in
+    """
+    moment = datetime.datetime.fromtimestamp(timestamp)
+    if period == "hour":
+        return moment.strftime("%Y-%m-%d %H:00:00")
+    if period == "week":
+        moment -= datetime.timedelta(days=moment.weekday())
+    elif period == "month":
+        return moment.strftime("%Y-%m-01 00:00:00")
+    return moment.strftime("%Y-%m-%d 00:00:00")
+
+def summarize_buckets(rows, period):
+    """
+    Totals a batch of rows per user, channel and hour or day.
+
+    :param rows: List of message rows
+    :param period: 'hour' or 'day'
+    :return: List of (network, channel, username, bucket, count, score sum, sum of squared scores) tuples
+    """
+    totals = {}
+    buckets = {}
+    for username, message, score, timestamp, network, channel in map(with_location, rows):
+        # Rows of a batch are close in time, so most of them share a bucket already computed
+        second = int(timestamp)
+        bucket = buckets.get(second // 60)
+        if bucket is None:
+            bucket = buckets[second // 60] = bucket_start(timestamp, period)
+        key = (network, channel, username, bucket)
+        count, score_sum, score_sq_sum = totals.get(key, (0, 0.0, 0.0))
+        totals[key] = (count + 1, score_sum + score, score_sq_sum + score * score)
+    return [key + total for key, total in totals.items()]
+
+def trend_row(bucket, username, count, score_sum, score_sq_sum):
+    """
+    Turns the totals of one trend bucket into its average and standard deviation.
+
+    :return: (bucket, username, average score, message count, standard deviation) tuple,
+             bucket as a "YYYY-MM-DD HH:MM:SS" string
+    """
+    count = int(count)
+    mean = float(score_sum) / count
+    variance = max(float(score_sq_sum) / count - mean * mean, 0.0)
+    if not isinstance(bucket, str):
+        bucket = bucket.strftime("%Y-%m-%d %H:%M:%S")
+    return bucket, username, mean, count, variance ** 0.5
+
+def text_hash(message):
+    """Returns the 16-byte BLAKE2 hash a message text is stored under in message_texts."""
+    return hashlib.blake2b(message.encode('utf-8'), digest_size=16).digest()
+
+def group_texts(rows):
+    """
+    Groups the message texts of a batch of rows by hash.
+
+    :param rows: List of message rows
+    :return: (texts, hashes) tuple, texts being a list of (hash, message, number of rows) tuples
+             and hashes the hash of every row in order
+    """
+    texts = {}
+    hashes = []
+    for row in rows:
+        message = row[1]
+        key = text_hash(message)
+        hashes.append(key)
+        if key in texts:
+            texts[key][2] += 1
+        else:
+            texts[key] = [key, message, 1]
+    return [tuple(text) for text in texts.values()], hashes
+
+# Message text of a row, for rows whose text is stored once in message_texts
+MESSAGE_TEXT = "COALESCE(NULLIF(m.message, ''), t.message)"
+
+# Monthly archive tables are named this followed by the month as YYYYMM
+ARCHIVE_PREFIX = "messages_archive_"
+
+# What archive_messages keeps of a message: the text as is, compressed, only the
+# score and timestamp, or nothing (the row is deleted without archiving)
+ARCHIVE_MODES = ("keep", "compress", "drop-text", "delete")
+
+# Raw deflate without zlib's header and checksum, which would cost more than most chat lines save
+ARCHIVE_WBITS = -15
+
+def pack_archive(rows, mode, month_of):
+    """
+    Groups messages leaving the messages table by month and packs their text for the archive tables.
+
+    :param rows: List of (id, network, channel, username, message, text_hash, readability_score, timestamp) tuples
+    :param mode: One of ARCHIVE_MODES
+    :param month_of: Callable returning the "YYYYMM" month of a row's timestamp
+    :return: (months, archived bytes) tuple, months mapping "YYYYMM" to (id, network, channel, username,
+             message, compressed message, readability_score, timestamp) tuples, empty with 'delete'
+    """
+    months = {}
+    archived = 0
+    if mode == "delete":
+        return months, archived
+    for message_id, network, channel, username, message, key, score, timestamp in rows:
+        text = compressed = None
+        if mode == "keep":
+            text = message
+            archived += len(message.encode('utf-8'))
+        elif mode == "compress":
+            data = message.encode('utf-8')
+            compressor = zlib.compressobj(9, zlib.DEFLATED, ARCHIVE_WBITS)
+            compressed = compressor.compress(data) + compressor.flush()
+            if len(compressed) >= len(data):
+                # Short lines don't compress, they are archived as they are
+                text, compressed = message, None
+            archived += len(data) if compressed is None else len(compressed)
+        months.setdefault(month_of(timestamp), []).append(
+            (message_id, network, channel, username, text, compressed, score, timestamp))
+    return months, archived
+
+def unpack_archive(message, compressed):
+    """Returns the text of an archived message, None if it was archived without it."""
+    if compressed is not None:
+        return zlib.decompress(compressed, ARCHIVE_WBITS).decode('utf-8')
+    return message
+
+def archive_table(month):
+    """Returns the archive table of a "YYYYMM" month, refusing anything else since it becomes part of SQL."""
+    if len(month) != 6 or not month.isdigit():
+        raise ValueError(f"Bad archive month {month!r}, expected YYYYMM")
+    return ARCHIVE_PREFIX + month
+
+def released_texts(rows):
+    """
+    Counts the message_texts references a batch of archived rows gives up.
+
+    :return: (uses, inline bytes) tuple, uses mapping text hash to (references, text),
+             inline bytes being the size of the texts stored in the rows themselves
+    """
+    uses = {}
+    inline = 0
+    for message_id, network, channel, username, message, key, score, timestamp in rows:
+        if key is None:
+            inline += len(message.encode('utf-8'))
+        else:
+            count, text = uses.get(key, (0, message))
+            uses[key] = (count + 1, text)
+    return uses, inline
+
+# Universal part-of-speech tags counted per user by stylometry.py, one user_pos column each
+POS_TAGS = ("ADJ", "ADP", "ADV", "AUX", "CCONJ", "DET", "INTJ", "NOUN", "NUM", "PART", "PRON", "PROPN",
+            "PUNCT", "SCONJ", "SYM", "VERB", "X")
+POS_COLUMNS = [f"pos_{tag.lower()}" for tag in POS_TAGS]
+
+# Name of the stylometry job's row in stylometry_progress
+POS_JOB = "pos"
+
+# Rollup tables holding per-user totals for each local hour and day
+ROLLUP_TABLES = (("hour", "rollup_hourly"), ("day", "rollup_daily"))
+
+# Running totals kept per user, as (table, key columns besides the username, summed columns) tuples
+USER_TOTALS = ([("user_stats", ("network", "channel"), ("msg_count", "score_sum", "score_sq_sum"))]
+               + [(table, ("network", "channel", "bucket"), ("msg_count", "score_sum", "score_sq_sum"))
+                  for period, table in ROLLUP_TABLES]
+               + [("user_pos", ("network", "channel"), ("tokens", *POS_COLUMNS))])
+
+# Lengths of the buckets score_trend can group by, 'week' and 'month' are built from the daily rollups
+TREND_PERIODS = ("hour", "day", "week", "month")
+
+def scope_conditions(network, channel, placeholder):
+    """
+    Builds the WHERE conditions limiting a query to one network or channel.
+
+    :param network: Network name, None for every network
+    :param channel: Channel name, None for every channel
+    :param placeholder: The driver's parameter placeholder, "%s" or "?"
+    :return: (conditions, params) tuple
+    """
+    conditions = []
+    params = []
+    if network is not None:
+        conditions.append(f"network = {placeholder}")
+        params.append(network)
+    if channel is not None:
+        conditions.append(f"channel = {placeholder}")
+        params.append(channel)
+    return conditions, params
+
+def parse_keyword(keyword):
+    """
+    Splits a search string into words and "quoted phrases".
+
+    :param keyword: The text typed into the search box
+    :return: List of (is_phrase, words) tuples
+    """
+    terms = []
+    for phrase, word in re.findall(r'"([^"]*)"|(\S+)', keyword or ""):
+        if phrase:
+            words = re.findall(r"\w+", phrase)
+            if words:
+                terms.append((True, words))
+        else:
+            terms.extend((False, [w]) for w in re.findall(r"\w+", word))
+    return terms
+
+def to_boolean_query(keyword):
+    """
+    Turns a search string into a MariaDB full-text boolean mode query.
+    Every word must appear (as a word prefix) and "quoted text" must appear as a phrase.
+
+    :param keyword: The text typed into the search box
+    :return: Boolean mode query, empty if there is nothing to search for
+    """
+    return ' '.join('+"' + ' '.join(words) + '"' if is_phrase else f"+{words[0]}*"
+                    for is_phrase, words in parse_keyword(keyword))
+
+def like_patterns(keyword):
+    """
+    Turns a search string into LIKE patterns, one per word or phrase, for backends without a full-text index.
+
+    :param keyword: The text typed into the search box
+    :return: List of LIKE patterns that must all match
+    """
+    return [f"%{' '.join(words)}%" for is_phrase, words in parse_keyword(keyword)]
+
+def to_fts_query(keyword):
+    """
+    Turns a search string into an SQLite FTS5 query with the same meaning as to_boolean_query.
+
+    :param keyword: The text typed into the search box
+    :return: FTS5 query, empty if there is nothing to search for
+    """
+    return ' '.join('"' + ' '.join(words) + '"' if is_phrase else f'"{words[0]}"*'
+                    for is_phrase, words in parse_keyword(keyword))
+
+class Storage:
+    """
+    Interface shared by the storage backends.
+
+    Message rows are (username, message, readability_score, timestamp, network, channel)
+    tuples with the timestamp in epoch seconds. Rows without network and channel are
+    stored with empty ones. Every method raises StorageError on database errors.
+
+    Totals are kept per network, channel and user. Queries take an optional network
+    and channel and only read that channel's rows when given one.
+
+    With dedupe_texts, every distinct message text is stored once in message_texts,
+    keyed by text_hash(), and messages rows only reference it by hash (their message
+    column is left empty). Rows stored either way are read back the same.
+    """
+
+    def initialize(self):
+        """Creates the tables and indexes, and upgrades an existing schema."""
+        raise NotImplementedError
+
+    def insert_messages(self, rows):
+        """
+        Inserts message rows and adds them to the per-user and channel totals in one transaction.
+
+        :param rows: List of message rows
+        """
+        raise NotImplementedError
+
+    def user_averages(self, usernames=None, network=None, channel=None):
+        """
+        Reads per-user averages from the running totals.
+
+        :param usernames: Users to look up, None for every user
+        :param network: Only count this network, None for every network
+        :param channel: Only count this channel, None for every channel
+        :return: List of (username, average score, message count) tuples
+        """
+        raise NotImplementedError
+
+    def search_messages(self, user=None, keyword="", last_id=None, limit=200, network=None, channel=None,
+                        after_id=None):
+        """
+        Full-text search, newest messages first, paged by id.
+
+        :param user: Only search this username, None for all users
+        :param keyword: Words and "quoted phrases" that must all appear, empty to match everything
+        :param last_id: Smallest id of the previous page, None for the first page
+        :param limit: Maximum number of rows
+        :param network: Only search this network, None for every network
+        :param channel: Only search this channel, None for every channel
+        :param after_id: Only return messages newer than this id, oldest first, for following new messages
+        :return: List of (id, username, message, readability_score, timestamp, network, channel) tuples
+        """
+        raise NotImplementedError
+
+    def latest_id(self):
+        """Returns the id of the newest message, 0 if there are none."""
+        raise NotImplementedError
+
+    def messages_between(self, network, channel, start, end):
+        """
+        Reads the messages of a channel stored in a time range, live or archived, so a log
+        backfill can leave out what the plugin logged already.
+
+        :param network: Network of the channel
+        :param channel: Channel name
+        :param start: Epoch seconds, the oldest timestamp included
+        :param end: Epoch seconds, the newest timestamp included
+        :return: List of (username, message, timestamp) tuples, timestamp in epoch seconds and
+                 message None for messages archived without their text
+        """
+        raise NotImplementedError
+
+    def score_trend(self, start, end, period="day", usernames=None, network=None, channel=None, per_user=True):
+        """
+        Reads average scores per hour, day, week or month from the rollup tables, without reading messages.
+        Weeks start on Monday, and buckets are in local time like the message timestamps.
+
+        :param start: Epoch seconds, the bucket holding it is the first one returned, counted from its own start
+        :param end: Epoch seconds, buckets starting at or after it are left out
+        :param period: One of TREND_PERIODS
+        :param usernames: Users to look up, None for every user
+        :param network: Only count this network, None for every network
+        :param channel: Only count this channel, None for every channel
+        :param per_user: False to total the users together, username is then None
+        :return: List of (bucket, username, average score, message count, standard deviation) tuples
+                 ordered by bucket and username, bucket as a "YYYY-MM-DD HH:MM:SS" string
+        """
+        raise NotImplementedError
+
+    def list_users(self, network=None, channel=None):
+        """Returns every username with logged messages, optionally only those seen in one network or channel."""
+        raise NotImplementedError
+
+    def list_channels(self):
+        """Returns every (network, channel) pair with logged messages."""
+        raise NotImplementedError
+
+    def messages_after(self, last_id, limit=1000):
+        """
+        Reads messages in id order, for jobs that work through new messages in batches.
+
+        :param last_id: Largest id already handled, 0 to start at the first message
+        :param limit: Maximum number of rows
+        :return: List of (id, network, channel, username, message) tuples
+        """
+        raise NotImplementedError
+
+    def pos_last_id(self):
+        """Returns the id of the last message the stylometry job counted, 0 if it never ran."""
+        raise NotImplementedError
+
+    def add_pos_counts(self, totals, last_id, previous_id):
+        """
+        Adds part-of-speech counts to the per-user totals and records how far the
+        stylometry job got, in one transaction.
+
+        Progress only moves from previous_id to last_id, so when the plugin and
+        stylometry.py tag the same batch at once only the first one counts it.
+
+        :param totals: List of (network, channel, username, tokens, counts) tuples,
+                       counts holding one number per POS_TAGS entry
+        :param last_id: Id of the last message the counts include
+        :param previous_id: Progress the counts were tagged from, as pos_last_id() returned it
+        :return: False if the progress had moved on meanwhile and nothing was added
+        """
+        raise NotImplementedError
+
+    def pos_profiles(self, usernames=None, network=None, channel=None):
+        """
+        Reads the per-user part-of-speech totals.
+
+        :param usernames: Users to look up, None for every user
+        :param network: Only count this network, None for every network
+        :param channel: Only count this channel, None for every channel
+        :return: List of (username, tokens, counts) tuples, counts following POS_TAGS
+        """
+        raise NotImplementedError
+
+    def archive_messages(self, before, limit=1000, mode="keep", up_to_id=None):
+        """
+        Moves the oldest messages logged before a cutoff out of messages, into the monthly
+        archive table of their timestamp (see ARCHIVE_PREFIX), in one short transaction.
+        Their scores stay in user_stats and the rollups, so averages and trends still count
+        them; only searching them needs the archive. Texts in message_texts are released and
+        deleted once no message uses them.
+
+        :param before: Epoch seconds, only messages logged before it are moved
+        :param limit: Most messages moved by this call
+        :param mode: One of ARCHIVE_MODES
+        :param up_to_id: Only move messages up to this id, None for any
+        :return: (messages moved, text bytes removed from the live tables, bytes written to the archive) tuple
+        """
+        raise NotImplementedError
+
+    def list_archives(self):
+        """Returns the months with an archive table as "YYYYMM" strings, oldest first."""
+        raise NotImplementedError
+
+    def archived_messages(self, month, after_id=0, limit=1000):
+        """
+        Reads one month's archived messages in id order.
+
+        :param month: "YYYYMM" month, see list_archives()
+        :param after_id: Largest id already read, 0 to start at the first message
+        :param limit: Maximum number of rows
+        :return: List of (id, username, message, readability_score, timestamp, network, channel) rows,
+                 message being None for messages archived without their text
+        """
+        raise NotImplementedError
+
+    def reclaim_space(self):
+        """
+        Rebuilds the database files so the space freed by archive_messages goes back to the
+        file system. Takes a while and blocks writers meanwhile, so it is left to the command line.
+
+        :return: Bytes the database files shrank by
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Releases the backend's connections."""
+
+class MariaDBStorage(Storage):
+    """
+    MariaDB backend over a mysql.connector connection pool.
+
+    The messages table can optionally be partitioned by channel or by month. InnoDB
+    has no full-text indexes on partitioned tables, so search then falls back to LIKE.
+    """
+
+    # Ways the messages table can be partitioned
+    PARTITION_CHANNEL = "channel"
+    PARTITION_MONTH = "month"
+
+    def __init__(self, db_config, pool_size=2, pool_name="readability_analyzer",
+                 partition_by=None, partitions=16, months_ahead=3, dedupe_texts=False):
+        """
+        :param db_config: Keyword arguments for mysql.connector.connect
+        :param pool_size: Number of pooled connections
+        :param pool_name: Name of the connection pool
+        :param partition_by: None, 'channel' (hash of network and channel) or 'month' (message timestamp)
+        :param partitions: Number of partitions with 'channel'
+        :param months_ahead: Number of future months kept partitioned with 'month'
+        :param dedupe_texts: Store each distinct message text once in message_texts
+        """
+        import mysql.connector
+        self.mysql = mysql.connector
+        self.db_config = db_config
+        self.pool_size = pool_size
+        self.pool_name = pool_name
+        if partition_by not in (None, self.PARTITION_CHANNEL, self.PARTITION_MONTH):
+            raise ValueError(f"Unknown partitioning {partition_by!r}, expected 'channel' or 'month'")
+        self.partition_by = partition_by
+        self.partitions = partitions
+        self.months_ahead = months_ahead
+        self.dedupe_texts = dedupe_texts
+        self.has_fulltext = True
+        self.has_texts = dedupe_texts
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def connect(self):
+        """Returns a connection from the pool, creating the pool on first use."""
+        from mysql.connector import pooling
+        try:
+            with self._pool_lock:
+                if self._pool is None:
+                    self._pool = pooling.MySQLConnectionPool(pool_name=self.pool_name,
+                                                             pool_size=self.pool_size, **self.db_config)
+            return self._pool.get_connection()
+        except self.mysql.Error as e:
+            raise StorageError(str(e)) from e
+
+    def _error(self, error):
+        """Wraps a driver error, as StorageDataError when the values written were rejected."""
+        if isinstance(error, (self.mysql.DataError, self.mysql.IntegrityError)) or \
+                getattr(error, 'errno', None) in MARIADB_DATA_ERRNOS or \
+                (getattr(error, 'sqlstate', None) or "")[:2] in ("22", "23"):
+            return StorageDataError(str(error))
+        return StorageError(str(error))
+
+    def _run(self, work):
+        """Runs work(cursor) on a pooled connection and commits, turning driver errors into StorageError."""
+        conn = self.connect()
+        try:
+            cursor = conn.cursor()
+            result = work(cursor)
+            conn.commit()
+            cursor.close()
+            return result
+        except self.mysql.Error as e:
+            raise self._error(e) from e
+        except UnicodeError as e:
+            raise StorageDataError(str(e)) from e
+        finally:
+            conn.close()
+
+    def initialize(self):
+        def work(cursor):
+            # Create messages table
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    network VARCHAR(255) NOT NULL DEFAULT '',
+                    channel VARCHAR(255) NOT NULL DEFAULT '',
+                    username VARCHAR(255) NOT NULL,
+                    message TEXT NOT NULL,
+                    text_hash BINARY(16) NULL,
+                    readability_score FLOAT,
+                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Columns missing from older installs, their messages keep an empty network and channel
+            cursor.execute('''
+                ALTER TABLE messages
+                    ADD COLUMN IF NOT EXISTS network VARCHAR(255) NOT NULL DEFAULT '' AFTER id,
+                    ADD COLUMN IF NOT EXISTS channel VARCHAR(255) NOT NULL DEFAULT '' AFTER network,
+                    ADD COLUMN IF NOT EXISTS text_hash BINARY(16) NULL AFTER message
+            ''')
+
+            # Distinct message texts, referenced by messages.text_hash when dedupe_texts is on
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS message_texts (
+                    text_hash BINARY(16) NOT NULL PRIMARY KEY,
+                    message TEXT NOT NULL,
+                    uses BIGINT NOT NULL DEFAULT 0,
+                    FULLTEXT INDEX ft_message_texts_message (message)
+                )
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_text_hash ON messages (text_hash)")
+            cursor.execute("SELECT 1 FROM message_texts LIMIT 1")
+            self.has_texts = self.dedupe_texts or cursor.fetchone() is not None
+
+            # Older installs kept one total per username, rebuild it per channel below
+            cursor.execute("SHOW TABLES LIKE 'user_stats'")
+            if cursor.fetchall():
+                cursor.execute("SHOW COLUMNS FROM user_stats LIKE 'network'")
+                if not cursor.fetchall():
+                    cursor.execute("DROP TABLE user_stats")
+
+            # Running per-user totals for each channel, kept up to date on insert so reports never scan messages
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS user_stats (
+                    network VARCHAR(255) NOT NULL DEFAULT '',
+                    channel VARCHAR(255) NOT NULL DEFAULT '',
+                    username VARCHAR(255) NOT NULL,
+                    msg_count BIGINT NOT NULL DEFAULT 0,
+                    score_sum DOUBLE NOT NULL DEFAULT 0,
+                    score_sq_sum DOUBLE NOT NULL DEFAULT 0,
+                    PRIMARY KEY (network, channel, username),
+                    INDEX idx_user_stats_username (username)
+                )
+            ''')
+
+            # Per-user totals for each hour and day, kept up to date on insert so trends never scan messages
+            for period, table in ROLLUP_TABLES:
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        network VARCHAR(255) NOT NULL DEFAULT '',
+                        channel VARCHAR(255) NOT NULL DEFAULT '',
+                        username VARCHAR(255) NOT NULL,
+                        bucket DATETIME NOT NULL,
+                        msg_count BIGINT NOT NULL DEFAULT 0,
+                        score_sum DOUBLE NOT NULL DEFAULT 0,
+                        score_sq_sum DOUBLE NOT NULL DEFAULT 0,
+                        PRIMARY KEY (network, channel, username, bucket),
+                        INDEX idx_{table}_bucket (bucket),
+                        INDEX idx_{table}_username_bucket (username, bucket)
+                    )
+                ''')
+                cursor.execute(f"SELECT 1 FROM {table} LIMIT 1")
+                if cursor.fetchone() is None:
+                    # Fill it from the existing history the first time it is created
+                    bucket = "'%Y-%m-%d %H:00:00'" if period == "hour" else "'%Y-%m-%d 00:00:00'"
+                    cursor.execute(f'''
+                        INSERT INTO {table} (network, channel, username, bucket, msg_count, score_sum, score_sq_sum)
+                        SELECT network, channel, username, DATE_FORMAT(timestamp, {bucket}) AS bucket,
+                               COUNT(readability_score), COALESCE(SUM(readability_score), 0),
+                               COALESCE(SUM(readability_score * readability_score), 0)
+                        FROM messages
+                        WHERE timestamp IS NOT NULL
+                        GROUP BY network, channel, username, bucket
+                    ''')
+
+            # Part-of-speech totals per user and channel, and the last message stylometry.py counted
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS user_pos (
+                    network VARCHAR(255) NOT NULL DEFAULT '',
+                    channel VARCHAR(255) NOT NULL DEFAULT '',
+                    username VARCHAR(255) NOT NULL,
+                    tokens BIGINT NOT NULL DEFAULT 0,
+                    {', '.join(f"{column} INT UNSIGNED NOT NULL DEFAULT 0" for column in POS_COLUMNS)},
+                    PRIMARY KEY (network, channel, username),
+                    INDEX idx_user_pos_username (username)
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS stylometry_progress (
+                    job VARCHAR(32) NOT NULL PRIMARY KEY,
+                    last_id BIGINT NOT NULL DEFAULT 0
+                )
+            ''')
+
+            # Indexes missing from older installs
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_username_timestamp ON messages (username, timestamp)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_channel_id ON messages (network, channel, id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_messages_channel_username_timestamp "
+                           "ON messages (network, channel, username, timestamp)")
+
+            method = self._partition_method(cursor)
+            if method is None and self.partition_by is not None:
+                self._partition(cursor)
+                method = self._partition_method(cursor)
+            if method == "RANGE":
+                self._add_month_partitions(cursor)
+            if method is None:
+                cursor.execute("CREATE FULLTEXT INDEX IF NOT EXISTS ft_messages_message ON messages (message)")
+            self.has_fulltext = method is None
+
+            # Fill user_stats from the existing history the first time it is created
+            cursor.execute("SELECT COUNT(*) FROM user_stats")
+            if cursor.fetchone()[0] == 0:
+                cursor.execute('''
+                    INSERT INTO user_stats (network, channel, username, msg_count, score_sum, score_sq_sum)
+                    SELECT network, channel, username, COUNT(readability_score), COALESCE(SUM(readability_score), 0),
+                           COALESCE(SUM(readability_score * readability_score), 0)
+                    FROM messages
+                    GROUP BY network, channel, username
+                ''')
+            self._merge_colored_usernames(cursor)
+        self._run(work)
+
+    def _merge_colored_usernames(self, cursor):
+        """
+        Renames the usernames older versions of the plugin stored with HexChat's nick color
+        to the plain nick, adding their totals to the plain nick's. Nothing is left to do
+        once they are all merged.
+        """
+        cursor.execute("SELECT DISTINCT username FROM user_stats")
+        renames = [(username, display_nick(username)) for (username,) in cursor.fetchall()
+                   if display_nick(username) != username]
+        if not renames:
+            return
+        cursor.execute("SHOW TABLES LIKE %s", (ARCHIVE_PREFIX.replace("_", "\\_") + "%",))
+        tables = ["messages"] + [row[0] for row in cursor.fetchall()]
+        for old, new in renames:
+            for table in tables:
+                cursor.execute(f"UPDATE {table} SET username = %s WHERE username = %s", (new, old))
+            for table, keys, sums in USER_TOTALS:
+                columns = ", ".join(keys + sums)
+                cursor.execute(f"INSERT INTO {table} (username, {columns}) SELECT %s, {columns} FROM {table} "
+                               f"WHERE username = %s ON DUPLICATE KEY UPDATE "
+                               f"{', '.join(f'{column} = {column} + VALUES({column})' for column in sums)}", (new, old))
+                cursor.execute(f"DELETE FROM {table} WHERE username = %s", (old,))
+
+    def _partition_method(self, cursor):
+        """Returns how the messages table is partitioned ('KEY', 'RANGE', ...), None if it isn't."""
+        cursor.execute('''
+            SELECT PARTITION_METHOD FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'messages'
+            LIMIT 1
+        ''')
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def _partition(self, cursor):
+        """
+        Partitions an unpartitioned messages table. Every unique key must contain the
+        partitioning columns, so they join id in the primary key, and the full-text
+        index is dropped.
+        """
+        cursor.execute("DROP INDEX IF EXISTS ft_messages_message ON messages")
+        if self.partition_by == self.PARTITION_CHANNEL:
+            cursor.execute(f'''
+                ALTER TABLE messages
+                    DROP PRIMARY KEY, ADD PRIMARY KEY (id, network, channel)
+                PARTITION BY KEY (network, channel) PARTITIONS {int(self.partitions)}
+            ''')
+        else:
+            cursor.execute("SELECT MIN(timestamp) FROM messages")
+            oldest = cursor.fetchone()[0] or datetime.datetime.now()
+            definitions = month_partitions(month_starts(oldest, datetime.datetime.now(), self.months_ahead))
+            cursor.execute(f'''
+                ALTER TABLE messages
+                    DROP PRIMARY KEY, ADD PRIMARY KEY (id, timestamp)
+                PARTITION BY RANGE (UNIX_TIMESTAMP(timestamp)) (
+                    {definitions},
+                    PARTITION pmax VALUES LESS THAN MAXVALUE
+                )
+            ''')
+
+    def _add_month_partitions(self, cursor):
+        """Splits the catch-all partition so the coming months each get their own partition."""
+        cursor.execute('''
+            SELECT MAX(PARTITION_NAME) FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'messages' AND PARTITION_NAME <> 'pmax'
+        ''')
+        last = cursor.fetchone()[0] or ""
+        now = datetime.datetime.now()
+        missing = [month for month in month_starts(now, now, self.months_ahead) if f"p{month:%Y%m}" > last]
+        if missing:
+            cursor.execute(f'''
+                ALTER TABLE messages REORGANIZE PARTITION pmax INTO (
+                    {month_partitions(missing)},
+                    PARTITION pmax VALUES LESS THAN MAXVALUE
+                )
+            ''')
+
+    def insert_messages(self, rows):
+        def work(cursor):
+            hashes = [None] * len(rows)
+            if self.dedupe_texts:
+                texts, hashes = group_texts(rows)
+                cursor.executemany('''
+                    INSERT INTO message_texts (text_hash, message, uses)
+                    VALUES (%s, %s, %s)
+                    ON DUPLICATE KEY UPDATE uses = uses + VALUES(uses)
+                ''', texts)
+            cursor.executemany('''
+                INSERT INTO messages (network, channel, username, message, text_hash, readability_score, timestamp)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ''', [(network, channel, username, "" if key else message, key, score,
+                   datetime.datetime.fromtimestamp(timestamp))
+                  for (username, message, score, timestamp, network, channel), key in zip(map(with_location, rows), hashes)])
+            cursor.executemany('''
+                INSERT INTO user_stats (network, channel, username, msg_count, score_sum, score_sq_sum)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE
+                    msg_count = msg_count + VALUES(msg_count),
+                    score_sum = score_sum + VALUES(score_sum),
+                    score_sq_sum = score_sq_sum + VALUES(score_sq_sum)
+            ''', summarize_rows(rows))
+            for period, table in ROLLUP_TABLES:
+                cursor.executemany(f'''
+                    INSERT INTO {table} (network, channel, username, bucket, msg_count, score_sum, score_sq_sum)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE
+                        msg_count = msg_count + VALUES(msg_count),
+                        score_sum = score_sum + VALUES(score_sum),
+                        score_sq_sum = score_sq_sum + VALUES(score_sq_sum)
+                ''', summarize_buckets(rows, period))
+        if rows:
+            self._run(work)
+
+    def user_averages(self, usernames=None, network=None, channel=None):
+        conditions, params = scope_conditions(network, channel, "%s")
+        if usernames is not None:
+            conditions.append(f"username IN ({', '.join(['%s'] * len(usernames))})")
+            params.extend(usernames)
+
+        def work(cursor):
+            cursor.execute(f"SELECT username, SUM(score_sum) / SUM(msg_count), SUM(msg_count) FROM user_stats "
+                           f"WHERE {' AND '.join(['msg_count > 0'] + conditions)} GROUP BY username", params)
+            return [(username, float(avg), int(count)) for username, avg, count in cursor.fetchall()]
+        if usernames is not None and not usernames:
+            return []
+        return self._run(work)
+
+    def search_messages(self, user=None, keyword="", last_id=None, limit=200, network=None, channel=None,
+                        after_id=None):
+        conditions, params = scope_conditions(network, channel, "%s")
+        query = to_boolean_query(keyword)
+        if self.has_fulltext and query and self.has_texts:
+            # Matches come from either table, both sets are found through their full-text index first
+            conditions.append("(m.id IN (SELECT id FROM messages WHERE MATCH(message) AGAINST (%s IN BOOLEAN MODE)) "
+                              "OR m.text_hash IN (SELECT text_hash FROM message_texts "
+                              "WHERE MATCH(message) AGAINST (%s IN BOOLEAN MODE)))")
+            params.extend([query, query])
+        elif self.has_fulltext and query:
+            conditions.append("MATCH(m.message) AGAINST (%s IN BOOLEAN MODE)")
+            params.append(query)
+        elif not self.has_fulltext:
+            for pattern in like_patterns(keyword):
+                conditions.append(f"{MESSAGE_TEXT} LIKE %s")
+                params.append(pattern)
+        if user is not None:
+            conditions.append("m.username = %s")
+            params.append(user)
+        if last_id is not None:
+            conditions.append("m.id < %s")
+            params.append(last_id)
+        if after_id is not None:
+            conditions.append("m.id > %s")
+            params.append(after_id)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = "ASC" if after_id is not None else "DESC"
+
+        def work(cursor):
+            cursor.execute(f"SELECT m.id, m.username, {MESSAGE_TEXT}, m.readability_score, m.timestamp, m.network, "
+                           f"m.channel FROM messages m LEFT JOIN message_texts t ON t.text_hash = m.text_hash "
+                           f"{where} ORDER BY m.id {order} LIMIT %s", params + [limit])
+            return cursor.fetchall()
+        return self._run(work)
+
+    def latest_id(self):
+        def work(cursor):
+            cursor.execute("SELECT MAX(id) FROM messages")
+            return cursor.fetchone()[0] or 0
+        return self._run(work)
+
+    def messages_between(self, network, channel, start, end):
+        first, last = format_timestamp(start), format_timestamp(end)
+        months = [month for month in self.list_archives() if first[:4] + first[5:7] <= month <= last[:4] + last[5:7]]
+
+        def work(cursor):
+            cursor.execute(f"SELECT m.username, {MESSAGE_TEXT}, m.timestamp FROM messages m "
+                           f"LEFT JOIN message_texts t ON t.text_hash = m.text_hash "
+                           f"WHERE m.network = %s AND m.channel = %s AND m.timestamp BETWEEN %s AND %s",
+                           (network, channel, first, last))
+            rows = [(username, message, parse_timestamp(timestamp))
+                    for username, message, timestamp in cursor.fetchall()]
+            for month in months:
+                cursor.execute(f"SELECT username, message, message_z, timestamp FROM {archive_table(month)} "
+                               f"WHERE network = %s AND channel = %s AND timestamp BETWEEN %s AND %s",
+                               (network, channel, first, last))
+                rows.extend((username, unpack_archive(message, compressed), parse_timestamp(timestamp))
+                            for username, message, compressed, timestamp in cursor.fetchall())
+            return rows
+        return self._run(work)
+
+    # Bucket of each trend period, computed from the rollup table's bucket column
+    TREND_BUCKETS = {
+        "hour": "bucket",
+        "day": "bucket",
+        "week": "CAST(DATE_SUB(DATE(bucket), INTERVAL WEEKDAY(bucket) DAY) AS DATETIME)",
+        "month": "CAST(DATE_FORMAT(bucket, '%Y-%m-01') AS DATETIME)",
+    }
+
+    def score_trend(self, start, end, period="day", usernames=None, network=None, channel=None, per_user=True):
+        if period not in TREND_PERIODS:
+            raise ValueError(f"Unknown trend period {period!r}, expected one of {TREND_PERIODS}")
+        table = "rollup_hourly" if period == "hour" else "rollup_daily"
+        conditions, params = scope_conditions(network, channel, "%s")
+        conditions += ["bucket >= %s", "bucket < %s", "msg_count > 0"]
+        # From the start of the first week or month, so the first bucket isn't a partial one
+        params += [bucket_start(start, period), format_timestamp(end)]
+        if usernames is not None:
+            conditions.append(f"username IN ({', '.join(['%s'] * len(usernames))})")
+            params.extend(usernames)
+        user = "username" if per_user else "NULL"
+        group = "period_start, username" if per_user else "period_start"
+
+        def work(cursor):
+            cursor.execute(f"SELECT {self.TREND_BUCKETS[period]} AS period_start, {user}, SUM(msg_count), "
+                           f"SUM(score_sum), SUM(score_sq_sum) FROM {table} WHERE {' AND '.join(conditions)} "
+                           f"GROUP BY {group} ORDER BY {group}", params)
+            return [trend_row(*row) for row in cursor.fetchall()]
+        if usernames is not None and not usernames:
+            return []
+        return self._run(work)
+
+    def archive_messages(self, before, limit=1000, mode="keep", up_to_id=None):
+        if mode not in ARCHIVE_MODES:
+            raise ValueError(f"Unknown archive mode {mode!r}, expected one of {ARCHIVE_MODES}")
+        conditions = ["m.timestamp < %s"]
+        params = [datetime.datetime.fromtimestamp(before)]
+        if up_to_id is not None:
+            conditions.append("m.id <= %s")
+            params.append(up_to_id)
+
+        def work(cursor):
+            cursor.execute(f"SELECT m.id, m.network, m.channel, m.username, {MESSAGE_TEXT}, m.text_hash, "
+                           f"m.readability_score, m.timestamp FROM messages m "
+                           f"LEFT JOIN message_texts t ON t.text_hash = m.text_hash "
+                           f"WHERE {' AND '.join(conditions)} ORDER BY m.timestamp LIMIT %s", params + [limit])
+            rows = cursor.fetchall()
+            months, archived = pack_archive(rows, mode, lambda timestamp: f"{timestamp:%Y%m}")
+            for month, month_rows in months.items():
+                table = archive_table(month)
+                cursor.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        id INT NOT NULL PRIMARY KEY,
+                        network VARCHAR(255) NOT NULL DEFAULT '',
+                        channel VARCHAR(255) NOT NULL DEFAULT '',
+                        username VARCHAR(255) NOT NULL,
+                        message TEXT NULL,
+                        message_z BLOB NULL,
+                        readability_score FLOAT,
+                        timestamp DATETIME
+                    )
+                ''')
+                cursor.executemany(f'''
+                    INSERT INTO {table} (id, network, channel, username, message, message_z, readability_score, timestamp)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ''', month_rows)
+            cursor.executemany("DELETE FROM messages WHERE id = %s", [(row[0],) for row in rows])
+
+            uses, removed = released_texts(rows)
+            if uses:
+                cursor.executemany("UPDATE message_texts SET uses = uses - %s WHERE text_hash = %s",
+                                   [(count, key) for key, (count, text) in uses.items()])
+                keys = list(uses)
+                cursor.execute(f"SELECT text_hash FROM message_texts WHERE uses <= 0 "
+                               f"AND text_hash IN ({', '.join(['%s'] * len(keys))})", keys)
+                unused = [row[0] for row in cursor.fetchall()]
+                cursor.executemany("DELETE FROM message_texts WHERE text_hash = %s", [(key,) for key in unused])
+                removed += sum(len(uses[key][1].encode('utf-8')) for key in unused)
+            if len(rows) < limit and self._partition_method(cursor) == "RANGE":
+                self._drop_archived_partitions(cursor, before)
+            return len(rows), removed, archived
+        return self._run(work)
+
+    def _drop_archived_partitions(self, cursor, before):
+        """Drops the month partitions that ended before a cutoff and were emptied by archive_messages."""
+        cursor.execute('''
+            SELECT PARTITION_NAME FROM information_schema.PARTITIONS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'messages' AND PARTITION_NAME <> 'pmax'
+                AND PARTITION_DESCRIPTION <= %s
+        ''', (int(before),))
+        for (name,) in cursor.fetchall():
+            cursor.execute(f"SELECT 1 FROM messages PARTITION ({name}) LIMIT 1")
+            if cursor.fetchone() is None:
+                cursor.execute(f"ALTER TABLE messages DROP PARTITION {name}")
+
+    def list_archives(self):
+        def work(cursor):
+            cursor.execute("SHOW TABLES LIKE %s", (ARCHIVE_PREFIX.replace("_", "\\_") + "%",))
+            return sorted(row[0][len(ARCHIVE_PREFIX):] for row in cursor.fetchall())
+        return self._run(work)
+
+    def archived_messages(self, month, after_id=0, limit=1000):
+        table = archive_table(month)
+
+        def work(cursor):
+            cursor.execute(f"SELECT id, username, message, message_z, readability_score, timestamp, network, channel "
+                           f"FROM {table} WHERE id > %s ORDER BY id LIMIT %s", (after_id, limit))
+            return [(message_id, username, unpack_archive(message, compressed), score, timestamp, network, channel)
+                    for message_id, username, message, compressed, score, timestamp, network, channel
+                    in cursor.fetchall()]
+        return self._run(work)
+
+    def reclaim_space(self):
+        def size(cursor):
+            cursor.execute('''
+                SELECT COALESCE(SUM(DATA_LENGTH + INDEX_LENGTH + DATA_FREE), 0) FROM information_schema.TABLES
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME IN ('messages', 'message_texts')
+            ''')
+            return int(cursor.fetchone()[0])
+
+        def work(cursor):
+            before = size(cursor)
+            for table in ("messages", "message_texts"):
+                cursor.execute(f"OPTIMIZE TABLE {table}")
+                cursor.fetchall()
+            return before - size(cursor)
+        return self._run(work)
+
+    def list_users(self, network=None, channel=None):
+        conditions, params = scope_conditions(network, channel, "%s")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        def work(cursor):
+            cursor.execute(f"SELECT DISTINCT username FROM user_stats {where} ORDER BY username", params)
+            return [row[0] for row in cursor.fetchall()]
+        return self._run(work)
+
+    def list_channels(self):
+        def work(cursor):
+            cursor.execute("SELECT DISTINCT network, channel FROM user_stats ORDER BY network, channel")
+            return [tuple(row) for row in cursor.fetchall()]
+        return self._run(work)
+
+    def messages_after(self, last_id, limit=1000):
+        def work(cursor):
+            cursor.execute(f"SELECT m.id, m.network, m.channel, m.username, {MESSAGE_TEXT} FROM messages m "
+                           f"LEFT JOIN message_texts t ON t.text_hash = m.text_hash "
+                           f"WHERE m.id > %s ORDER BY m.id LIMIT %s", (last_id, limit))
+            return cursor.fetchall()
+        return self._run(work)
+
+    def pos_last_id(self):
+        def work(cursor):
+            cursor.execute("SELECT last_id FROM stylometry_progress WHERE job = %s", (POS_JOB,))
+            row = cursor.fetchone()
+            return int(row[0]) if row else 0
+        return self._run(work)
+
+    def add_pos_counts(self, totals, last_id, previous_id):
+        def work(cursor):
+            cursor.execute("UPDATE stylometry_progress SET last_id = %s WHERE job = %s AND last_id = %s",
+                           (last_id, POS_JOB, previous_id))
+            if cursor.rowcount == 0 and previous_id == 0:
+                cursor.execute("INSERT IGNORE INTO stylometry_progress (job, last_id) VALUES (%s, %s)",
+                               (POS_JOB, last_id))
+            if cursor.rowcount == 0:
+                return False
+            cursor.executemany(f'''
+                INSERT INTO user_pos (network, channel, username, tokens, {', '.join(POS_COLUMNS)})
+                VALUES ({', '.join(['%s'] * (4 + len(POS_COLUMNS)))})
+                ON DUPLICATE KEY UPDATE tokens = tokens + VALUES(tokens),
+                    {', '.join(f"{column} = {column} + VALUES({column})" for column in POS_COLUMNS)}
+            ''', [(network, channel, username, tokens) + tuple(counts)
+                  for network, channel, username, tokens, counts in totals])
+            return True
+        return self._run(work)
+
+    def pos_profiles(self, usernames=None, network=None, channel=None):
+        conditions, params = scope_conditions(network, channel, "%s")
+        if usernames is not None:
+            conditions.append(f"username IN ({', '.join(['%s'] * len(usernames))})")
+            params.extend(usernames)
+
+        def work(cursor):
+            cursor.execute(f"SELECT username, SUM(tokens), {', '.join(f'SUM({column})' for column in POS_COLUMNS)} "
+                           f"FROM user_pos WHERE {' AND '.join(['tokens > 0'] + conditions)} GROUP BY username",
+                           params)
+            return [(row[0], int(row[1]), tuple(int(count) for count in row[2:])) for row in cursor.fetchall()]
+        if usernames is not None and not usernames:
+            return []
+        return self._run(work)
+
+class SQLiteStorage(Storage):
+    """
+    Embedded SQLite backend for single-operator installs.
+
+    Runs in WAL mode so readers never block the writer, with one connection per
+    thread. Statements are fixed strings, so sqlite3 reuses its prepared statements.
+    Search uses an FTS5 index when the SQLite build has it, LIKE otherwise.
+    """
+
+    PRAGMAS = (
+        "PRAGMA journal_mode = WAL",
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA temp_store = MEMORY",
+        "PRAGMA cache_size = -20000",
+        "PRAGMA mmap_size = 268435456",
+        "PRAGMA busy_timeout = 5000",
+        "PRAGMA foreign_keys = ON",
+    )
+
+    def __init__(self, path=None, dedupe_texts=False):
+        """
+        :param path: Database file, default_sqlite_path() by default
+        :param dedupe_texts: Store each distinct message text once in message_texts
+        """
+        self.path = path or default_sqlite_path()
+        self.dedupe_texts = dedupe_texts
+        self.has_fts = None
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def connect(self):
+        """Returns this thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            try:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                conn = sqlite3.connect(self.path, timeout=5.0, cached_statements=256,
+                                       check_same_thread=False)
+                for pragma in self.PRAGMAS:
+                    conn.execute(pragma)
+            except (sqlite3.Error, OSError) as e:
+                raise StorageError(str(e)) from e
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _run(self, work):
+        """Runs work(conn) in a transaction, turning driver errors into StorageError."""
+        conn = self.connect()
+        try:
+            with conn:
+                return work(conn)
+        except (sqlite3.DataError, sqlite3.IntegrityError, UnicodeError) as e:
+            raise StorageDataError(str(e)) from e
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def _fts_available(self, conn):
+        if self.has_fts is None:
+            self.has_fts = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'").fetchone() is not None
+        return self.has_fts
+
+    def initialize(self):
+        def work(conn):
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS messages (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    network TEXT NOT NULL DEFAULT '',
+                    channel TEXT NOT NULL DEFAULT '',
+                    username TEXT NOT NULL,
+                    message TEXT NOT NULL,
+                    text_hash BLOB,
+                    readability_score REAL,
+                    timestamp TEXT DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+
+            # Columns missing from older databases, their messages keep an empty network and channel
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(messages)")}
+            for column in ("network", "channel"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE messages ADD COLUMN {column} TEXT NOT NULL DEFAULT ''")
+            if "text_hash" not in columns:
+                conn.execute("ALTER TABLE messages ADD COLUMN text_hash BLOB")
+
+            # Distinct message texts, referenced by messages.text_hash when dedupe_texts is on
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS message_texts (
+                    text_hash BLOB NOT NULL PRIMARY KEY,
+                    message TEXT NOT NULL,
+                    uses INTEGER NOT NULL DEFAULT 0
+                ) WITHOUT ROWID
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_text_hash ON messages (text_hash)")
+
+            # Older databases kept one total per username, rebuild it per channel below
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(user_stats)")}
+            if columns and "network" not in columns:
+                conn.execute("DROP TABLE user_stats")
+
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS user_stats (
+                    network TEXT NOT NULL DEFAULT '',
+                    channel TEXT NOT NULL DEFAULT '',
+                    username TEXT NOT NULL,
+                    msg_count INTEGER NOT NULL DEFAULT 0,
+                    score_sum REAL NOT NULL DEFAULT 0,
+                    score_sq_sum REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (network, channel, username)
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_user_stats_username ON user_stats (username)")
+
+            # Per-user totals for each hour and day, kept up to date on insert so trends never scan messages
+            for period, table in ROLLUP_TABLES:
+                conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        network TEXT NOT NULL DEFAULT '',
+                        channel TEXT NOT NULL DEFAULT '',
+                        username TEXT NOT NULL,
+                        bucket TEXT NOT NULL,
+                        msg_count INTEGER NOT NULL DEFAULT 0,
+                        score_sum REAL NOT NULL DEFAULT 0,
+                        score_sq_sum REAL NOT NULL DEFAULT 0,
+                        PRIMARY KEY (network, channel, username, bucket)
+                    ) WITHOUT ROWID
+                ''')
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket)")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_username_bucket ON {table} (username, bucket)")
+                if conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone() is None:
+                    # Fill it from the existing history the first time it is created
+                    bucket = "'%Y-%m-%d %H:00:00'" if period == "hour" else "'%Y-%m-%d 00:00:00'"
+                    conn.execute(f'''
+                        INSERT INTO {table} (network, channel, username, bucket, msg_count, score_sum, score_sq_sum)
+                        SELECT network, channel, username, strftime({bucket}, timestamp) AS bucket,
+                               COUNT(readability_score), COALESCE(SUM(readability_score), 0),
+                               COALESCE(SUM(readability_score * readability_score), 0)
+                        FROM messages
+                        WHERE timestamp IS NOT NULL
+                        GROUP BY network, channel, username, bucket
+                    ''')
+
+            # Part-of-speech totals per user and channel, and the last message stylometry.py counted
+            conn.execute(f'''
+                CREATE TABLE IF NOT EXISTS user_pos (
+                    network TEXT NOT NULL DEFAULT '',
+                    channel TEXT NOT NULL DEFAULT '',
+                    username TEXT NOT NULL,
+                    tokens INTEGER NOT NULL DEFAULT 0,
+                    {', '.join(f"{column} INTEGER NOT NULL DEFAULT 0" for column in POS_COLUMNS)},
+                    PRIMARY KEY (network, channel, username)
+                ) WITHOUT ROWID
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_user_pos_username ON user_pos (username)")
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS stylometry_progress (
+                    job TEXT NOT NULL PRIMARY KEY,
+                    last_id INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_username_timestamp ON messages (username, timestamp)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_channel_id ON messages (network, channel, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_channel_username_timestamp "
+                         "ON messages (network, channel, username, timestamp)")
+
+            # Full-text index kept in sync with messages by triggers
+            new_index = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts'").fetchone() is None
+            try:
+                conn.execute('''
+                    CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts
+                    USING fts5(message, content='messages', content_rowid='id')
+                ''')
+                # An existing index is only usable if this build has FTS5
+                conn.execute("SELECT rowid FROM messages_fts LIMIT 0")
+            except sqlite3.OperationalError:
+                # This SQLite build has no FTS5, search falls back to LIKE. Triggers left by
+                # a build that had it would make every insert fail.
+                self.has_fts = False
+                for trigger in ("messages_fts_insert", "messages_fts_delete", "messages_fts_update"):
+                    conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            else:
+                self.has_fts = True
+                if new_index:
+                    # Index the messages stored before the index existed. rebuild reads the
+                    # message column, so deduplicated rows are indexed again with their text.
+                    conn.execute("INSERT INTO messages_fts (messages_fts) VALUES ('rebuild')")
+                    conn.execute('''
+                        INSERT INTO messages_fts (messages_fts, rowid, message)
+                        SELECT 'delete', id, message FROM messages WHERE message = ''
+                    ''')
+                    conn.execute('''
+                        INSERT INTO messages_fts (rowid, message)
+                        SELECT m.id, t.message FROM messages m JOIN message_texts t ON t.text_hash = m.text_hash
+                        WHERE m.message = ''
+                    ''')
+                # Triggers index the text from message_texts for deduplicated rows,
+                # recreated so databases from before message_texts get the new bodies
+                new_text = "COALESCE(NULLIF(new.message, ''), (SELECT message FROM message_texts WHERE text_hash = new.text_hash))"
+                old_text = "COALESCE(NULLIF(old.message, ''), (SELECT message FROM message_texts WHERE text_hash = old.text_hash))"
+                for trigger in ("messages_fts_insert", "messages_fts_delete", "messages_fts_update"):
+                    conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+                conn.execute(f'''
+                    CREATE TRIGGER messages_fts_insert AFTER INSERT ON messages BEGIN
+                        INSERT INTO messages_fts (rowid, message) VALUES (new.id, {new_text});
+                    END
+                ''')
+                conn.execute(f'''
+                    CREATE TRIGGER messages_fts_delete AFTER DELETE ON messages BEGIN
+                        INSERT INTO messages_fts (messages_fts, rowid, message) VALUES ('delete', old.id, {old_text});
+                    END
+                ''')
+                conn.execute(f'''
+                    CREATE TRIGGER messages_fts_update AFTER UPDATE OF message ON messages BEGIN
+                        INSERT INTO messages_fts (messages_fts, rowid, message) VALUES ('delete', old.id, {old_text});
+                        INSERT INTO messages_fts (rowid, message) VALUES (new.id, {new_text});
+                    END
+                ''')
+
+            if conn.execute("SELECT COUNT(*) FROM user_stats").fetchone()[0] == 0:
+                conn.execute('''
+                    INSERT INTO user_stats (network, channel, username, msg_count, score_sum, score_sq_sum)
+                    SELECT network, channel, username, COUNT(readability_score), COALESCE(SUM(readability_score), 0),
+                           COALESCE(SUM(readability_score * readability_score), 0)
+                    FROM messages
+                    GROUP BY network, channel, username
+                ''')
+            self._merge_colored_usernames(conn)
+        self._run(work)
+
+    def _merge_colored_usernames(self, conn):
+        """
+        Renames the usernames older versions of the plugin stored with HexChat's nick color
+        to the plain nick, adding their totals to the plain nick's. Nothing is left to do
+        once they are all merged.
+        """
+        renames = [(username, display_nick(username))
+                   for (username,) in conn.execute("SELECT DISTINCT username FROM user_stats")
+                   if display_nick(username) != username]
+        if not renames:
+            return
+        tables = ["messages"] + [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\'",
+            (ARCHIVE_PREFIX.replace("_", "\\_") + "%",))]
+        for old, new in renames:
+            for table in tables:
+                conn.execute(f"UPDATE {table} SET username = ? WHERE username = ?", (new, old))
+            for table, keys, sums in USER_TOTALS:
+                columns = ", ".join(keys + sums)
+                conn.execute(f"INSERT INTO {table} (username, {columns}) SELECT ?, {columns} FROM {table} "
+                             f"WHERE username = ? ON CONFLICT ({', '.join(keys)}, username) DO UPDATE SET "
+                             f"{', '.join(f'{column} = {column} + excluded.{column}' for column in sums)}", (new, old))
+                conn.execute(f"DELETE FROM {table} WHERE username = ?", (old,))
+
+    def insert_messages(self, rows):
+        def work(conn):
+            hashes = [None] * len(rows)
+            if self.dedupe_texts:
+                # Texts go first, the full-text trigger on messages reads them
+                texts, hashes = group_texts(rows)
+                conn.executemany('''
+                    INSERT INTO message_texts (text_hash, message, uses)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT (text_hash) DO UPDATE SET uses = uses + excluded.uses
+                ''', texts)
+            conn.executemany('''
+                INSERT INTO messages (network, channel, username, message, text_hash, readability_score, timestamp)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', [(network, channel, username, "" if key else message, key, score, format_timestamp(timestamp))
+                  for (username, message, score, timestamp, network, channel), key in zip(map(with_location, rows), hashes)])
+            conn.executemany('''
+                INSERT INTO user_stats (network, channel, username, msg_count, score_sum, score_sq_sum)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (network, channel, username) DO UPDATE SET
+                    msg_count = msg_count + excluded.msg_count,
+                    score_sum = score_sum + excluded.score_sum,
+                    score_sq_sum = score_sq_sum + excluded.score_sq_sum
+            ''', summarize_rows(rows))
+            for period, table in ROLLUP_TABLES:
+                conn.executemany(f'''
+                    INSERT INTO {table} (network, channel, username, bucket, msg_count, score_sum, score_sq_sum)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (network, channel, username, bucket) DO UPDATE SET
+                        msg_count = msg_count + excluded.msg_count,
+                        score_sum = score_sum + excluded.score_sum,
+                        score_sq_sum = score_sq_sum + excluded.score_sq_sum
+                ''', summarize_buckets(rows, period))
+        if rows:
+            self._run(work)
+
+    def user_averages(self, usernames=None, network=None, channel=None):
+        conditions, params = scope_conditions(network, channel, "?")
+        if usernames is not None:
+            conditions.append(f"username IN ({', '.join(['?'] * len(usernames))})")
+            params.extend(usernames)
+
+        def work(conn):
+            return conn.execute(f"SELECT username, SUM(score_sum) / SUM(msg_count), SUM(msg_count) FROM user_stats "
+                                f"WHERE {' AND '.join(['msg_count > 0'] + conditions)} GROUP BY username",
+                                params).fetchall()
+        if usernames is not None and not usernames:
+            return []
+        return self._run(work)
+
+    def search_messages(self, user=None, keyword="", last_id=None, limit=200, network=None, channel=None,
+                        after_id=None):
+        def work(conn):
+            conditions, params = scope_conditions(network, channel, "?")
+            if parse_keyword(keyword):
+                if self._fts_available(conn):
+                    # The unary + keeps SQLite walking the id-ordered indexes instead of sorting every match
+                    conditions.append("+m.id IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)")
+                    params.append(to_fts_query(keyword))
+                else:
+                    for pattern in like_patterns(keyword):
+                        conditions.append(f"{MESSAGE_TEXT} LIKE ?")
+                        params.append(pattern)
+            if user is not None:
+                conditions.append("m.username = ?")
+                params.append(user)
+            if last_id is not None:
+                conditions.append("m.id < ?")
+                params.append(last_id)
+            if after_id is not None:
+                conditions.append("m.id > ?")
+                params.append(after_id)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            order = "ASC" if after_id is not None else "DESC"
+            return conn.execute(f"SELECT m.id, m.username, {MESSAGE_TEXT}, m.readability_score, m.timestamp, m.network, "
+                                f"m.channel FROM messages m LEFT JOIN message_texts t ON t.text_hash = m.text_hash "
+                                f"{where} ORDER BY m.id {order} LIMIT ?", params + [limit]).fetchall()
+        return self._run(work)
+
+    def latest_id(self):
+        def work(conn):
+            return conn.execute("SELECT MAX(id) FROM messages").fetchone()[0] or 0
+        return self._run(work)
+
+    def messages_between(self, network, channel, start, end):
+        first, last = format_timestamp(start), format_timestamp(end)
+        months = [month for month in self.list_archives() if first[:4] + first[5:7] <= month <= last[:4] + last[5:7]]
+
+        def work(conn):
+            rows = [(username, message, parse_timestamp(timestamp)) for username, message, timestamp in conn.execute(
+                f"SELECT m.username, {MESSAGE_TEXT}, m.timestamp FROM messages m "
+                f"LEFT JOIN message_texts t ON t.text_hash = m.text_hash "
+                f"WHERE m.network = ? AND m.channel = ? AND m.timestamp BETWEEN ? AND ?", (network, channel, first, last))]
+            for month in months:
+                rows.extend((username, unpack_archive(message, compressed), parse_timestamp(timestamp))
+                            for username, message, compressed, timestamp in conn.execute(
+                                f"SELECT username, message, message_z, timestamp FROM {archive_table(month)} "
+                                f"WHERE network = ? AND channel = ? AND timestamp BETWEEN ? AND ?",
+                                (network, channel, first, last)))
+            return rows
+        return self._run(work)
+
+    # Bucket of each trend period, computed from the rollup table's bucket column
+    TREND_BUCKETS = {
+        "hour": "bucket",
+        "day": "bucket",
+        "week": "datetime(bucket, 'weekday 0', '-6 days')",
+        "month": "strftime('%Y-%m-01 00:00:00', bucket)",
+    }
+
+    def score_trend(self, start, end, period="day", usernames=None, network=None, channel=None, per_user=True):
+        if period not in TREND_PERIODS:
+            raise ValueError(f"Unknown trend period {period!r}, expected one of {TREND_PERIODS}")
+        table = "rollup_hourly" if period == "hour" else "rollup_daily"
+        conditions, params = scope_conditions(network, channel, "?")
+        conditions += ["bucket >= ?", "bucket < ?", "msg_count > 0"]
+        # From the start of the first week or month, so the first bucket isn't a partial one
+        params += [bucket_start(start, period), format_timestamp(end)]
+        if usernames is not None:
+            conditions.append(f"username IN ({', '.join(['?'] * len(usernames))})")
+            params.extend(usernames)
+        user = "username" if per_user else "NULL"
+        group = "period_start, username" if per_user else "period_start"
+
+        def work(conn):
+            rows = conn.execute(f"SELECT {self.TREND_BUCKETS[period]} AS period_start, {user}, SUM(msg_count), "
+                                f"SUM(score_sum), SUM(score_sq_sum) FROM {table} WHERE {' AND '.join(conditions)} "
+                                f"GROUP BY {group} ORDER BY {group}", params).fetchall()
+            return [trend_row(*row) for row in rows]
+        if usernames is not None and not usernames:
+            return []
+        return self._run(work)
+
+    def archive_messages(self, before, limit=1000, mode="keep", up_to_id=None):
+        if mode not in ARCHIVE_MODES:
+            raise ValueError(f"Unknown archive mode {mode!r}, expected one of {ARCHIVE_MODES}")
+        conditions = ["m.timestamp < ?"]
+        params = [format_timestamp(before)]
+        if up_to_id is not None:
+            conditions.append("m.id <= ?")
+            params.append(up_to_id)
+
+        def work(conn):
+            rows = conn.execute(f"SELECT m.id, m.network, m.channel, m.username, {MESSAGE_TEXT}, m.text_hash, "
+                                f"m.readability_score, m.timestamp FROM messages m "
+                                f"LEFT JOIN message_texts t ON t.text_hash = m.text_hash "
+                                f"WHERE {' AND '.join(conditions)} ORDER BY m.timestamp LIMIT ?",
+                                params + [limit]).fetchall()
+            months, archived = pack_archive(rows, mode, lambda timestamp: timestamp[:4] + timestamp[5:7])
+            for month, month_rows in months.items():
+                table = archive_table(month)
+                conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS {table} (
+                        id INTEGER PRIMARY KEY,
+                        network TEXT NOT NULL DEFAULT '',
+                        channel TEXT NOT NULL DEFAULT '',
+                        username TEXT NOT NULL,
+                        message TEXT,
+                        message_z BLOB,
+                        readability_score REAL,
+                        timestamp TEXT
+                    )
+                ''')
+                conn.executemany(f'''
+                    INSERT INTO {table} (id, network, channel, username, message, message_z, readability_score, timestamp)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', month_rows)
+            # Messages go first, the full-text trigger reads the text of deduplicated rows from message_texts
+            conn.executemany("DELETE FROM messages WHERE id = ?", [(row[0],) for row in rows])
+
+            uses, removed = released_texts(rows)
+            if uses:
+                conn.executemany("UPDATE message_texts SET uses = uses - ? WHERE text_hash = ?",
+                                 [(count, key) for key, (count, text) in uses.items()])
+                keys = list(uses)
+                unused = [row[0] for row in conn.execute(
+                    f"SELECT text_hash FROM message_texts WHERE uses <= 0 AND text_hash IN ({', '.join(['?'] * len(keys))})",
+                    keys)]
+                conn.executemany("DELETE FROM message_texts WHERE text_hash = ?", [(key,) for key in unused])
+                removed += sum(len(uses[key][1].encode('utf-8')) for key in unused)
+            return len(rows), removed, archived
+        return self._run(work)
+
+    def list_archives(self):
+        def work(conn):
+            rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE ? ESCAPE '\\'",
+                                (ARCHIVE_PREFIX.replace("_", "\\_") + "%",)).fetchall()
+            return sorted(row[0][len(ARCHIVE_PREFIX):] for row in rows)
+        return self._run(work)
+
+    def archived_messages(self, month, after_id=0, limit=1000):
+        table = archive_table(month)
+
+        def work(conn):
+            rows = conn.execute(f"SELECT id, username, message, message_z, readability_score, timestamp, network, "
+                                f"channel FROM {table} WHERE id > ? ORDER BY id LIMIT ?", (after_id, limit)).fetchall()
+            return [(message_id, username, unpack_archive(message, compressed), score, timestamp, network, channel)
+                    for message_id, username, message, compressed, score, timestamp, network, channel in rows]
+        return self._run(work)
+
+    def reclaim_space(self):
+        def size(conn):
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            return page_count * conn.execute("PRAGMA page_size").fetchone()[0]
+
+        conn = self.connect()
+        try:
+            before = size(conn)
+            # VACUUM can't run inside a transaction, so this doesn't go through _run
+            conn.execute("VACUUM")
+            return before - size(conn)
+        except sqlite3.Error as e:
+            raise StorageError(str(e)) from e
+
+    def list_users(self, network=None, channel=None):
+        conditions, params = scope_conditions(network, channel, "?")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        def work(conn):
+            return [row[0] for row in conn.execute(
+                f"SELECT DISTINCT username FROM user_stats {where} ORDER BY username", params)]
+        return self._run(work)
+
+    def list_channels(self):
+        def work(conn):
+            return conn.execute("SELECT DISTINCT network, channel FROM user_stats ORDER BY network, channel").fetchall()
+        return self._run(work)
+
+    def messages_after(self, last_id, limit=1000):
+        def work(conn):
+            return conn.execute(f"SELECT m.id, m.network, m.channel, m.username, {MESSAGE_TEXT} FROM messages m "
+                                f"LEFT JOIN message_texts t ON t.text_hash = m.text_hash "
+                                f"WHERE m.id > ? ORDER BY m.id LIMIT ?", (last_id, limit)).fetchall()
+        return self._run(work)
+
+    def pos_last_id(self):
+        def work(conn):
+            row = conn.execute("SELECT last_id FROM stylometry_progress WHERE job = ?", (POS_JOB,)).fetchone()
+            return row[0] if row else 0
+        return self._run(work)
+
+    def add_pos_counts(self, totals, last_id, previous_id):
+        def work(conn):
+            updated = conn.execute("UPDATE stylometry_progress SET last_id = ? WHERE job = ? AND last_id = ?",
+                                   (last_id, POS_JOB, previous_id)).rowcount
+            if updated == 0 and previous_id == 0:
+                updated = conn.execute("INSERT OR IGNORE INTO stylometry_progress (job, last_id) VALUES (?, ?)",
+                                       (POS_JOB, last_id)).rowcount
+            if updated == 0:
+                return False
+            conn.executemany(f'''
+                INSERT INTO user_pos (network, channel, username, tokens, {', '.join(POS_COLUMNS)})
+                VALUES ({', '.join(['?'] * (4 + len(POS_COLUMNS)))})
+                ON CONFLICT (network, channel, username) DO UPDATE SET tokens = tokens + excluded.tokens,
+                    {', '.join(f"{column} = {column} + excluded.{column}" for column in POS_COLUMNS)}
+            ''', [(network, channel, username, tokens) + tuple(counts)
+                  for network, channel, username, tokens, counts in totals])
+            return True
+        return self._run(work)
+
+    def pos_profiles(self, usernames=None, network=None, channel=None):
+        conditions, params = scope_conditions(network, channel, "?")
+        if usernames is not None:
+            conditions.append(f"username IN ({', '.join(['?'] * len(usernames))})")
+            params.extend(usernames)
+
+        def work(conn):
+            rows = conn.execute(f"SELECT username, SUM(tokens), {', '.join(f'SUM({column})' for column in POS_COLUMNS)} "
+                                f"FROM user_pos WHERE {' AND '.join(['tokens > 0'] + conditions)} GROUP BY username",
+                                params).fetchall()
+            return [(row[0], row[1], tuple(row[2:])) for row in rows]
+        if usernames is not None and not usernames:
+            return []
+        return self._run(work)
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+def month_starts(first, last, months_ahead=0):
+    """
+    Lists the first day of every month from one date's month to some months after another's.
+
+    :param first: Date in the first month
+    :param last: Date in the last month before the months ahead
+    :param months_ahead: Number of months added after last
+    :return: List of datetimes
+    """
+    month = datetime.datetime(first.year, first.month, 1)
+    end_index = last.year * 12 + last.month - 1 + months_ahead
+    months = []
+    while month.year * 12 + month.month - 1 <= end_index:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+def next_month(month):
+    """Returns the first day of the month after a month's first day."""
+    return datetime.datetime(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+def month_partitions(months):
+    """Builds MariaDB RANGE partition definitions holding one month each."""
+    return ", ".join(f"PARTITION p{month:%Y%m} VALUES LESS THAN (UNIX_TIMESTAMP('{next_month(month):%Y-%m-%d}'))"
+                     for month in months)
+
+def format_timestamp(timestamp):
+    """Formats epoch seconds the way SQLite's CURRENT_TIMESTAMP does."""
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+def parse_timestamp(value):
+    """Converts a local timestamp read back from either backend, a datetime or SQLite's text, to epoch seconds."""
+    if isinstance(value, str):
+        value = datetime.datetime.strptime(value[:19], "%Y-%m-%d %H:%M:%S")
+    return value.timestamp()
+
+def open_storage(config, db_config=None):
+    """
+    Creates the storage backend selected by a config dictionary.
+
+    :param config: Dictionary with 'backend' ('mariadb' or 'sqlite') and optionally 'sqlite_path',
+                   'pool_size', 'partition_by', 'partitions' and 'dedupe_texts'
+    :param db_config: MariaDB connection settings, needed for the mariadb backend
+    :return: A Storage instance
+    """
+    backend = config.get('backend', BACKEND_MARIADB)
+    if backend == BACKEND_SQLITE:
+        return SQLiteStorage(config.get('sqlite_path'), dedupe_texts=config.get('dedupe_texts', False))
+    if backend == BACKEND_MARIADB:
+        return MariaDBStorage(db_config, pool_size=config.get('pool_size', 2),
+                              partition_by=config.get('partition_by'), partitions=config.get('partitions', 16),
+                              dedupe_texts=config.get('dedupe_texts', False))
+    raise ValueError(f"Unknown storage backend {backend!r}, expected 'mariadb' or 'sqlite'")
@@ -0,0 +1,152 @@
+import math
+from collections import deque
+
+class P2Quantile:
+    """
+    Streaming quantile estimate in constant memory (the P-squared algorithm of Jain and Chlamtac).
+    Keeps five markers instead of the observations, exact for the first five values.
+    """
+
+    __slots__ = ('p', 'heights', 'positions', 'desired', 'increments', 'count')
+
+    def __init__(self, p):
+        """
+        :param p: The quantile to track, between 0 and 1 (0.5 for the median)
+        """
+        self.p = p
+        self.heights = []
+        self.positions = [0, 1, 2, 3, 4]
+        self.desired = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.increments = [0, p / 2, p, (1 + p) / 2, 1]
+        self.count = 0
+
+    def add(self, x):
+        """Adds an observation."""
+        self.count += 1
+        heights = self.heights
+        if self.count <= 5:
+            heights.append(x)
+            heights.sort()
+            return
+
+        # Find the cell x falls in, widening the outer markers if needed
+        if x < heights[0]:
+            heights[0] = x
+            k = 0
+        elif x >= heights[4]:
+            heights[4] = x
+            k = 3
+        else:
+            k = 0
+            while x >= heights[k + 1]:
+                k += 1
+
+        positions = self.positions
+        for i in range(k + 1, 5):
+            positions[i] += 1
+        for i in range(5):
+            self.desired[i] += self.increments[i]
+
+        # Move the middle markers towards their desired positions
+        for i in range(1, 4):
+            d = self.desired[i] - positions[i]
+            if (d >= 1 and positions[i + 1] - positions[i] > 1) or (d <= -1 and positions[i - 1] - positions[i] < -1):
+                d = 1 if d > 0 else -1
+                height = self._parabolic(i, d)
+                if not heights[i - 1] < height < heights[i + 1]:
+                    height = heights[i] + d * (heights[i + d] - heights[i]) / (positions[i + d] - positions[i])
+                heights[i] = height
+                positions[i] += d
+
+    def _parabolic(self, i, d):
+        q, n = self.heights, self.positions
+        return q[i] + d / (n[i + 1] - n[i - 1]) * (
+            (n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+            (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+
+    @property
+    def value(self):
+        """Current estimate, 0 before any observation."""
+        if self.count == 0:
+            return 0.0
+        if self.count <= 5:
+            # Exact quantile of the few values seen so far
+            index = min(len(self.heights) - 1, max(0, int(math.ceil(self.p * len(self.heights))) - 1))
+            return self.heights[index]
+        return self.heights[2]
+
+class RunningStats:
+    """
+    Constant-memory accumulator for one user's readability scores.
+
+    Count, mean and variance are updated with Welford's method. Median and p90 come
+    from P-squared sketches. An exponentially decayed average and a sliding-window
+    average are kept when enabled.
+    """
+
+    __slots__ = ('count', 'mean', 'm2', 'minimum', 'maximum', 'median_sketch', 'p90_sketch',
+                 'ewma_alpha', 'ewma', 'window', 'window_sum')
+
+    def __init__(self, ewma_alpha=None, window_size=0):
+        """
+        :param ewma_alpha: Weight of the newest score in the decayed average, None to disable it
+        :param window_size: Number of recent scores in the sliding-window average, 0 to disable it
+        """
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self.median_sketch = P2Quantile(0.5)
+        self.p90_sketch = P2Quantile(0.9)
+        self.ewma_alpha = ewma_alpha
+        self.ewma = None
+        self.window = deque(maxlen=window_size) if window_size else None
+        self.window_sum = 0.0
+
+    def add(self, score):
+        """Adds a score."""
+        self.count += 1
+        delta = score - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (score - self.mean)
+        if score < self.minimum:
+            self.minimum = score
+        if score > self.maximum:
+            self.maximum = score
+        self.median_sketch.add(score)
+        self.p90_sketch.add(score)
+
+        if self.ewma_alpha is not None:
+            self.ewma = score if self.ewma is None else self.ewma + self.ewma_alpha * (score - self.ewma)
+
+        window = self.window
+        if window is not None:
+            if len(window) == window.maxlen:
+                self.window_sum -= window[0]
+            window.append(score)
+            self.window_sum += score
+
+    @property
+    def variance(self):
+        """Sample variance, 0 with fewer than two scores."""
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+    @property
+    def median(self):
+        return self.median_sketch.value
+
+    @property
+    def p90(self):
+        return self.p90_sketch.value
+
+    @property
+    def window_mean(self):
+        """Average of the scores in the sliding window, None if the window is disabled or empty."""
+        if not self.window:
+            return None
+        return self.window_sum / len(self.window)
@@ -0,0 +1,238 @@
+import argparse
+import sys
+import threading
+import time
+
+from storage import POS_TAGS, StorageError, open_storage
+
+MODEL = "en_core_web_sm"
+
+# Token.pos_ comes from the tagger plus the attribute ruler mapping its tags, the rest of the pipeline is skipped
+PIPELINE_EXCLUDE = ["parser", "ner", "lemmatizer", "senter"]
+
+# Tags shown as a share of each user's words, with their LocalMain.py category names
+SHOWN_TAGS = [("NOUN", "Nouns"), ("VERB", "Verbs"), ("ADJ", "Adjectives"), ("PRON", "Pronouns")]
+
+# Tags that are not words, left out of the shares
+NON_WORD_TAGS = ("PUNCT", "SYM", "X")
+
+# Storage configuration for catching up from the command line, same settings as the plugin
+STORAGE_CONFIG = {
+    'backend': 'mariadb',       # 'mariadb' or 'sqlite'
+    'sqlite_path': None         # SQLite database file, the one in HexChat's config folder by default
+}
+
+# Database configuration
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'UserNameHere',     # Replace with your MariaDB username
+    'password': 'PassWordHere', # Replace with your MariaDB password
+    'database': 'readability_analyzer' # Replace with your database name
+}
+
+_nlp = None
+_nlp_lock = threading.Lock()
+_tag_index = {tag: index for index, tag in enumerate(POS_TAGS)}
+
+def get_nlp():
+    """Returns the shared spaCy pipeline with only what tagging needs, loading it on first use."""
+    global _nlp
+    with _nlp_lock:
+        if _nlp is None:
+            import spacy
+            _nlp = spacy.load(MODEL, exclude=PIPELINE_EXCLUDE)
+        return _nlp
+
+def count_pos(nlp, rows, batch_size=256):
+    """
+    Tags a batch of messages and totals the part-of-speech counts per user and channel.
+
+    :param nlp: spaCy pipeline, see get_nlp()
+    :param rows: List of (id, network, channel, username, message) tuples
+    :param batch_size: Messages spaCy tags at a time
+    :return: List of (network, channel, username, tokens, counts) tuples, counts following POS_TAGS
+    """
+    totals = {}
+    docs = nlp.pipe(((message, (network, channel, username)) for message_id, network, channel, username, message in rows),
+                    as_tuples=True, batch_size=batch_size)
+    for doc, key in docs:
+        total = totals.get(key)
+        if total is None:
+            total = totals[key] = [0] * (len(POS_TAGS) + 1)
+        for token in doc:
+            index = _tag_index.get(token.pos_)
+            if index is not None:
+                total[index + 1] += 1
+                total[0] += 1
+    return [key + (total[0], tuple(total[1:])) for key, total in totals.items()]
+
+def pos_shares(counts):
+    """
+    Turns part-of-speech counts into shares of the words.
+
+    :param counts: Counts following POS_TAGS
+    :return: Dictionary of tag to share between 0 and 1, empty if there are no words
+    """
+    words = sum(count for tag, count in zip(POS_TAGS, counts) if tag not in NON_WORD_TAGS)
+    if not words:
+        return {}
+    return {tag: count / words for tag, count in zip(POS_TAGS, counts) if tag not in NON_WORD_TAGS}
+
+class StylometryJob:
+    """
+    Background thread tagging new messages with spaCy and adding them to the
+    per-user part-of-speech totals in user_pos.
+
+    Every interval it reads the messages logged since the last run in batches,
+    so the message hook never waits on spaCy and the model is only loaded once
+    there is something to tag. Progress is stored with the counts, so a message
+    is counted exactly once even across restarts. max_per_run keeps a large
+    backlog from occupying the plugin for long; stylometry.py catches up from
+    the command line.
+    """
+
+    def __init__(self, storage, interval_ms=60000, batch_size=500, max_per_run=20000, pause_between_batches=True,
+                 on_error=None, load_model=get_nlp, name="readability-stylometry"):
+        """
+        :param storage: Storage backend the messages are read from and the counts written to
+        :param interval_ms: Time in milliseconds between two runs
+        :param batch_size: Messages read, tagged and written at a time
+        :param max_per_run: Most messages tagged in one run, None for no limit
+        :param pause_between_batches: Sleep as long as a batch took before the next one, leaving the
+                                      interpreter to HexChat's thread half of the time
+        :param on_error: Callable invoked with a message when a run fails
+        :param load_model: Callable returning the spaCy pipeline
+        :param name: Name of the job thread
+        """
+        self.storage = storage
+        self.interval = max(0.001, interval_ms / 1000.0)
+        self.batch_size = max(1, int(batch_size))
+        self.max_per_run = max_per_run
+        self.pause_between_batches = pause_between_batches
+        self.on_error = on_error
+        self.load_model = load_model
+        self.name = name
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._nlp = None
+
+        # Counters, read by the plugin for its status output
+        self.runs = 0
+        self.messages_tagged = 0
+        self.tokens_tagged = 0
+        self.errors = 0
+        self.batches_skipped = 0
+        self.last_id = None
+        self.disabled = None
+
+    def start(self):
+        """Start the job thread."""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5.0):
+        """
+        Stop the job thread, letting it finish the batch it is tagging.
+
+        :param timeout: Maximum number of seconds to wait for the thread
+        """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.run_once()
+            except Exception as e:
+                # Whatever fails is counted and reported, and the next run tries again
+                self.errors += 1
+                error = str(e) if isinstance(e, StorageError) else f"{type(e).__name__}: {e}"
+                self._report(f"Error updating part-of-speech counts: {error}")
+            if self.disabled:
+                return
+
+    def run_once(self):
+        """
+        Tags the messages logged since the last run.
+
+        :return: Number of messages tagged
+        """
+        # Read every run, in case stylometry.py caught up from the command line meanwhile
+        self.last_id = self.storage.pos_last_id()
+        tagged = 0
+        while not self._stop.is_set() and (self.max_per_run is None or tagged < self.max_per_run):
+            rows = self.storage.messages_after(self.last_id, self.batch_size)
+            if not rows:
+                break
+            if self._nlp is None:
+                try:
+                    self._nlp = self.load_model()
+                except (ImportError, OSError) as e:
+                    self.disabled = f"spaCy model {MODEL} could not be loaded: {e}"
+                    self._report(f"Part-of-speech counts are off, {self.disabled}")
+                    break
+            start = time.perf_counter()
+            totals = count_pos(self._nlp, rows)
+            if not self.storage.add_pos_counts(totals, rows[-1][0], self.last_id):
+                # Another process counted these messages meanwhile, carry on from where it got
+                self.batches_skipped += 1
+                self.last_id = self.storage.pos_last_id()
+                continue
+            self.last_id = rows[-1][0]
+            tagged += len(rows)
+            self.messages_tagged += len(rows)
+            self.tokens_tagged += sum(total[3] for total in totals)
+            if len(rows) < self.batch_size:
+                break
+            if self.pause_between_batches:
+                self._stop.wait(min(time.perf_counter() - start, 1.0))
+        self.runs += 1
+        return tagged
+
+    def _report(self, text):
+        if self.on_error is not None:
+            self.on_error(text)
+
+    def stats(self):
+        """Return a snapshot of the job counters as a dictionary."""
+        return {
+            'runs': self.runs,
+            'messages_tagged': self.messages_tagged,
+            'tokens_tagged': self.tokens_tagged,
+            'errors': self.errors,
+            'batches_skipped': self.batches_skipped,
+            'last_id': self.last_id,
+            'loaded': self._nlp is not None,
+            'disabled': self.disabled,
+        }
+
+def main():
+    parser = argparse.ArgumentParser(description="Tag every message not counted yet and update the "
+                                                 "per-user part-of-speech totals.")
+    parser.add_argument("--batch-size", type=int, default=2000, help="Messages tagged at a time")
+    args = parser.parse_args()
+
+    storage = open_storage(STORAGE_CONFIG, DB_CONFIG)
+    try:
+        storage.initialize()
+        start = time.perf_counter()
+        job = StylometryJob(storage, batch_size=args.batch_size, max_per_run=None, pause_between_batches=False,
+                            on_error=print)
+        tagged = job.run_once()
+    except StorageError as e:
+        print(f"Error updating part-of-speech counts: {e}")
+        sys.exit(1)
+    finally:
+        storage.close()
+    elapsed = time.perf_counter() - start
+    print(f"Tagged {tagged} messages in {elapsed:.1f}s ({tagged / elapsed if elapsed else 0:.0f} messages/s)")
+
+if __name__ == "__main__":
+    main()